@@ -0,0 +1,118 @@
+import codecs
+import json
+import fastjson
+
+CHUNK_SIZE = 64 * 1024
+_decoder = json.JSONDecoder()
+
+class BatchFormatError(ValueError):
+    pass
+
+def _iter_lines(stream, chunk_size, max_line=None):
+    """逐行产生请求体内容（不含换行符），超过max_line字节的行产生None，只在换行处拼接已读到的各段"""
+    parts = []
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            if size:
+                yield None if max_line and size > max_line else b''.join(parts)
+            return
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start)
+            piece = chunk[start:] if end < 0 else chunk[start:end]
+            size += len(piece)
+            # 超长的行不再保存内容，只等到行尾报告错误
+            if not max_line or size <= max_line:
+                parts.append(piece)
+            if end < 0:
+                break
+            yield None if max_line and size > max_line else b''.join(parts)
+            parts = []
+            size = 0
+            start = end + 1
+
+def iter_ndjson(stream, chunk_size=CHUNK_SIZE, max_item_size=None):
+    """逐行解析NDJSON请求体，不把整个请求体读入内存；无法解析或超过max_item_size字节的行产生BatchFormatError对象"""
+    for line in _iter_lines(stream, chunk_size, max_item_size):
+        if line is None:
+            yield BatchFormatError('NDJSON行过大')
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield fastjson.loads(line)
+        except ValueError as e:
+            yield BatchFormatError(str(e))
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE, max_item_size=None):
+    """增量解析JSON数组请求体，逐个产生数组元素；格式错误或单个元素超过max_item_size个字符时抛出BatchFormatError"""
+    buffer = ''
+    eof = False
+    pos = 0
+    # 增量解码，避免多字节字符被分块截断
+    decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def fill(size=chunk_size):
+        nonlocal buffer, pos, eof
+        chunk = stream.read(size)
+        if not chunk:
+            eof = True
+            return
+        buffer = buffer[pos:] + decoder.decode(chunk)
+        pos = 0
+
+    def skip_space():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_space()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise BatchFormatError('请求体必须是JSON数组')
+    pos += 1
+    expect_item = True
+    after_comma = False
+    while True:
+        skip_space()
+        if pos >= len(buffer):
+            raise BatchFormatError('JSON数组不完整')
+        char = buffer[pos]
+        if char == ']':
+            if after_comma:
+                raise BatchFormatError(f'位置{pos}处的逗号后缺少元素')
+            return
+        if not expect_item:
+            if char != ',':
+                raise BatchFormatError(f'位置{pos}处缺少逗号')
+            pos += 1
+            expect_item = True
+            after_comma = True
+            continue
+        # 元素不完整时读入更多数据后从元素开头重新解析，每次读取量翻倍，总解析量与元素大小成正比
+        size = chunk_size
+        while True:
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise BatchFormatError('JSON数组元素格式错误')
+                end = None
+            # 元素恰好在缓冲区末尾结束（如数字），需要更多数据确认它已完整
+            if end is None or (end == len(buffer) and not eof):
+                if max_item_size and len(buffer) - pos > max_item_size:
+                    raise BatchFormatError('JSON数组元素过大')
+                fill(size)
+                size *= 2
+                continue
+            break
+        pos = end
+        expect_item = False
+        after_comma = False
+        yield item
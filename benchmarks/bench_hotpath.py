@@ -0,0 +1,182 @@
+"""请求热路径微基准：每条消息的JSON处理和完整请求的CPU时间，消息大小1 KB / 100 KB / 1 MB
+
+passes: 对比旧版各环节各自编码/解析消息（日志、格式化器、存储、搜索、推送、发件箱、界面）
+        与MessageRecord只解析一次、共享已编码形式的CPU时间，分别用标准库json和orjson
+app:    每个大小在独立子进程中通过Flask测试客户端发送请求（异步模式、发件箱、搜索、可读日志开启），
+        报告每个请求消耗的进程CPU时间（含后台写入线程），可在不同提交上运行对比
+
+用法: python benchmarks/bench_hotpath.py [--mode passes,app] [--sizes 1000,100000,1000000]
+      [-n 请求数] [--backend json,orjson] [-o 结果文件]
+"""
+import argparse
+import configparser
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+API_KEY = 'bench-api-key'
+
+def make_body(size):
+    """约size字节的请求体：消息为包含中英文文本和嵌套字段的JSON对象"""
+    filler = ('消息内容 message body 0123456789 ' * (size // 40 + 1))
+    message = {'title': 'bench', 'level': 'warn', 'tags': ['a', 'b'], 'text': ''}
+    overhead = len(json.dumps({'message': message}, ensure_ascii=False).encode('utf-8'))
+    text = filler
+    while len(text.encode('utf-8')) > max(0, size - overhead):
+        text = text[:len(text) * 9 // 10]
+    message['text'] = text
+    return json.dumps({'message': message}, ensure_ascii=False).encode('utf-8')
+
+def legacy_passes(body):
+    """旧版每条消息的JSON处理：各环节分别编码或尝试解析"""
+    data = json.loads(body)  # 请求体
+    message = data['message']
+    log_line = f'收到消息: {json.dumps(message, ensure_ascii=False)}'  # 可读日志
+    try:
+        json.loads(log_line)  # 日志格式化器尝试解析
+    except ValueError:
+        pass
+    record = {'id': 'x' * 32, 'ts': time.time(), 'text_from': 'bench', 'payload': message}
+    json.dumps(record, ensure_ascii=False)  # 消息存储
+    json.dumps(message, ensure_ascii=False)  # 搜索索引：检索文本
+    json.dumps(message, ensure_ascii=False)  # 搜索索引：原始JSON
+    json.dumps(dict(record, message=message), ensure_ascii=False)  # 实时推送事件
+    json.dumps(message, ensure_ascii=False)  # 发件箱
+    json.dumps(message, ensure_ascii=False, indent=2)  # 界面显示
+
+def record_passes(body):
+    """当前实现：请求体解析一次，各环节共享MessageRecord缓存的编码结果"""
+    import fastjson
+    from message import MessageRecord
+    from stream import encode_event
+    data = fastjson.loads(body)
+    record = MessageRecord(data['message'], 'bench')
+    f'收到消息: {record.payload_json}'  # 可读日志
+    record.line()  # 消息存储（搜索索引直接复用payload_json）
+    encode_event(record, record.display)  # 实时推送事件
+    record.display_json  # 发件箱
+    record.text  # 界面显示
+
+def cpu_per_call(func, body, n):
+    func(body)
+    start = time.process_time()
+    for _ in range(n):
+        func(body)
+    return (time.process_time() - start) / n
+
+def run_passes(sizes, n, backends):
+    import fastjson
+    results = []
+    for size in sizes:
+        body = make_body(size)
+        count = max(5, n * 1000 // max(size, 1000))
+        row = {'mode': 'passes', 'size': len(body),
+               'legacy_us': round(cpu_per_call(legacy_passes, body, count) * 1e6, 1)}
+        for name in backends:
+            fastjson.set_backend(name)
+            row[f'record_{fastjson.backend()}_us'] = round(cpu_per_call(record_passes, body, count) * 1e6, 1)
+        fastjson.set_backend('auto')
+        results.append(row)
+        print('  '.join(f'{k}={v}' for k, v in row.items()))
+    return results
+
+def write_config(workdir, backend):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(ROOT, 'config.ini'), encoding='utf-8')
+    config['security']['api_key'] = API_KEY
+    config['logging']['dir'] = os.path.join(workdir, 'logs')
+    config['server']['json_backend'] = backend
+    config['ratelimit']['enabled'] = 'false'
+    config['dedup']['enabled'] = 'false'
+    config['stream']['enabled'] = 'false'
+    config['retention']['enabled'] = 'false'
+    config['delivery']['mode'] = 'async'
+    config['outbox']['path'] = os.path.join(workdir, 'logs', 'outbox.db')
+    config['search']['path'] = os.path.join(workdir, 'logs', 'search.db')
+    with open(os.path.join(workdir, 'config.ini'), 'w', encoding='utf-8') as f:
+        config.write(f)
+
+def app_worker(size, n, backend):
+    """子进程：通过测试客户端发送n个请求，输出每个请求的CPU和墙钟时间"""
+    workdir = tempfile.mkdtemp(prefix='bench-hotpath-')
+    write_config(workdir, backend)
+    os.chdir(workdir)
+    from server import create_app, close_app
+    app = create_app(None)
+    client = app.test_client()
+    body = make_body(size)
+    url = f'/webhook?api_key={API_KEY}'
+    for _ in range(3):
+        client.post(url, data=body, content_type='application/json')
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(n):
+        response = client.post(url, data=body, content_type='application/json')
+        assert response.status_code == 202, response.status_code
+    wall = time.perf_counter() - wall_start
+    # 等待后台线程（搜索索引、发件箱、日志）处理完，把它们的CPU也计入
+    close_app(app)
+    time.sleep(0.5)
+    cpu = time.process_time() - cpu_start
+    try:
+        import fastjson
+        used = fastjson.backend()
+    except ImportError:
+        used = 'json'
+    print(json.dumps({'mode': 'app', 'size': len(body), 'backend': used, 'requests': n,
+                      'cpu_ms': round(cpu / n * 1e3, 3), 'wall_ms': round(wall / n * 1e3, 3)}))
+
+def run_app(sizes, n, backends):
+    results = []
+    for size in sizes:
+        for backend in backends:
+            count = max(30, n * 1000 // max(size, 1000))
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(size),
+                                  '-n', str(count), '--backend', backend],
+                                 capture_output=True, text=True, check=True).stdout
+            row = json.loads(out.strip().splitlines()[-1])
+            results.append(row)
+            print('  '.join(f'{k}={v}' for k, v in row.items()))
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', default='passes,app', help='passes和/或app，逗号分隔')
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='请求体大小（字节），逗号分隔')
+    parser.add_argument('-n', type=int, default=200, help='1 KB消息的请求数，更大的消息按比例减少')
+    parser.add_argument('--backend', default='json,orjson', help='JSON后端，逗号分隔')
+    parser.add_argument('-o', '--output', help='结果JSON文件')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        app_worker(args.worker, args.n, args.backend)
+        return
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    backends = args.backend.split(',')
+    results = []
+    modes = args.mode.split(',')
+    if 'passes' in modes:
+        results += run_passes(sizes, args.n, backends)
+    if 'app' in modes:
+        results += run_app(sizes, args.n, backends)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'commit': git_commit(), 'results': results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
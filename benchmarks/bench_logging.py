@@ -0,0 +1,54 @@
+"""日志写入微基准：对比请求线程中直接写文件与QueueHandler后台写入的调用耗时
+
+用法: python benchmarks/bench_logging.py [-n 条数]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logger import DailyRotatingFileHandler, CustomFormatter, setup_logger
+
+class FlushingHandler(DailyRotatingFileHandler):
+    """旧版行为：每条日志在调用线程中格式化、写入并flush"""
+
+    def emit(self, record):
+        super().emit(record)
+        self.flush()
+
+def bench(name, logger, n, message):
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        logger.info(message)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    print(f'{name:<8} p50 {p50:8.1f} us  p99 {p99:8.1f} us')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=20000, help='日志条数')
+    args = parser.parse_args()
+    message = f'收到消息: {json.dumps({"text": "x" * 200, "level": "warn"}, ensure_ascii=False)}'
+
+    tmp = tempfile.mkdtemp()
+    direct = logging.getLogger('bench-direct')
+    direct.propagate = False
+    handler = FlushingHandler(os.path.join(tmp, 'direct-{}.log'), encoding='gb2312')
+    handler.setFormatter(CustomFormatter())
+    direct.addHandler(handler)
+    direct.setLevel(logging.INFO)
+    bench('direct', direct, args.n, message)
+
+    os.chdir(tmp)
+    queued = setup_logger()
+    bench('queued', queued, args.n, message)
+
+if __name__ == '__main__':
+    main()
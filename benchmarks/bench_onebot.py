@@ -0,0 +1,48 @@
+"""OneBot转发微基准：对比每次新建连接与连接池复用
+
+用法: python benchmarks/bench_onebot.py [-n 请求数]
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from onebot import OneBotClient
+from stubs import StubOneBotServer
+
+def bench(name, func, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<12} {n / elapsed:8.0f} req/s  {elapsed / n * 1000:.3f} ms/req')
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=1000, help='每种方式的请求数')
+    args = parser.parse_args()
+
+    server = StubOneBotServer().start()
+    url = server.url
+
+    def per_request():
+        requests.post(f'{url}/send_private_msg',
+                      headers={'Authorization': 'Bearer token', 'Content-Type': 'application/json'},
+                      json={'user_id': 10000, 'message': 'benchmark'},
+                      timeout=10).json()
+
+    client = OneBotClient(url, 'token', '10000')
+
+    old = bench('new conn', per_request, args.n)
+    new = bench('pooled', lambda: client.send_private_msg('benchmark'), args.n)
+    print(f'speedup      {old / new:.2f}x')
+
+    client.close()
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
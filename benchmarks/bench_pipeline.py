@@ -0,0 +1,387 @@
+"""端到端基准：驱动server.create_app，测量吞吐、延迟分位数、内存增长和每条消息的日志字节数
+
+OneBot和SMTP使用本地替身（可注入延迟和失败）。配置、日志和消息存储都是进程级单例，
+所以每个场景在独立的子进程和临时目录中运行。结果写为JSON，便于在不同提交之间比较。
+
+用法: python benchmarks/bench_pipeline.py [-n 请求数] [-c 并发数] [--sizes 100,10000]
+      [--transport test-client,socket] [--gui] [--mode async|sync]
+      [--onebot-latency 秒] [--onebot-fail 比例] [--smtp-latency 秒] [--smtp-fail 比例]
+      [-o 结果文件]
+
+--gui时额外以WebhookGUI运行各场景；没有DISPLAY时尝试启动Xvfb虚拟显示，不可用则跳过并在结果中注明。
+"""
+import argparse
+import configparser
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+API_KEY = 'bench-api-key'
+WARMUP = 20
+
+def rss_kb():
+    """当前进程的常驻内存（KB）"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS返回字节，Linux返回KB
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+def dir_bytes(path, predicate=lambda name: True):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            if predicate(name):
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+    return total
+
+def checkpoint(path):
+    """把WAL中的内容写回数据库文件并截断WAL，使数据库大小反映实际存储占用"""
+    if not os.path.exists(path):
+        return
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+def log_usage(log_dir):
+    """按类别统计日志目录占用：可读日志、消息存储、发件箱、搜索索引
+
+    统计前对两个数据库执行checkpoint，否则增长的主要是尚未写回的WAL文件而不是存储本身；
+    checkpoint后仍剩余的WAL/共享内存文件单独记为wal，不计入合计。
+    """
+    databases = ('outbox.db', 'search.db')
+    for name in databases:
+        checkpoint(os.path.join(log_dir, name))
+    return {
+        'human_log': dir_bytes(log_dir, lambda n: n.endswith('.log')),
+        'store': dir_bytes(os.path.join(log_dir, 'messages')),
+        'outbox': dir_bytes(log_dir, lambda n: n == 'outbox.db'),
+        'search': dir_bytes(log_dir, lambda n: n == 'search.db'),
+        'wal': dir_bytes(log_dir, lambda n: n.startswith(databases) and n.endswith(('-wal', '-shm')))
+    }
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def make_payload(size):
+    text = ('基准测试消息 benchmark message ' * (size // 20 + 1))[:size]
+    return json.dumps({'message': text}, ensure_ascii=False).encode('utf-8')
+
+def write_config(workdir, scenario, onebot_url, smtp_port):
+    """以仓库的config.ini为基础，改为指向替身服务和临时目录"""
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.optionxform = str
+    parser.read(os.path.join(ROOT, 'config.ini'), encoding='utf-8')
+    log_dir = os.path.join(workdir, 'logs')
+    overrides = {
+        'server': {'host': '127.0.0.1', 'port': '0', 'threads': str(max(8, scenario['concurrency']))},
+        'security': {'api_key': API_KEY},
+        'logging': {'dir': log_dir},
+        'onebot': {'enabled': 'true', 'url': onebot_url, 'access_token': 'bench', 'target_qq': '10000'},
+        'email': {'enabled': 'true', 'host': '127.0.0.1', 'port': str(smtp_port), 'username': 'bench',
+                  'password': 'bench', 'from': 'bench@localhost', 'to': 'bench@localhost',
+                  'starttls': 'false'},
+        'delivery': {'mode': scenario['mode']},
+        # 测量处理管线本身，不让限流截断负载
+        'ratelimit': {'enabled': 'false'},
+        'outbox': {'path': os.path.join(log_dir, 'outbox.db')}
+    }
+    for section, values in overrides.items():
+        if not parser.has_section(section):
+            parser.add_section(section)
+        for key, value in values.items():
+            parser.set(section, key, value)
+    with open(os.path.join(workdir, 'config.ini'), 'w', encoding='utf-8') as f:
+        parser.write(f)
+    return log_dir
+
+def wait_drained(app, timeout):
+    """等待投递队列和发件箱中的消息处理完，返回是否在超时前完成"""
+    delivery = app.delivery
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        busy = sum(delivery.depth().values())
+        if not busy and delivery.outbox is not None:
+            stats = delivery.outbox.stats()
+            busy = sum(stats.get(k, 0) for k in ('pending', 'queued', 'retry'))
+        if not busy:
+            return True
+        time.sleep(0.05)
+    return False
+
+def run_scenario(scenario):
+    """子进程中运行一个场景，返回结果字典"""
+    from stubs import StubOneBotServer, StubSMTPServer
+
+    onebot_stub = StubOneBotServer(scenario['onebot_latency'], scenario['onebot_fail']).start()
+    smtp_stub = StubSMTPServer(scenario['smtp_latency'], scenario['smtp_fail']).start()
+    workdir = tempfile.mkdtemp(prefix='webhook-bench-')
+    log_dir = write_config(workdir, scenario, onebot_stub.url, smtp_stub.port)
+    # config.ini按相对路径读取
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+
+    import logger as logger_module
+    from server import create_app, close_app
+    from serving import create_server
+
+    logger = logger_module.setup_logger()
+    gui = None
+    if scenario['gui']:
+        from gui import WebhookGUI
+        gui = WebhookGUI(logger)
+    app = create_app(gui)
+
+    server = None
+    if scenario['transport'] == 'socket':
+        import socket
+        import requests
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(1024)
+        sock.setblocking(False)
+        url = f'http://127.0.0.1:{sock.getsockname()[1]}/webhook?api_key={API_KEY}'
+        server = create_server(app, sock)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def make_sender():
+            session = requests.Session()
+            headers = {'Content-Type': 'application/json'}
+            return lambda body: session.post(url, data=body, headers=headers, timeout=30).status_code
+    else:
+        path = f'/webhook?api_key={API_KEY}'
+
+        def make_sender():
+            client = app.test_client()
+            return lambda body: client.post(path, data=body, content_type='application/json').status_code
+
+    payload = make_payload(scenario['size'])
+    result = {'scenario': scenario}
+
+    def load():
+        send = make_sender()
+        for _ in range(WARMUP):
+            send(payload)
+        wait_drained(app, scenario['drain_timeout'])
+        rss_start = rss_kb()
+        usage_start = log_usage(log_dir)
+
+        counter = itertools.count()
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+
+        def client():
+            send = make_sender()
+            local = []
+            local_statuses = {}
+            while next(counter) < scenario['requests']:
+                start = time.perf_counter()
+                try:
+                    code = send(payload)
+                except Exception as e:
+                    code = type(e).__name__
+                local.append(time.perf_counter() - start)
+                local_statuses[code] = local_statuses.get(code, 0) + 1
+            with lock:
+                latencies.extend(local)
+                for code, n in local_statuses.items():
+                    statuses[str(code)] = statuses.get(str(code), 0) + n
+
+        threads = [threading.Thread(target=client) for _ in range(scenario['concurrency'])]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        drain_started = time.perf_counter()
+        drained = wait_drained(app, scenario['drain_timeout'])
+        drain_seconds = time.perf_counter() - drain_started
+        # 停止日志后台线程，确保日志全部写入文件
+        logger_module._listener.stop()
+        usage_end = log_usage(log_dir)
+
+        latencies.sort()
+        count = len(latencies)
+        result.update({
+            'requests': count,
+            'elapsed_s': round(elapsed, 4),
+            'req_per_s': round(count / elapsed, 1) if elapsed else None,
+            'latency_ms': {
+                'mean': round(sum(latencies) / count * 1000, 3) if count else None,
+                'p50': round(percentile(latencies, 50) * 1000, 3) if count else None,
+                'p95': round(percentile(latencies, 95) * 1000, 3) if count else None,
+                'p99': round(percentile(latencies, 99) * 1000, 3) if count else None,
+                'max': round(latencies[-1] * 1000, 3) if count else None
+            },
+            'status': statuses,
+            'drained': drained,
+            'drain_s': round(drain_seconds, 4),
+            'rss_start_kb': rss_start,
+            'rss_end_kb': rss_kb(),
+            'log_bytes_per_message': {
+                k: round((usage_end[k] - usage_start[k]) / count, 1) if count else None
+                for k in usage_end
+            },
+            'stubs': {'onebot': onebot_stub.stats(), 'smtp': smtp_stub.stats()}
+        })
+        result['rss_growth_kb'] = result['rss_end_kb'] - rss_start
+        result['log_bytes_per_message']['total'] = round(
+            sum(v for k, v in result['log_bytes_per_message'].items() if k != 'wal'), 1)
+
+    if gui is not None:
+        # Tk必须在主线程运行，负载在后台线程中产生，结束后退出主循环
+        loader = threading.Thread(target=load, daemon=True)
+
+        def check_done():
+            if loader.is_alive():
+                gui.root.after(100, check_done)
+            else:
+                result['gui_rows'] = len(gui.rows)
+                gui.root.quit()
+
+        loader.start()
+        gui.root.after(100, check_done)
+        gui.run()
+    else:
+        load()
+
+    if server is not None:
+        server.stop(5)
+    close_app(app, 5)
+    onebot_stub.shutdown()
+    smtp_stub.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def start_virtual_display():
+    """没有DISPLAY时启动Xvfb，返回(环境变量, 进程)；不可用时返回(None, 原因)"""
+    if os.environ.get('DISPLAY'):
+        return dict(os.environ), None
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        return None, '没有DISPLAY且未安装Xvfb'
+    display = ':%d' % (90 + os.getpid() % 100)
+    proc = subprocess.Popen([xvfb, display, '-screen', '0', '1280x1024x24'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0)
+    if proc.poll() is not None:
+        return None, 'Xvfb启动失败'
+    return dict(os.environ, DISPLAY=display), proc
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--requests', type=int, default=2000, help='每个场景的请求数')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--sizes', default='100,10000', help='消息字符数，逗号分隔')
+    parser.add_argument('--transport', default='test-client,socket',
+                        help='test-client（进程内）和/或socket（真实HTTP连接），逗号分隔')
+    parser.add_argument('--mode', default='async', choices=('async', 'sync'), help='转发模式')
+    parser.add_argument('--gui', action='store_true', help='额外以GUI运行各场景')
+    parser.add_argument('--onebot-latency', type=float, default=0.0, help='OneBot替身响应延迟（秒）')
+    parser.add_argument('--onebot-fail', type=float, default=0.0, help='OneBot替身失败比例')
+    parser.add_argument('--smtp-latency', type=float, default=0.0, help='SMTP替身响应延迟（秒）')
+    parser.add_argument('--smtp-fail', type=float, default=0.0, help='SMTP替身失败比例')
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help='等待投递完成的最长时间（秒）')
+    parser.add_argument('-o', '--output', default='bench_pipeline.json', help='JSON结果文件')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        # 子进程：运行单个场景，结果作为最后一行输出
+        sys.path.insert(0, BENCH_DIR)
+        print(json.dumps(run_scenario(json.loads(args.scenario)), ensure_ascii=False))
+        return
+
+    scenarios = []
+    for gui in ([False, True] if args.gui else [False]):
+        for transport in args.transport.split(','):
+            for size in args.sizes.split(','):
+                scenarios.append({
+                    'transport': transport.strip(), 'size': int(size), 'gui': gui,
+                    'requests': args.requests, 'concurrency': args.concurrency, 'mode': args.mode,
+                    'onebot_latency': args.onebot_latency, 'onebot_fail': args.onebot_fail,
+                    'smtp_latency': args.smtp_latency, 'smtp_fail': args.smtp_fail,
+                    'drain_timeout': args.drain_timeout
+                })
+
+    gui_env, xvfb = (None, None)
+    if args.gui:
+        gui_env, xvfb = start_virtual_display()
+
+    results = []
+    try:
+        for scenario in scenarios:
+            name = f"{scenario['transport']:<11} size={scenario['size']:<7} gui={'on ' if scenario['gui'] else 'off'}"
+            env = dict(os.environ)
+            if scenario['gui']:
+                if gui_env is None:
+                    results.append({'scenario': scenario, 'skipped': xvfb})
+                    print(f'{name} 跳过: {xvfb}')
+                    continue
+                env = gui_env
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario', json.dumps(scenario)],
+                                  capture_output=True, text=True, env=env)
+            lines = proc.stdout.strip().splitlines()
+            if proc.returncode != 0 or not lines:
+                results.append({'scenario': scenario, 'error': proc.stderr.strip()[-2000:]})
+                print(f'{name} 失败: {proc.stderr.strip().splitlines()[-1:]}')
+                continue
+            result = json.loads(lines[-1])
+            results.append(result)
+            latency = result['latency_ms']
+            print(f"{name} {result['req_per_s']:8.1f} req/s  p50 {latency['p50']:7.2f} ms  "
+                  f"p95 {latency['p95']:7.2f} ms  p99 {latency['p99']:7.2f} ms  "
+                  f"rss +{result['rss_growth_kb']} KB  log {result['log_bytes_per_message']['total']} B/msg")
+    finally:
+        if hasattr(xvfb, 'terminate'):
+            xvfb.terminate()
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'结果已写入 {args.output}')
+
+if __name__ == '__main__':
+    main()
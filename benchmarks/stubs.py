@@ -0,0 +1,128 @@
+"""基准测试用的本地OneBot HTTP和SMTP替身，可注入延迟和失败"""
+import json
+import random
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubOneBotHandler(BaseHTTPRequestHandler):
+    """本地OneBot替身，按服务器的latency/failure_rate返回成功或失败"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # 关闭Nagle算法，避免长连接下的延迟确认拖慢响应
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        if getattr(server, 'latency', 0):
+            time.sleep(server.latency)
+        failed = random.random() < getattr(server, 'failure_rate', 0)
+        server.count(failed)
+        if failed:
+            code, body = 500, {'status': 'failed', 'retcode': 100, 'message': 'injected failure'}
+        else:
+            code, body = 200, {'status': 'ok', 'retcode': 0}
+        body = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _Counting:
+    def count(self, failed):
+        with self.lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.received += 1
+
+    def stats(self):
+        with self.lock:
+            return {'received': self.received, 'failed': self.failed}
+
+class StubOneBotServer(_Counting, ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        super().__init__(('127.0.0.1', 0), StubOneBotHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.received = 0
+        self.failed = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """只实现smtplib发送邮件用到的命令，任意账号都能登录"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        self.reply('220 stub ESMTP')
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line != b'.\r\n':
+                    continue
+                in_data = False
+                if server.latency:
+                    time.sleep(server.latency)
+                failed = random.random() < server.failure_rate
+                server.count(failed)
+                self.reply('451 injected failure' if failed else '250 ok')
+                continue
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250-stub')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif command == b'AUTH':
+                self.reply('235 ok')
+            elif command == b'DATA':
+                in_data = True
+                self.reply('354 end with .')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+class StubSMTPServer(_Counting, socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.received = 0
+        self.failed = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,156 @@
+import re
+import threading
+import time
+
+# 错误信息中的URL（requests的异常包含完整地址，路径和参数中可能有令牌），只保留协议和主机
+_URL = re.compile(r'([a-zA-Z][a-zA-Z0-9+.-]*://)(?:[^@/\s]*@)?([^/\s?#\'"]+)[^\s\'"]*')
+# urllib3异常中不带协议的路径：... with url: /hook/token?key=...
+_URL_PATH = re.compile(r'(url: )(?![a-zA-Z][a-zA-Z0-9+.-]*://)\S+')
+
+def redact_error(error):
+    """去掉错误信息中URL的路径、参数和账号，避免通过状态接口泄露令牌"""
+    if not error:
+        return error
+    return _URL_PATH.sub(r'\1***', _URL.sub(r'\1\2/***', error))
+
+class CircuitOpenError(Exception):
+    """渠道处于熔断状态，本次没有尝试投递"""
+
+    def __init__(self, channel, retry_after):
+        super().__init__(f'{channel}渠道已熔断，{retry_after:.0f}秒后重试')
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """按滚动时间窗口内的错误率熔断
+
+    窗口内调用数达到min_calls且错误率达到error_rate时进入open状态，期间直接拒绝调用；
+    经过reset_timeout后进入half_open：支持后台探测的渠道由探测结果决定是否恢复，
+    否则放行一次真实调用作为试探，成功即恢复为closed，失败则重新熔断。
+    """
+
+    def __init__(self, error_rate=0.5, min_calls=5, window=60.0, reset_timeout=30.0,
+                 buckets=10, probed=False):
+        self.error_rate = error_rate
+        self.min_calls = max(1, min_calls)
+        self.reset_timeout = reset_timeout
+        self.probed = probed
+        # 滚动窗口分为若干个桶，每个桶记录[成功数, 失败数]，内存占用与请求量无关
+        self.bucket_seconds = window / max(1, buckets)
+        self.buckets = [[0, 0] for _ in range(max(1, buckets))]
+        self.bucket_index = 0
+        self.bucket_start = time.monotonic()
+        self.opened_at = None
+        self.probing = False
+        self.last_error = None
+        self.last_failure = None
+        self.last_success = None
+        self.lock = threading.Lock()
+
+    def _advance(self, now):
+        """把过期的桶清零，移动到当前时间所在的桶"""
+        elapsed = int((now - self.bucket_start) // self.bucket_seconds)
+        if elapsed <= 0:
+            return
+        for _ in range(min(elapsed, len(self.buckets))):
+            self.bucket_index = (self.bucket_index + 1) % len(self.buckets)
+            self.buckets[self.bucket_index] = [0, 0]
+        self.bucket_start += elapsed * self.bucket_seconds
+
+    def _counts(self):
+        return sum(b[0] for b in self.buckets), sum(b[1] for b in self.buckets)
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return 'closed'
+        if self.probing or now - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state(time.monotonic())
+
+    def before_call(self):
+        """调用前检查，返回0表示放行，否则返回建议等待的秒数"""
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if wait > 0:
+                return wait
+            if self.probed or self.probing:
+                # 由后台探测或进行中的试探请求决定是否恢复，其余请求稍后再试
+                return min(1.0, self.reset_timeout)
+            self.probing = True
+            return 0
+
+    def record(self, ok, error=None):
+        """记录一次真实调用的结果"""
+        with self.lock:
+            now = time.monotonic()
+            self._advance(now)
+            self.buckets[self.bucket_index][0 if ok else 1] += 1
+            if ok:
+                self.last_success = time.time()
+                if self.opened_at is not None:
+                    self._close()
+                return
+            self.last_failure = time.time()
+            self.last_error = redact_error(error)
+            if self.opened_at is not None:
+                # 试探失败，重新熔断
+                self.probing = False
+                self.opened_at = now
+                return
+            successes, failures = self._counts()
+            if successes + failures >= self.min_calls and failures >= self.error_rate * (successes + failures):
+                self.opened_at = now
+
+    def probe_due(self):
+        """是否应由后台进行一次探测（熔断中且已过冷却时间）"""
+        with self.lock:
+            if self.opened_at is None or self.probing:
+                return False
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record_probe(self, ok, error=None):
+        """记录后台探测结果：成功则恢复，失败则重新开始冷却"""
+        with self.lock:
+            if ok:
+                self.last_success = time.time()
+                self._close()
+            else:
+                self.probing = False
+                self.opened_at = time.monotonic()
+                self.last_failure = time.time()
+                self.last_error = redact_error(error)
+
+    def _close(self):
+        self.opened_at = None
+        self.probing = False
+        # 恢复后重新统计，避免熔断前的失败立即再次触发熔断
+        for bucket in self.buckets:
+            bucket[0] = bucket[1] = 0
+
+    def snapshot(self):
+        """当前健康状态，供状态接口使用"""
+        with self.lock:
+            now = time.monotonic()
+            self._advance(now)
+            successes, failures = self._counts()
+            total = successes + failures
+            state = self._state(now)
+            return {
+                'state': state,
+                'calls': total,
+                'failures': failures,
+                'error_rate': round(failures / total, 3) if total else 0.0,
+                'retry_in': round(max(0.0, self.opened_at + self.reset_timeout - now), 1) if state == 'open' else None,
+                'last_success': self.last_success,
+                'last_failure': self.last_failure,
+                'last_error': self.last_error
+            }
@@ -0,0 +1,429 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+import requests
+from requests.adapters import HTTPAdapter
+from onebot import OneBotClient
+from mailer import SMTPPool, EmailDigest
+from breaker import CircuitBreaker, CircuitOpenError
+from metrics import STAGE_SECONDS
+from message import MessageRecord
+import fastjson
+
+# 渠道类型注册表：type名称 -> 渠道类
+CHANNEL_TYPES = {}
+
+# 同步转发中视为失败的渠道状态
+FAILED_STATES = ('failed', 'timeout', 'circuit_open')
+
+def register_channel(kind):
+    """注册渠道类型，config.ini中[channel:名称]节的type取该名称"""
+    def decorator(cls):
+        cls.kind = kind
+        CHANNEL_TYPES[kind] = cls
+        return cls
+    return decorator
+
+def message_text(message):
+    """渠道发送和路由匹配用的文本，MessageRecord使用其缓存的文本形式"""
+    if isinstance(message, MessageRecord):
+        return message.text
+    if isinstance(message, str):
+        return message
+    return fastjson.pretty(message)
+
+def _split(value):
+    return {v.strip() for v in value.split(',') if v.strip()}
+
+class Channel:
+    """转发渠道基类：子类实现from_section()和send()，可选实现probe()
+
+    send()成功返回True，失败返回False或抛出异常；路由规则、超时和熔断由基类统一处理。
+    延迟发送的渠道（邮件摘要）可以返回Future，发出后以True完成，失败时带异常。
+    can_probe为True的渠道熔断后由后台探测probe()决定何时恢复，不用真实消息试探。
+    """
+    kind = None
+    can_probe = False
+
+    def __init__(self, name, logger, send_timeout=10.0):
+        self.name = name
+        self.logger = logger
+        self.send_timeout = send_timeout
+        self.text_from = set()
+        self.exclude_from = set()
+        self.match = None
+        self.breaker = CircuitBreaker()
+
+    @classmethod
+    def from_section(cls, name, section, logger):
+        """根据配置节创建渠道，配置不完整时返回None，配置错误时抛出ValueError"""
+        raise NotImplementedError
+
+    def configure(self, section, breaker=None):
+        """读取各渠道通用的配置：路由规则、转发超时和熔断参数（breaker为[channels]节中的默认值）"""
+        breaker = breaker or {}
+        self.text_from = _split(section.get('text_from', ''))
+        self.exclude_from = _split(section.get('exclude_from', ''))
+        pattern = section.get('match', '')
+        if pattern:
+            try:
+                self.match = re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f'match正则无效: {str(e)}')
+        self.send_timeout = section.getfloat('send_timeout', fallback=self.send_timeout)
+        self.breaker = CircuitBreaker(
+            error_rate=section.getfloat('breaker_error_rate', fallback=breaker.get('error_rate', 0.5)),
+            min_calls=section.getint('breaker_min_calls', fallback=breaker.get('min_calls', 5)),
+            window=section.getfloat('breaker_window', fallback=breaker.get('window', 60.0)),
+            reset_timeout=section.getfloat('breaker_reset', fallback=breaker.get('reset_timeout', 30.0)),
+            probed=self.can_probe
+        )
+
+    def accepts(self, message, text_from):
+        """消息是否应转发到该渠道"""
+        if self.text_from and text_from not in self.text_from:
+            return False
+        if text_from in self.exclude_from:
+            return False
+        if self.match is not None and not self.match.search(message_text(message)):
+            return False
+        return True
+
+    def deliver(self, message):
+        """经过熔断器的一次投递：熔断中抛出CircuitOpenError，否则返回send()的结果"""
+        wait = self.breaker.before_call()
+        if wait:
+            raise CircuitOpenError(self.name, wait)
+        try:
+            result = self.send(message)
+        except Exception as e:
+            self.breaker.record(False, str(e))
+            raise
+        if isinstance(result, Future):
+            # 延迟发送：真正发出后再记录结果
+            result.add_done_callback(self._record_future)
+            return result
+        ok = bool(result)
+        self.breaker.record(ok, None if ok else '目标返回失败')
+        return ok
+
+    def _record_future(self, future):
+        error = future.exception()
+        self.breaker.record(error is None, None if error is None else str(error))
+
+    def send(self, message):
+        raise NotImplementedError
+
+    def probe(self):
+        """健康探测，健康返回True，否则返回False或抛出异常"""
+        raise NotImplementedError
+
+    def flush(self):
+        """立即发出缓冲中的消息"""
+        pass
+
+    def close(self):
+        pass
+
+@register_channel('onebot')
+class OneBotChannel(Channel):
+    """通过OneBot v11协议私发消息，用get_status接口探测健康状态"""
+    can_probe = True
+
+    def __init__(self, name, client, logger):
+        super().__init__(name, logger, sum(client.timeout))
+        self.client = client
+
+    @classmethod
+    def from_section(cls, name, section, logger):
+        client = OneBotClient.from_section(section)
+        return cls(name, client, logger) if client is not None else None
+
+    def send(self, message):
+        resp_data = self.client.send_private_msg(message)
+        if resp_data.get('status') != 'ok':
+            self.logger.error(f'OneBot API错误: {resp_data.get("message", "未知错误")}')
+            return False
+        return True
+
+    def probe(self):
+        return self.client.get_status().get('status') == 'ok'
+
+    def close(self):
+        self.client.close()
+
+@register_channel('email')
+class EmailChannel(Channel):
+    """通过邮件转发消息，可选摘要模式合并发送；探测时新建SMTP连接并登录"""
+    can_probe = True
+
+    def __init__(self, name, pool, logger, digest=None):
+        super().__init__(name, logger, pool.timeout * 3)
+        self.pool = pool
+        self.digest = digest
+
+    @classmethod
+    def from_section(cls, name, section, logger):
+        pool = SMTPPool.from_section(section)
+        if pool is None:
+            return None
+        digest = None
+        if section.getboolean('digest_enabled', fallback=False):
+            digest = EmailDigest(
+                pool, logger,
+                window=section.getfloat('digest_window', fallback=60.0),
+                max_messages=section.getint('digest_max', fallback=50)
+            )
+        return cls(name, pool, logger, digest)
+
+    def send(self, message):
+        message = message_text(message)
+        if self.digest is not None:
+            # 摘要邮件发出后才算投递完成
+            return self.digest.add(message)
+        self.pool.send('Webhook消息通知', message)
+        return True
+
+    def probe(self):
+        return self.pool.check()
+
+    def flush(self):
+        if self.digest is not None:
+            self.digest.flush()
+
+    def close(self):
+        if self.digest is not None:
+            self.digest.flush()
+        self.pool.close()
+
+@register_channel('http')
+class HTTPChannel(Channel):
+    """通用HTTP Webhook渠道：把消息发送到任意URL，2xx响应视为成功
+
+    配置了probe_url时熔断后GET该地址探测，2xx即恢复；否则用一条真实消息试探。
+    """
+
+    def __init__(self, name, url, logger, method='POST', headers=None, body='json', json_key='message',
+                 pool_size=4, connect_timeout=3.0, read_timeout=10.0, probe_url=None):
+        super().__init__(name, logger, connect_timeout + read_timeout)
+        self.url = url
+        self.probe_url = probe_url
+        self.can_probe = bool(probe_url)
+        self.method = method.upper()
+        self.body = body
+        self.json_key = json_key
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_section(cls, name, section, logger):
+        url = section.get('url', '')
+        if not url:
+            return None
+        headers = section.get('headers', '')
+        try:
+            headers = json.loads(headers) if headers else {}
+        except ValueError:
+            raise ValueError('headers必须是JSON对象')
+        if not isinstance(headers, dict):
+            raise ValueError('headers必须是JSON对象')
+        body = section.get('body', 'json')
+        if body not in ('json', 'text'):
+            raise ValueError(f'不支持的body格式: {body}')
+        return cls(
+            name, url, logger,
+            method=section.get('method', 'POST'),
+            headers={str(k): str(v) for k, v in headers.items()},
+            body=body,
+            json_key=section.get('json_key', 'message'),
+            pool_size=section.getint('pool_size', fallback=4),
+            connect_timeout=section.getfloat('connect_timeout', fallback=3.0),
+            read_timeout=section.getfloat('read_timeout', fallback=10.0),
+            probe_url=section.get('probe_url', '') or None
+        )
+
+    def send(self, message):
+        if self.body == 'json':
+            kwargs = {'data': fastjson.dumps_bytes({self.json_key: message}),
+                      'headers': {'Content-Type': 'application/json'}}
+        else:
+            kwargs = {'data': message_text(message).encode('utf-8'),
+                      'headers': {'Content-Type': 'text/plain; charset=utf-8'}}
+        with STAGE_SECONDS.time('http'):
+            response = self.session.request(self.method, self.url, timeout=self.timeout, **kwargs)
+        if not 200 <= response.status_code < 300:
+            self.logger.error(f'{self.name}渠道返回HTTP {response.status_code}')
+            return False
+        return True
+
+    def probe(self):
+        response = self.session.get(self.probe_url, timeout=self.timeout)
+        return 200 <= response.status_code < 300
+
+    def close(self):
+        self.session.close()
+
+class ChannelRegistry:
+    """按config.ini创建的转发渠道集合，负责按规则路由和并行扇出
+
+    [onebot]和[email]节分别对应同名渠道，[channel:名称]节按type创建任意类型的渠道，
+    只有enabled = true且配置完整的渠道会被加载。start()后由后台线程探测熔断中的渠道。
+    """
+
+    def __init__(self, channels, logger, workers=None, probe_interval=1.0):
+        # channels: 按配置顺序排列的渠道列表
+        self.channels = {c.name: c for c in channels}
+        self.logger = logger
+        # 同步模式的扇出线程池；超时的调用仍在后台跑完，所以留出余量
+        self.executor = ThreadPoolExecutor(max_workers=workers or max(4, 4 * len(self.channels)),
+                                           thread_name_prefix='fanout')
+        self.probe_interval = probe_interval
+        self.stopping = threading.Event()
+        self.monitor = None
+
+    @classmethod
+    def from_config(cls, config, logger):
+        breaker = {
+            'error_rate': config.getfloat('channels', 'breaker_error_rate', fallback=0.5),
+            'min_calls': config.getint('channels', 'breaker_min_calls', fallback=5),
+            'window': config.getfloat('channels', 'breaker_window', fallback=60.0),
+            'reset_timeout': config.getfloat('channels', 'breaker_reset', fallback=30.0)
+        }
+        channels = []
+        for section_name in config.sections():
+            if section_name in ('onebot', 'email'):
+                name = kind = section_name
+            elif section_name.startswith('channel:'):
+                name = section_name[len('channel:'):].strip()
+                kind = config.get(section_name, 'type', fallback='')
+            else:
+                continue
+            section = config[section_name]
+            if not section.getboolean('enabled', fallback=False):
+                continue
+            channel_cls = CHANNEL_TYPES.get(kind)
+            if channel_cls is None:
+                logger.error(f'[{section_name}]的渠道类型未知: {kind}')
+                continue
+            if not name or name == 'gui' or any(c.name == name for c in channels):
+                logger.error(f'[{section_name}]的渠道名称无效或重复')
+                continue
+            try:
+                channel = channel_cls.from_section(name, section, logger)
+                if channel is None:
+                    logger.warning(f'{name}渠道配置不完整，跳过消息转发')
+                    continue
+                channel.configure(section, breaker)
+            except ValueError as e:
+                logger.error(f'{name}渠道配置错误: {str(e)}')
+                continue
+            channels.append(channel)
+        return cls(channels, logger, config.getint('channels', 'fanout_workers', fallback=0) or None)
+
+    def start(self):
+        """启动后台健康探测线程"""
+        if any(c.can_probe for c in self.channels.values()):
+            self.monitor = threading.Thread(target=self._monitor, name='channel-probe', daemon=True)
+            self.monitor.start()
+        return self
+
+    def _monitor(self):
+        while not self.stopping.wait(self.probe_interval):
+            for channel in self.channels.values():
+                if not channel.can_probe or not channel.breaker.probe_due():
+                    continue
+                try:
+                    ok = bool(channel.probe())
+                    error = None if ok else '探测返回失败'
+                except Exception as e:
+                    ok = False
+                    error = str(e)
+                channel.breaker.record_probe(ok, error)
+                if ok:
+                    self.logger.warning(f'{channel.name}渠道探测成功，恢复转发')
+                else:
+                    self.logger.warning(f'{channel.name}渠道探测失败: {error}')
+
+    def __iter__(self):
+        return iter(self.channels.values())
+
+    def __len__(self):
+        return len(self.channels)
+
+    def states(self):
+        """各渠道的熔断状态{渠道名: closed/half_open/open}"""
+        return {name: channel.breaker.state for name, channel in self.channels.items()}
+
+    def status(self):
+        """各渠道的类型和健康状态，供状态接口使用"""
+        return {name: dict(channel.breaker.snapshot(), type=channel.kind, probe=channel.can_probe)
+                for name, channel in self.channels.items()}
+
+    def handlers(self):
+        """投递队列使用的{渠道名: 投递函数}"""
+        return {name: channel.deliver for name, channel in self.channels.items()}
+
+    def route(self, message, text_from):
+        """按各渠道的路由规则选出应转发的渠道名（message可以是MessageRecord，只在需要匹配内容时才生成文本）"""
+        return [name for name, channel in self.channels.items() if channel.accepts(message, text_from)]
+
+    def fan_out(self, message, names=None):
+        """并行转发到指定渠道（默认全部），返回{渠道名: success/failed/timeout/circuit_open/pending}
+
+        每个渠道按自己的send_timeout等待，超时的渠道记为timeout，不影响其他渠道的结果；
+        延迟发送的渠道（邮件摘要）尚未发出时记为pending。
+        """
+        if names is None:
+            names = list(self.channels)
+        started = time.monotonic()
+        futures = {name: self.executor.submit(self.channels[name].deliver, message) for name in names}
+        status = {}
+        for name, future in futures.items():
+            remaining = started + self.channels[name].send_timeout - time.monotonic()
+            try:
+                ok = future.result(timeout=max(0, remaining))
+                if isinstance(ok, Future):
+                    if not ok.done():
+                        status[name] = 'pending'
+                        continue
+                    ok = ok.result()
+                status[name] = 'success' if ok else 'failed'
+            except FutureTimeout:
+                self.logger.error(f'{name}渠道转发超时')
+                status[name] = 'timeout'
+            except CircuitOpenError:
+                status[name] = 'circuit_open'
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f'{name}渠道网络错误: {str(e)}')
+                status[name] = 'failed'
+            except Exception as e:
+                self.logger.error(f'{name}渠道转发失败: {str(e)}')
+                status[name] = 'failed'
+        return status
+
+    def flush(self):
+        """让各渠道立即发出缓冲中的消息（退出前、关闭发件箱之前调用）"""
+        for channel in self.channels.values():
+            try:
+                channel.flush()
+            except Exception as e:
+                self.logger.error(f'{channel.name}渠道发送缓冲消息失败: {str(e)}')
+
+    def close(self):
+        self.stopping.set()
+        if self.monitor is not None:
+            self.monitor.join(5)
+        self.executor.shutdown(wait=False)
+        for channel in self.channels.values():
+            try:
+                channel.close()
+            except Exception as e:
+                self.logger.error(f'关闭{channel.name}渠道失败: {str(e)}')
@@ -1,14 +1,153 @@
 import configparser
+import hashlib
+import hmac
 import os
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping
+
+CONFIG_FILE = 'config.ini'
+DEFAULT_TEXT_FROM = 'aYYbsYYa'
+# 两次检查配置文件mtime的最小间隔（秒），避免每个请求都stat文件
+CHECK_INTERVAL = 1.0
+
+class FrozenConfigParser(configparser.ConfigParser):
+    """读取完成后不可修改的ConfigParser"""
+
+    def __init__(self):
+        super().__init__()
+        self._frozen = False
+
+    def freeze(self):
+        self._frozen = True
+        return self
+
+    def _check(self):
+        if getattr(self, '_frozen', False):
+            raise TypeError('配置为只读，请修改config.ini后重新加载')
+
+    def set(self, section, option, value=None):
+        self._check()
+        super().set(section, option, value)
+
+    def add_section(self, section):
+        self._check()
+        super().add_section(section)
+
+    def remove_section(self, section):
+        self._check()
+        return super().remove_section(section)
+
+    def remove_option(self, section, option):
+        self._check()
+        return super().remove_option(section, option)
+
+@dataclass(frozen=True)
+class Config:
+    """启动时解析一次的只读配置，各模块共享同一份"""
+    host: str = '0.0.0.0'
+    port: int = 5000
+    log_dir: str = 'logs'
+    window_width: int = 1000
+    window_height: int = 700
+    # sha256(api_key) -> 该密钥默认的text_from
+    api_keys: Mapping[bytes, str] = field(default_factory=lambda: MappingProxyType({}))
+    # 原始配置，供各转发渠道按节读取
+    parser: FrozenConfigParser = field(default_factory=lambda: FrozenConfigParser().freeze(), repr=False)
+    mtime: float = 0.0
+
+    def check_api_key(self, api_key):
+        """常量时间比较API密钥，通过时返回该密钥默认的text_from，否则返回None"""
+        if not api_key:
+            return None
+        digest = hashlib.sha256(api_key.encode('utf-8')).digest()
+        matched = None
+        # 与所有密钥逐一比较，耗时不随匹配位置变化
+        for key_digest, text_from in self.api_keys.items():
+            if hmac.compare_digest(digest, key_digest):
+                matched = text_from
+        return matched
+
+def _read_api_keys(path):
+    """读取[api_keys]节，[(密钥, text_from)]
+
+    其他节的选项名与标准ConfigParser一样不区分大小写，而[api_keys]的选项名就是密钥本身，
+    需要保留原始大小写，所以单独解析这一节。
+    """
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    parser.read(path, encoding='utf-8')
+    if not parser.has_section('api_keys'):
+        return []
+    return [(key, parser.get('api_keys', key)) for key in parser.options('api_keys')
+            if key not in parser.defaults()]
+
+def parse_config(path=CONFIG_FILE):
+    parser = FrozenConfigParser()
+    parser.read(path, encoding='utf-8')
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        mtime = 0.0
+
+    # [security] api_key 为默认密钥，[api_keys] 中可配置更多密钥及其默认来源
+    keys = {}
+    default_key = parser.get('security', 'api_key', fallback='')
+    if default_key:
+        keys[hashlib.sha256(default_key.encode('utf-8')).digest()] = DEFAULT_TEXT_FROM
+    for key, text_from in _read_api_keys(path):
+        keys[hashlib.sha256(key.encode('utf-8')).digest()] = text_from or DEFAULT_TEXT_FROM
+
+    return Config(
+        host=parser.get('server', 'host', fallback='0.0.0.0'),
+        port=parser.getint('server', 'port', fallback=5000),
+        log_dir=parser.get('logging', 'dir', fallback='logs'),
+        window_width=parser.getint('gui', 'window_width', fallback=1000),
+        window_height=parser.getint('gui', 'window_height', fallback=700),
+        api_keys=MappingProxyType(keys),
+        parser=parser.freeze(),
+        mtime=mtime
+    )
+
+_config = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+def get_config():
+    """返回缓存的配置，配置文件mtime变化时自动重新加载"""
+    global _config, _last_check
+    now = time.monotonic()
+    if _config is not None and now - _last_check < CHECK_INTERVAL:
+        return _config
+    with _lock:
+        if _config is None:
+            _config = parse_config()
+        elif now - _last_check >= CHECK_INTERVAL:
+            try:
+                mtime = os.stat(CONFIG_FILE).st_mtime
+            except OSError:
+                mtime = _config.mtime
+            if mtime != _config.mtime:
+                _config = parse_config()
+        _last_check = now
+    return _config
+
+def reload_config():
+    """强制重新加载配置（SIGHUP时调用）"""
+    global _config, _last_check
+    with _lock:
+        _config = parse_config()
+        _last_check = time.monotonic()
+    return _config
 
 def load_config():
-    config = configparser.ConfigParser()
-    config.read('config.ini', encoding='utf-8')
-    return config
+    """兼容旧接口：返回缓存配置中的原始ConfigParser"""
+    return get_config().parser
 
 def ensure_logs_directory():
-    os.makedirs('logs', exist_ok=True)
+    os.makedirs(get_config().log_dir, exist_ok=True)
 
 def get_api_key():
-    config = load_config()
-    return config['security'].get('api_key', '')
+    return get_config().parser.get('security', 'api_key', fallback='')
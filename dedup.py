@@ -0,0 +1,166 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import fastjson
+
+class DedupCache:
+    """有界的TTL/LRU缓存，记录窗口期内处理过的请求及其响应，用于幂等和去重
+
+    第一次出现的键先登记为处理中，处理完成后保存响应；窗口期内的重复请求直接返回保存的响应，
+    与原请求并发到达的重复请求会等待原请求完成。
+    """
+
+    def __init__(self, window=300.0, max_entries=100000, wait_timeout=5.0):
+        self.window = window
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        # 键 -> [过期时间, 完成事件, 响应]
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(api_key, idempotency_key=None, message=None, text_from=None):
+        """按API密钥隔离的缓存键：优先使用幂等键，否则对消息内容取哈希"""
+        h = hashlib.sha256(api_key.encode('utf-8'))
+        h.update(b'\0')
+        if idempotency_key is not None:
+            h.update(b'id:' + str(idempotency_key).encode('utf-8'))
+        else:
+            h.update(b'content:' + (text_from or '').encode('utf-8') + b'\0')
+            h.update(fastjson.dumps_bytes(message, sort_keys=True))
+        return h.digest()
+
+    def claim(self, key):
+        """登记一个键，返回(状态, 响应)
+
+        状态为new时是新请求，调用方需随后complete或discard；done时返回原请求保存的响应；
+        busy表示原请求仍在处理（等待超时）或已失败。
+        """
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < now:
+                self.entries[key] = [now + self.window, threading.Event(), None]
+                self.entries.move_to_end(key)
+                return 'new', None
+            self.entries.move_to_end(key)
+        if not entry[1].wait(self.wait_timeout) or entry[2] is None:
+            return 'busy', None
+        return 'done', entry[2]
+
+    def complete(self, key, response):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None:
+            entry[2] = response
+            entry[1].set()
+
+    def discard(self, key):
+        """处理失败时移除登记，允许发送方重试"""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry[1].set()
+
+    def _evict(self, now):
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if len(self.entries) >= self.max_entries or entry[0] < now:
+                self.entries.popitem(last=False)
+                entry[1].set()
+            else:
+                break
+
+    def __len__(self):
+        return len(self.entries)
+
+class SharedDedupCache:
+    """多进程共享的去重记录：保存在日志目录下的SQLite数据库中，键唯一，接口与DedupCache相同
+
+    多个工作进程同时收到相同的键时只有一个能登记成功，其余进程轮询等待其保存响应。
+    过期记录在登记时顺带清除，超过max_entries时淘汰最早过期的记录。
+    """
+
+    def __init__(self, path, window=300.0, max_entries=100000, wait_timeout=5.0,
+                 poll_interval=0.05, sweep_interval=60.0):
+        self.window = window
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS dedup (
+                key BLOB PRIMARY KEY,
+                expires REAL NOT NULL,
+                response TEXT
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_dedup_expires ON dedup (expires)')
+        self.lock = threading.Lock()
+
+    make_key = staticmethod(DedupCache.make_key)
+
+    def claim(self, key):
+        """登记一个键，返回(状态, 响应)，状态含义同DedupCache.claim()"""
+        now = time.time()
+        with self.lock:
+            self._sweep(now)
+            # 每条语句各自原子执行：先删除过期的记录，再由唯一键决定哪个请求登记成功
+            self.conn.execute('DELETE FROM dedup WHERE key = ? AND expires < ?', (key, now))
+            inserted = self.conn.execute('INSERT OR IGNORE INTO dedup (key, expires) VALUES (?, ?)',
+                                         (key, now + self.window)).rowcount
+        if inserted:
+            return 'new', None
+        # 原请求（可能在其他进程中）仍在处理时轮询等待
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self.lock:
+                row = self.conn.execute('SELECT response FROM dedup WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return 'busy', None
+            if row[0] is not None:
+                return 'done', tuple(fastjson.loads(row[0]))
+            if time.monotonic() >= deadline:
+                return 'busy', None
+            time.sleep(self.poll_interval)
+
+    def complete(self, key, response):
+        with self.lock:
+            self.conn.execute('UPDATE dedup SET response = ? WHERE key = ?',
+                              (fastjson.dumps(list(response)), key))
+
+    def discard(self, key):
+        """处理失败时移除登记，允许发送方重试"""
+        with self.lock:
+            self.conn.execute('DELETE FROM dedup WHERE key = ?', (key,))
+
+    def _sweep(self, now):
+        if now < self.next_sweep:
+            return
+        self.next_sweep = now + self.sweep_interval
+        self.conn.execute('DELETE FROM dedup WHERE expires < ?', (now,))
+        excess = self.conn.execute('SELECT COUNT(*) FROM dedup').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.conn.execute('DELETE FROM dedup WHERE key IN '
+                              '(SELECT key FROM dedup ORDER BY expires LIMIT ?)', (excess,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM dedup WHERE expires >= ?',
+                                     (time.time(),)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,247 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from breaker import CircuitOpenError
+from metrics import DELIVERIES, RETRIES, DROPPED
+
+# 发件箱状态到对外投递状态的映射
+OUTBOX_STATUS = {
+    'pending': 'pending',
+    'queued': 'pending',
+    'retry': 'retrying',
+    'done': 'success',
+    'dead': 'dead'
+}
+
+# 尚未有最终结果的投递状态
+UNFINISHED = ('pending', 'retrying')
+
+class DeliveryQueue:
+    """按渠道划分的有界投递队列，每个渠道由独立的工作线程池消费
+
+    配置了outbox时，消息先写入发件箱再入队，失败后按退避策略重试，
+    进程重启后未完成的投递会被重新放回队列。
+    """
+
+    def __init__(self, handlers, logger, queue_size=1000, workers=2, max_records=10000,
+                 outbox=None, poll_interval=1.0, recover=True):
+        # handlers: {渠道名: 投递函数}，投递函数接收消息并返回是否成功
+        self.handlers = handlers
+        self.logger = logger
+        self.max_records = max_records
+        self.outbox = outbox
+        self.poll_interval = poll_interval
+        self.queues = {name: queue.Queue(maxsize=queue_size) for name in handlers}
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+        for name in handlers:
+            for i in range(max(1, workers)):
+                t = threading.Thread(target=self._worker, args=(name,),
+                                     name=f'delivery-{name}-{i}', daemon=True)
+                t.start()
+                self.threads.append(t)
+
+        self.poller = None
+        if outbox is not None:
+            # 多进程部署时由主进程在启动工作进程前恢复，工作进程不恢复，避免重复投递
+            if recover:
+                outbox.recover()
+            self.poller = threading.Thread(target=self._poll_retries, name='delivery-retry', daemon=True)
+            self.poller.start()
+
+    def submit(self, message, delivery_id=None, channels=None, encoded=None):
+        """提交消息到指定渠道（默认所有渠道），返回投递记录；encoded为消息已编码的JSON，写发件箱时直接使用
+
+        未配置发件箱时，队列已满的渠道记为dropped；配置了发件箱时改为稍后重试。
+        """
+        delivery_id = delivery_id or uuid.uuid4().hex
+        if channels is None:
+            channels = list(self.handlers)
+        if self.outbox is not None:
+            # 先写发件箱再入队（write-ahead），保证崩溃后可以重放；写入失败时抛出异常，消息不入队
+            self.outbox.add(delivery_id, channels, message, encoded=encoded)
+
+        record = {
+            'id': delivery_id,
+            'created': time.time(),
+            'channels': {name: 'pending' for name in channels}
+        }
+        with self.lock:
+            self.records[delivery_id] = record
+            # 只保留最近的投递记录，避免内存无限增长
+            while len(self.records) > self.max_records:
+                self.records.popitem(last=False)
+
+        for name in channels:
+            q = self.queues[name]
+            try:
+                q.put_nowait((delivery_id, message, 0))
+            except queue.Full:
+                if self.outbox is not None:
+                    self.logger.warning(f'{name}投递队列已满，稍后重试: {delivery_id}')
+                    self.outbox.defer(delivery_id, name, self.poll_interval)
+                    self._set_result(delivery_id, name, 'retrying')
+                else:
+                    self.logger.warning(f'{name}投递队列已满，丢弃消息: {delivery_id}')
+                    self._set_result(delivery_id, name, 'dropped')
+                    DROPPED.inc(name)
+        # 刚提交的消息直接按内存记录返回，不必再查询发件箱
+        with self.lock:
+            channels = dict(record['channels'])
+        return self._summary(delivery_id, record['created'], channels)
+
+    def get_status(self, delivery_id):
+        """查询投递状态，未知id返回None
+
+        配置了发件箱时，未完成的渠道以发件箱为准：多进程部署时重试可能由其他进程完成，
+        本进程内存中的记录不会随之更新。
+        """
+        with self.lock:
+            record = self.records.get(delivery_id)
+            if record is not None:
+                created = record['created']
+                channels = dict(record['channels'])
+        if record is None:
+            if self.outbox is None:
+                return None
+            # 内存中已淘汰或重启前提交的消息，从发件箱中查询
+            channels = {k: OUTBOX_STATUS.get(v, v) for k, v in self.outbox.get(delivery_id).items()}
+            if not channels:
+                return None
+            created = None
+        elif self.outbox is not None and any(v in UNFINISHED for v in channels.values()):
+            stored = self.outbox.get(delivery_id)
+            for name, result in channels.items():
+                if result in UNFINISHED and name in stored:
+                    channels[name] = OUTBOX_STATUS.get(stored[name], stored[name])
+        return self._summary(delivery_id, created, channels)
+
+    @staticmethod
+    def _summary(delivery_id, created, channels):
+        values = channels.values()
+        if any(v in UNFINISHED for v in values):
+            status = 'pending'
+        elif all(v == 'success' for v in values):
+            status = 'success'
+        else:
+            status = 'partial_success'
+        return {
+            'id': delivery_id,
+            'status': status,
+            'created': created,
+            'details': channels
+        }
+
+    def depth(self):
+        """各渠道当前排队的消息数"""
+        return {name: q.qsize() for name, q in self.queues.items()}
+
+    def alive(self):
+        """所有工作线程是否都在运行"""
+        threads = self.threads + ([self.poller] if self.poller is not None else [])
+        return all(t.is_alive() for t in threads)
+
+    def stop(self, timeout=10, flush=None):
+        """发送停止信号并等待队列中的消息投递完毕
+
+        flush在工作线程退出后、关闭发件箱前调用，让延迟发送的渠道发出缓冲的消息并记录结果。
+        """
+        deadline = time.monotonic() + timeout
+        self.stopping.set()
+        for name, q in self.queues.items():
+            for _ in range(sum(1 for t in self.threads if t.name.startswith(f'delivery-{name}-'))):
+                try:
+                    q.put(None, timeout=max(0, deadline - time.monotonic()))
+                except queue.Full:
+                    break
+        for t in self.threads:
+            t.join(max(0, deadline - time.monotonic()))
+        if self.poller is not None:
+            self.poller.join(max(0, deadline - time.monotonic()))
+        if flush is not None:
+            flush()
+        if self.outbox is not None:
+            self.outbox.close()
+
+    def _set_result(self, delivery_id, channel, result):
+        with self.lock:
+            record = self.records.get(delivery_id)
+            if record is not None:
+                record['channels'][channel] = result
+
+    def _worker(self, channel):
+        handler = self.handlers[channel]
+        q = self.queues[channel]
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            delivery_id, message, attempts = item
+            try:
+                ok = handler(message)
+                error = None
+            except CircuitOpenError as e:
+                # 熔断中的渠道没有真正尝试投递，不计入重试次数
+                if self.outbox is not None:
+                    self.outbox.defer(delivery_id, channel, e.retry_after)
+                    result = 'retrying'
+                else:
+                    result = 'failed'
+                self._set_result(delivery_id, channel, result)
+                DELIVERIES.inc(channel, 'circuit_open')
+                continue
+            except Exception as e:
+                self.logger.error(f'{channel}投递异常: {str(e)}')
+                ok = False
+                error = str(e)
+
+            if isinstance(ok, Future):
+                # 延迟发送的渠道（邮件摘要）：发出后再确认，期间发件箱中保持pending，重启后会重放
+                ok.add_done_callback(partial(self._finish_later, delivery_id, channel, attempts))
+                continue
+            self._finish(delivery_id, channel, attempts, ok, error)
+
+    def _finish_later(self, delivery_id, channel, attempts, future):
+        error = future.exception()
+        if error is not None:
+            self.logger.error(f'{channel}投递异常: {str(error)}')
+        try:
+            self._finish(delivery_id, channel, attempts, error is None, None if error is None else str(error))
+        except Exception as e:
+            self.logger.error(f'{channel}记录投递结果失败: {str(e)}')
+
+    def _finish(self, delivery_id, channel, attempts, ok, error):
+        """记录一次投递的结果，失败时按发件箱的退避策略重试"""
+        if self.outbox is None:
+            result = 'success' if ok else 'failed'
+        elif ok:
+            self.outbox.mark_done(delivery_id, channel)
+            result = 'success'
+        else:
+            result = OUTBOX_STATUS[self.outbox.mark_failed(delivery_id, channel, attempts, error)]
+        self._set_result(delivery_id, channel, result)
+        DELIVERIES.inc(channel, result)
+
+    def _poll_retries(self):
+        """定期把到期的重试记录放回对应渠道的队列"""
+        while not self.stopping.wait(self.poll_interval):
+            try:
+                for delivery_id, channel, message, attempts in self.outbox.claim_due():
+                    q = self.queues.get(channel)
+                    if q is None:
+                        # 渠道已被移除，直接进入死信
+                        self.outbox.mark_failed(delivery_id, channel, self.outbox.max_retries, '渠道不存在')
+                        continue
+                    try:
+                        q.put_nowait((delivery_id, message, attempts))
+                        RETRIES.inc(channel)
+                    except queue.Full:
+                        self.outbox.defer(delivery_id, channel, self.poll_interval)
+            except Exception as e:
+                self.logger.error(f'读取重试队列失败: {str(e)}')
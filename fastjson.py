@@ -0,0 +1,61 @@
+"""JSON编解码：安装了orjson时用orjson编码，否则使用标准库json
+
+编码是热路径上的主要开销（存储、日志、搜索、推送、发件箱），orjson比标准库快数倍；
+orjson不支持的对象（超过64位的整数、非字符串键等）自动退回标准库。
+解码仍使用标准库：orjson会把超过64位的整数解析为浮点数，而对以文本为主的消息两者速度相当。
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_orjson = orjson
+
+def set_backend(name='auto'):
+    """选择后端：auto（有orjson时使用）、orjson或json，返回实际使用的后端名"""
+    global _orjson
+    if name == 'json':
+        _orjson = None
+    else:
+        _orjson = orjson
+    return backend()
+
+def backend():
+    return 'orjson' if _orjson is not None else 'json'
+
+def loads(data):
+    """解析str或bytes"""
+    return json.loads(data)
+
+def dumps_bytes(obj, sort_keys=False):
+    """编码为UTF-8字节串（不转义非ASCII字符）
+
+    字符串中的孤立代理项（例如合法JSON "\\ud800" 解析出的值）无法编码为UTF-8，
+    写成\\uXXXX转义，解析后与原值相同。
+    """
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj, option=_orjson.OPT_SORT_KEYS if sort_keys else 0)
+        except TypeError:
+            # orjson不支持的对象，以及含孤立代理项的字符串
+            pass
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys).encode('utf-8', 'backslashreplace')
+
+def dumps(obj, sort_keys=False):
+    """编码为字符串（不转义非ASCII字符），结果总能编码为UTF-8"""
+    return dumps_bytes(obj, sort_keys).decode('utf-8')
+
+def pretty(obj):
+    """缩进2格的可读格式"""
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj, option=_orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+def join_object(items):
+    """用已编码的值拼接JSON对象（UTF-8字节串）：items为[(键, 值编码后的字节串)]，避免重复编码大字段"""
+    return b'{' + b', '.join(b'"' + key.encode() + b'": ' + value for key, value in items) + b'}'
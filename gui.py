@@ -1,29 +1,203 @@
-import os
 import tkinter as tk
 from tkinter import ttk
-import json
+import bisect
+import time
+import threading
+from collections import namedtuple, deque
 from datetime import datetime
-import logging
+from config import get_config
+from store import get_store
+from message import unwrap_message
+import fastjson
+from search import get_search_index, parse_time
+from metrics import DROPPED
+
+# 消息列表中的一行：只保存显示所需的数据，控件按需创建和复用
+MessageRow = namedtuple('MessageRow', ['ts', 'timestamp', 'message', 'text_from', 'is_left', 'lines', 'width'])
+
+class MessageBubble:
+    """可复用的消息气泡，滚动时重新绑定到不同的消息"""
+
+    def __init__(self, gui, parent):
+        self.gui = gui
+        self.is_left = None
+
+        self.frame = tk.Frame(parent, bg="#ededed")
+
+        # 时间戳
+        time_frame = tk.Frame(self.frame, bg="#ededed")
+        time_frame.pack(fill=tk.X, pady=(5, 0))
+        self.time_label = tk.Label(
+            time_frame,
+            font=("Microsoft YaHei UI", 10),
+            fg="#999999",
+            bg="#ededed"
+        )
+        self.time_label.pack(anchor="center", pady=(5, 0))
+
+        # 消息气泡
+        self.bubble_frame = tk.Frame(self.frame, bg="#ededed")
+        self.bubble_frame.pack(fill=tk.X, pady=(2, 7))
+
+        # 昵称
+        self.name_label = tk.Label(
+            self.bubble_frame,
+            font=("Microsoft YaHei UI", 10),
+            fg="#666666",
+            bg="#ededed"
+        )
+
+        self.message_frame = tk.Frame(
+            self.bubble_frame,
+            padx=8,
+            pady=6,
+        )
+
+        self.message_text = tk.Text(
+            self.message_frame,
+            font=("Microsoft YaHei UI", 11),
+            fg="#000000",
+            wrap=tk.WORD,
+            relief="flat",
+            borderwidth=0,
+            highlightthickness=0,
+            cursor="arrow",
+            height=1,
+            width=1,
+            padx=2,
+            pady=2
+        )
+        self.message_text.pack(expand=True, fill=tk.BOTH)
+
+        # 右键菜单
+        self.menu = tk.Menu(self.message_frame, tearoff=0)
+        self.menu.add_command(label="全选", command=self.select_all, accelerator="Ctrl+A")
+        self.menu.add_command(label="复制", command=self.copy_text, accelerator="Ctrl+C")
+
+        self.message_text.bind("<Button-3>", lambda e: self.menu.post(e.x_root, e.y_root))
+        self.message_text.bind("<Control-c>", lambda e: self.copy_text())
+        self.message_text.bind("<Control-a>", lambda e: self.select_all())
+        self.message_text.bind("<Enter>", lambda e: self.message_text.configure(cursor="ibeam"))
+        self.message_text.bind("<Leave>", lambda e: self.message_text.configure(cursor="arrow"))
+
+        # 头像
+        self.avatar = tk.Label(
+            self.bubble_frame,
+            text="Y",
+            font=("Microsoft YaHei UI", 12, "bold"),
+            fg="#ffffff",
+            bg="#1aad19",
+            width=2,
+            height=1
+        )
+
+        self.left_space = tk.Frame(self.bubble_frame, bg="#ededed", width=50)
+        self.right_space = tk.Frame(self.bubble_frame, bg="#ededed", width=50)
+
+    def show(self, row):
+        """把气泡内容切换为指定消息"""
+        self.time_label.configure(text=row.timestamp)
+        self.name_label.configure(text=row.text_from)
+
+        bubble_bg = "#ffffff" if row.is_left else "#95ec69"
+        self.message_frame.configure(bg=bubble_bg)
+        self.message_text.configure(state="normal", bg=bubble_bg)
+        self.message_text.delete("1.0", tk.END)
+        self.message_text.insert("1.0", row.message)
+        self.message_text.configure(state="disabled", width=row.width, height=row.lines)
+
+        if row.is_left != self.is_left:
+            self.layout(row.is_left)
+
+    def layout(self, is_left):
+        """左右两侧的消息布局不同，方向变化时重新排列"""
+        for widget in (self.name_label, self.left_space, self.avatar, self.message_frame, self.right_space):
+            widget.pack_forget()
+        if is_left:
+            self.name_label.pack(anchor="w", padx=(93, 0), pady=(0, 1))
+            self.left_space.pack(side=tk.LEFT, padx=(0, 10))
+            self.avatar.pack(side=tk.LEFT, padx=(0, 10))
+            self.message_frame.pack(side=tk.LEFT, anchor="w")
+            self.right_space.pack(side=tk.RIGHT, fill=tk.X, expand=True)
+        else:
+            self.name_label.pack(anchor="e", padx=(0, 93), pady=(0, 1))
+            self.right_space.pack(side=tk.RIGHT, padx=(10, 0))
+            self.avatar.pack(side=tk.RIGHT, padx=(10, 0))
+            self.message_frame.pack(side=tk.RIGHT, anchor="e")
+            self.left_space.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.is_left = is_left
+
+    def copy_text(self):
+        widget = self.message_text
+        widget.configure(state="normal")
+        if not widget.tag_ranges("sel"):
+            widget.tag_add("sel", "1.0", "end")
+        widget.event_generate("<<Copy>>")
+        widget.tag_remove("sel", "1.0", "end")
+        widget.configure(state="disabled")
+        self.gui.show_copy_tooltip(widget)
+
+    def select_all(self):
+        widget = self.message_text
+        widget.configure(state="normal")
+        widget.tag_add("sel", "1.0", "end")
+        widget.configure(state="disabled")
 
 class WebhookGUI:
     def __init__(self, logger):
         self.logger = logger
+        self.started = time.perf_counter()
         self.root = tk.Tk()
         self.root.title("Webhook 消息接收器")
-        self.root.geometry("1000x700")
+        config = get_config()
+        self.root.geometry(f"{config.window_width}x{config.window_height}")
         self.root.configure(bg="#ededed")
-        
+
         self.message_position = True
         self.message_count = 0
-        
+
+        # 虚拟列表：内存中最多保留max_messages条消息，只为可见区域（加上下预留）创建气泡控件
+        # 至少保留2条：淘汰时要留下至少一行作为新的顶部
+        self.max_messages = max(2, config.parser.getint('gui', 'max_messages', fallback=5000))
+        self.overscan = config.parser.getint('gui', 'overscan', fallback=3)
+        self.rows = []
+        self.tops = []  # 每行在画布中的起始y坐标
+        self.total_height = 0
+        self.active = {}  # 行号 -> (气泡, 画布对象id)
+        self.pool = []  # 空闲的(气泡, 画布对象id)
+        self.rendering = False
+
+        # 其他线程提交的消息先进入缓冲区，Tk主循环每frame_interval毫秒批量取出
+        self.frame_interval = config.parser.getint('gui', 'frame_interval', fallback=50)
+        self.max_backlog = config.parser.getint('gui', 'max_backlog', fallback=500)
+        self.ingest = deque()
+        self.ingest_lock = threading.Lock()
+        self.collapsed = 0
+
+        # 历史消息在后台线程中从新到旧分页读取，滚动到顶部时加载更早的一页
+        self.history_page_size = config.parser.getint('gui', 'history_page_size', fallback=200)
+        self.history_before = time.time()  # 下一页读取早于该时间的消息
+        self.history_pages = deque()
+        self.history_loading = False
+        self.history_done = False
+        self.first_paint = None
+
+        # 搜索：查询在后台线程中执行，结果由drain_ingest显示到搜索窗口
+        self.search_results = deque()
+        self.search_window = None
+        self.search_params = None
+        self.search_cursor = None
+
         self.setup_ui()
-        self.root.after(0, self.load_today_logs)
+        self.measure_rows()
+        self.load_history_page()
+        self.root.after(self.frame_interval, self.drain_ingest)
 
     def setup_ui(self):
         # 顶部工具栏
         toolbar = tk.Frame(self.root, bg="#f6f6f6", height=50)
         toolbar.pack(fill=tk.X)
-        
+
         title_label = tk.Label(
             toolbar,
             text="Webhook 消息接收器",
@@ -32,24 +206,29 @@ class WebhookGUI:
             fg="#000000"
         )
         title_label.pack(side=tk.LEFT, padx=20, pady=10)
-        
+
+        # 搜索框：关键词以空格分隔，可用from:来源、since:/until:日期时间筛选
+        search_button = tk.Button(toolbar, text="搜索", command=self.start_search,
+                                  font=("Microsoft YaHei UI", 10), relief=tk.FLAT, bg="#e0e0e0")
+        search_button.pack(side=tk.RIGHT, padx=(0, 20), pady=10)
+        self.search_entry = tk.Entry(toolbar, width=30, font=("Microsoft YaHei UI", 10))
+        self.search_entry.pack(side=tk.RIGHT, padx=5, pady=10)
+        self.search_entry.bind("<Return>", lambda event: self.start_search())
+
         # 消息显示区域
         self.messages_frame = tk.Frame(self.root, bg="#ededed")
         self.messages_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
+
         self.canvas = tk.Canvas(self.messages_frame, bg="#ededed", highlightthickness=0)
         self.scrollbar = ttk.Scrollbar(self.messages_frame, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = tk.Frame(self.canvas, bg="#ededed")
-        
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+
+        self.canvas.configure(yscrollcommand=self.on_scroll, yscrollincrement=20)
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.canvas_frame = self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw", width=self.canvas.winfo_reqwidth())
-        
-        self.scrollable_frame.bind("<Configure>", self.on_frame_configure)
+
         self.canvas.bind("<Configure>", self.on_canvas_configure)
         self.canvas.bind_all("<MouseWheel>", self.on_mousewheel)
-        
+
         # 状态栏
         self.status_bar = tk.Label(
             self.root,
@@ -62,180 +241,262 @@ class WebhookGUI:
         )
         self.status_bar.pack(fill=tk.X, padx=10, pady=8)
 
-    def on_frame_configure(self, event=None):
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+    def measure_rows(self):
+        """用一个气泡实测1行和2行消息的高度，之后每行高度按行数直接计算"""
+        bubble, item = self.acquire_bubble()
+        heights = []
+        for lines in (1, 2):
+            bubble.show(MessageRow(0, "00:00:00", "\n".join(["Y"] * lines), "Y", True, lines, 10))
+            self.root.update_idletasks()
+            heights.append(bubble.frame.winfo_reqheight())
+        self.line_height = heights[1] - heights[0]
+        self.base_height = heights[0] - self.line_height
+        self.release_bubble(bubble, item)
+
+    def row_height(self, row):
+        return self.base_height + self.line_height * row.lines
+
+    def acquire_bubble(self):
+        if self.pool:
+            bubble, item = self.pool.pop()
+            self.canvas.itemconfigure(item, state="normal")
+            return bubble, item
+        bubble = MessageBubble(self, self.canvas)
+        item = self.canvas.create_window(10, 0, window=bubble.frame, anchor="nw",
+                                         width=max(1, self.canvas.winfo_width() - 20))
+        return bubble, item
+
+    def release_bubble(self, bubble, item):
+        self.canvas.itemconfigure(item, state="hidden")
+        self.pool.append((bubble, item))
+
+    def release_all(self):
+        for bubble, item in self.active.values():
+            self.release_bubble(bubble, item)
+        self.active.clear()
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.render_visible()
+        # 滚动到顶部时加载更早的历史消息
+        if float(first) <= 0.0 and self.first_paint is not None:
+            self.load_history_page()
 
     def on_canvas_configure(self, event):
-        self.canvas.itemconfig(self.canvas_frame, width=event.width)
+        for _, item in list(self.active.values()) + self.pool:
+            self.canvas.itemconfigure(item, width=max(1, event.width - 20))
+        self.render_visible()
 
     def on_mousewheel(self, event):
         self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
 
-    def load_today_logs(self):
+    def render_visible(self):
+        """只为可见区域及上下overscan条消息绑定气泡，其余气泡回收复用"""
+        if self.rendering:
+            return
+        self.rendering = True
         try:
-            log_file = f"logs/{datetime.now().strftime('%Y-%m-%d')}.log"
-            if os.path.exists(log_file):
-                with open(log_file, 'r', encoding='gb2312') as f:
-                    for line in f:
-                        try:
-                            if line.startswith('['):
-                                timestamp = line[1:20]
-                                message = line[22:].strip()
-                                try:
-                                    msg_json = json.loads(message)
-                                    message = json.dumps(msg_json, ensure_ascii=False, indent=2)
-                                    message = message.replace('\\n', '\n')
-                                except:
-                                    pass
-                                dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-                                display_time = dt.strftime('%H:%M:%S')
-                                self.display_message(message, custom_timestamp=display_time)
-                                self.message_position = not self.message_position
-                        except Exception as e:
-                            self.logger.error(f"解析日志行失败: {e}")
-                            continue
+            if not self.rows:
+                self.release_all()
+                return
+            y0 = self.canvas.canvasy(0)
+            y1 = y0 + self.canvas.winfo_height()
+            first = max(0, bisect.bisect_right(self.tops, y0) - 1 - self.overscan)
+            last = min(len(self.rows), bisect.bisect_left(self.tops, y1) + self.overscan)
+            wanted = range(first, last)
+
+            for index in [i for i in self.active if i not in wanted]:
+                self.release_bubble(*self.active.pop(index))
+            for index in wanted:
+                if index not in self.active:
+                    bubble, item = self.acquire_bubble()
+                    bubble.show(self.rows[index])
+                    self.canvas.coords(item, 10, self.tops[index])
+                    self.active[index] = (bubble, item)
+        finally:
+            self.rendering = False
+
+    def append_row(self, row):
+        """在列表末尾追加一行，超过内存上限时成批淘汰最早的消息"""
+        self.rows.append(row)
+        self.tops.append(self.total_height)
+        self.total_height += self.row_height(row)
+
+        if len(self.rows) > self.max_messages:
+            drop = len(self.rows) - self.max_messages + max(1, self.max_messages // 10)
+            shift = self.tops[drop]
+            del self.rows[:drop]
+            self.tops = [top - shift for top in self.tops[drop:]]
+            self.total_height -= shift
+            # 被淘汰的消息可以再次从消息存储分页加载
+            self.history_before = max(self.history_before, self.rows[0].ts)
+            self.history_done = False
+            # 行号整体前移，已绑定的气泡全部重新绑定，并保持当前视图位置不变
+            self.release_all()
+            view_top = max(0, self.canvas.canvasy(0) - shift)
+            self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), self.total_height))
+            self.canvas.yview_moveto(view_top / max(1, self.total_height))
+
+    def prepend_rows(self, rows):
+        """在列表开头插入一批更早的消息，保持当前看到的内容不动"""
+        heights = [self.row_height(row) for row in rows]
+        added = sum(heights)
+        tops = []
+        y = 0
+        for height in heights:
+            tops.append(y)
+            y += height
+        view_top = self.canvas.canvasy(0)
+        self.rows[:0] = rows
+        self.tops = tops + [top + added for top in self.tops]
+        self.total_height += added
+        # 行号整体后移，已绑定的气泡全部重新绑定
+        self.release_all()
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), self.total_height))
+        self.canvas.yview_moveto((view_top + added) / max(1, self.total_height))
+        self.render_visible()
+
+    def load_history_page(self):
+        """在后台线程中读取一页更早的历史消息，读取结果由drain_ingest插入界面"""
+        if self.history_loading or self.history_done:
+            return
+        if len(self.rows) >= self.max_messages:
+            return
+        self.history_loading = True
+        before = self.history_before
+        count = min(self.history_page_size, self.max_messages - len(self.rows))
+
+        def worker():
+            try:
+                records = get_store().before(before, count)
+            except Exception as e:
+                self.logger.error(f"读取历史消息失败: {e}")
+                records = []
+            self.history_pages.append((records, count))
+        threading.Thread(target=worker, name='gui-history', daemon=True).start()
+
+    def apply_history_page(self, records, count):
+        """把后台读取的一页历史消息插入列表开头"""
+        self.history_loading = False
+        if len(records) < count:
+            self.history_done = True
+        if records:
+            self.history_before = records[0]['ts']
+            # 与已有的第一条消息左右交替
+            is_left = not self.rows[0].is_left if self.rows else not self.message_position
+            rows = []
+            for record in reversed(records):
+                try:
+                    display_time = datetime.fromtimestamp(record['ts']).strftime('%H:%M:%S')
+                    message = self.normalize_message(record['payload'])
+                    rows.append(self.make_row(message, display_time, is_left,
+                                              record.get('text_from') or "aYYbsYYa", record['ts']))
+                    is_left = not is_left
+                except Exception as e:
+                    self.logger.error(f"解析历史消息失败: {e}")
+            rows.reverse()
+            self.message_count += len(rows)
+            self.prepend_rows(rows)
+
+        if self.first_paint is None:
+            # 首屏：滚动到最新消息并记录启动到首次显示的耗时
+            self.refresh_view()
+            self.root.update_idletasks()
+            self.first_paint = (time.perf_counter() - self.started) * 1000
+            self.status_bar.config(text=f"已加载 {self.message_count} 条消息 · 首屏耗时 {self.first_paint:.0f} ms")
+            self.logger.debug(f"GUI首屏耗时 {self.first_paint:.0f} ms")
+
+    def parse_search(self, text):
+        """解析搜索框内容，返回查询参数"""
+        params = {'query': [], 'text_from': None, 'since': None, 'until': None}
+        for token in text.split():
+            name, _, value = token.partition(':')
+            if value and name in ('from', 'since', 'until'):
+                if name == 'from':
+                    params['text_from'] = value
+                else:
+                    params[name] = parse_time(value)
             else:
-                self.logger.warning(f"日志文件不存在: {log_file}")
-        except Exception as e:
-            self.logger.error(f"读取日志文件失败: {e}")
-
-    def create_message_bubble(self, message, timestamp, is_left=True, text_from="aYYbsYYa"):
-        msg_frame = tk.Frame(self.scrollable_frame, bg="#ededed")
-        msg_frame.pack(fill=tk.X, padx=10, pady=5)
-        
-        # 时间戳
-        time_frame = tk.Frame(msg_frame, bg="#ededed")
-        time_frame.pack(fill=tk.X)
-        time_label = tk.Label(
-            time_frame,
-            text=timestamp,
-            font=("Microsoft YaHei UI", 10),
-            fg="#999999",
-            bg="#ededed"
-        )
-        time_label.pack(anchor="center", pady=(5, 0))
-        
-        # 消息气泡
-        bubble_frame = tk.Frame(msg_frame, bg="#ededed")
-        bubble_frame.pack(fill=tk.X, pady=2)
-        
-        # 昵称
-        name_label = tk.Label(
-            bubble_frame,
-            text=text_from,
-            font=("Microsoft YaHei UI", 10),
-            fg="#666666",
-            bg="#ededed"
-        )
-        if is_left:
-            name_label.pack(anchor="w", padx=(93, 0), pady=(0, 1))
-        else:
-            name_label.pack(anchor="e", padx=(0, 93), pady=(0, 1))
-        
-        bubble_bg = "#ffffff" if is_left else "#95ec69"
-        message_frame = tk.Frame(
-            bubble_frame,
-            bg=bubble_bg,
-            padx=8,
-            pady=6,
-        )
-        
-        message_text = tk.Text(
-            message_frame,
-            font=("Microsoft YaHei UI", 11),
-            bg=bubble_bg,
-            fg="#000000",
-            wrap=tk.WORD,
-            relief="flat",
-            borderwidth=0,
-            highlightthickness=0,
-            cursor="arrow",
-            height=1,
-            width=1,
-            padx=2,
-            pady=2
-        )
-        
-        message_text.insert("1.0", message)
-        message_text.configure(state="disabled")
-        
+                params['query'].append(token)
+        params['query'] = ' '.join(params['query'])
+        return params
+
+    def start_search(self, more=False):
+        """开始新的搜索，more为True时加载下一页"""
+        index = get_search_index(self.logger)
+        if index is None:
+            self.status_bar.config(text="搜索未启用（config.ini中[search] enabled）")
+            return
+        if not more:
+            text = self.search_entry.get().strip()
+            if not text:
+                return
+            try:
+                self.search_params = self.parse_search(text)
+            except ValueError:
+                self.status_bar.config(text="时间格式错误，请使用YYYY-MM-DD或YYYY-MM-DDTHH:MM:SS")
+                return
+            self.search_cursor = None
+        params = dict(self.search_params, cursor=self.search_cursor)
+
+        def worker():
+            started = time.perf_counter()
+            try:
+                results, cursor = index.search(limit=100, **params)
+            except Exception as e:
+                self.logger.error(f"搜索失败: {e}")
+                results, cursor = [], None
+            self.search_results.append((results, cursor, more, (time.perf_counter() - started) * 1000))
+        threading.Thread(target=worker, name='gui-search', daemon=True).start()
+
+    def show_search_results(self, results, cursor, more, elapsed):
+        """在搜索窗口中显示一页结果"""
+        self.search_cursor = cursor
+        if self.search_window is None or not self.search_window.winfo_exists():
+            window = tk.Toplevel(self.root)
+            window.title("搜索结果")
+            window.geometry("700x500")
+            text = tk.Text(window, wrap=tk.WORD, font=("Microsoft YaHei UI", 10), state="disabled")
+            scrollbar = ttk.Scrollbar(window, orient="vertical", command=text.yview)
+            text.configure(yscrollcommand=scrollbar.set)
+            footer = tk.Frame(window)
+            footer.pack(side=tk.BOTTOM, fill=tk.X)
+            window.more_button = tk.Button(footer, text="加载更多", command=lambda: self.start_search(more=True))
+            window.more_button.pack(side=tk.RIGHT, padx=10, pady=5)
+            window.summary = tk.Label(footer, anchor=tk.W)
+            window.summary.pack(side=tk.LEFT, fill=tk.X, padx=10)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            text.pack(fill=tk.BOTH, expand=True)
+            window.text = text
+            window.count = 0
+            self.search_window = window
+        window = self.search_window
+        text = window.text
+        text.configure(state="normal")
+        if not more:
+            text.delete("1.0", tk.END)
+            window.count = 0
+        for record in results:
+            timestamp = datetime.fromtimestamp(record['ts']).strftime('%Y-%m-%d %H:%M:%S')
+            text.insert(tk.END, f"[{timestamp}] {record['text_from']}\n{self.normalize_message(record['payload'])}\n\n")
+        text.configure(state="disabled")
+        window.count += len(results)
+        window.more_button.configure(state="normal" if cursor else "disabled")
+        window.summary.configure(text=f"已显示 {window.count} 条结果 · 查询耗时 {elapsed:.1f} ms")
+        window.lift()
+
+    def make_row(self, message, timestamp, is_left=True, text_from="aYYbsYYa", ts=None):
         # 计算合适的大小
         lines = message.split('\n')
         width = min(max(len(line) for line in lines) + 4, 50)
         height = min(len(lines), 20)
-        message_text.configure(width=width, height=height)
-        
-        # 右键菜单
-        menu = tk.Menu(message_frame, tearoff=0)
-        
-        def show_menu(event):
-            menu.delete(0, tk.END)
-            menu.add_command(
-                label="全选",
-                command=lambda: select_all(message_text),
-                accelerator="Ctrl+A"
-            )
-            menu.add_command(
-                label="复制",
-                command=lambda: copy_text(message_text),
-                accelerator="Ctrl+C"
-            )
-            menu.post(event.x_root, event.y_root)
-            
-        def copy_text(widget):
-            widget.configure(state="normal")
-            if not widget.tag_ranges("sel"):
-                widget.tag_add("sel", "1.0", "end")
-            widget.event_generate("<<Copy>>")
-            widget.tag_remove("sel", "1.0", "end")
-            widget.configure(state="disabled")
-            self.show_copy_tooltip(widget)
-            
-        def select_all(widget):
-            widget.configure(state="normal")
-            widget.tag_add("sel", "1.0", "end")
-            widget.configure(state="disabled")
-            
-        message_text.bind("<Button-3>", show_menu)
-        message_text.bind("<Control-c>", lambda e: copy_text(message_text))
-        message_text.bind("<Control-a>", lambda e: select_all(message_text))
-        message_text.bind("<Enter>", lambda e: message_text.configure(cursor="ibeam"))
-        message_text.bind("<Leave>", lambda e: message_text.configure(cursor="arrow"))
-        
-        message_text.pack(expand=True, fill=tk.BOTH)
-        
-        # 头像
-        avatar = tk.Label(
-            bubble_frame,
-            text="Y",
-            font=("Microsoft YaHei UI", 12, "bold"),
-            fg="#ffffff",
-            bg="#1aad19",
-            width=2,
-            height=1
-        )
-        
-        left_space = tk.Frame(bubble_frame, bg="#ededed", width=50)
-        right_space = tk.Frame(bubble_frame, bg="#ededed", width=50)
-        
-        if is_left:
-            left_space.pack(side=tk.LEFT, padx=(0, 10))
-            avatar.pack(side=tk.LEFT, padx=(0, 10))
-            message_frame.pack(side=tk.LEFT, anchor="w")
-            right_space.pack(side=tk.RIGHT, fill=tk.X, expand=True)
-        else:
-            right_space.pack(side=tk.RIGHT, padx=(10, 0))
-            avatar.pack(side=tk.RIGHT, padx=(10, 0))
-            message_frame.pack(side=tk.RIGHT, anchor="e")
-            left_space.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        
-        return msg_frame
+        return MessageRow(ts or time.time(), timestamp, message, text_from, is_left, height, width)
 
     def show_copy_tooltip(self, widget):
         tooltip = tk.Toplevel()
         tooltip.overrideredirect(True)
         tooltip.attributes('-topmost', True)
-        
+
         label = tk.Label(
             tooltip,
             text="已复制",
@@ -246,34 +507,73 @@ class WebhookGUI:
             pady=5
         )
         label.pack()
-        
+
         x = widget.winfo_rootx() + widget.winfo_width() // 2 - label.winfo_reqwidth() // 2
         y = widget.winfo_rooty() - 30
         tooltip.geometry(f"+{x}+{y}")
         self.root.after(1000, tooltip.destroy)
-        
-    def display_message(self, message, custom_timestamp=None, text_from="aYYbsYYa"):
-        timestamp = custom_timestamp if custom_timestamp else datetime.now().strftime('%H:%M:%S')
-        
-        if isinstance(message, str):
-            try:
-                parsed = json.loads(message)
-                if isinstance(parsed, str):
-                    message = parsed
-            except:
-                pass
-                
+
+    def post_message(self, message, text_from="aYYbsYYa"):
+        """供其他线程调用：放入接收缓冲区，由Tk主循环按帧批量显示"""
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        with self.ingest_lock:
+            self.ingest.append((message, timestamp, text_from))
+            # 积压过多时丢弃最早的消息，界面上折叠显示丢弃条数
+            if len(self.ingest) > self.max_backlog:
+                self.ingest.popleft()
+                self.collapsed += 1
+                DROPPED.inc('gui')
+
+    def drain_ingest(self):
+        """每帧取出缓冲区中的全部消息，一次性插入并只刷新一次界面"""
+        try:
+            while self.history_pages:
+                self.apply_history_page(*self.history_pages.popleft())
+            while self.search_results:
+                self.show_search_results(*self.search_results.popleft())
+            with self.ingest_lock:
+                batch = list(self.ingest)
+                self.ingest.clear()
+                collapsed, self.collapsed = self.collapsed, 0
+            if collapsed:
+                self.add_message(f"消息过多，已折叠 {collapsed} 条消息（完整内容见消息存储）",
+                                 datetime.now().strftime('%H:%M:%S'), "系统")
+            for message, timestamp, text_from in batch:
+                try:
+                    self.add_message(message, timestamp, text_from)
+                except Exception as e:
+                    self.logger.error(f"GUI显示消息失败: {e}")
+            if batch or collapsed:
+                self.refresh_view()
+        finally:
+            self.root.after(self.frame_interval, self.drain_ingest)
+
+    def normalize_message(self, message):
+        message = unwrap_message(message)
+
         # 统一处理换行符
         if isinstance(message, str):
-            message = message.replace('\\n', '\n')
-        
-        msg_frame = self.create_message_bubble(message, timestamp, self.message_position, text_from)
-        
+            return message.replace('\\n', '\n')
+        return fastjson.pretty(message)
+
+    def add_message(self, message, timestamp, text_from="aYYbsYYa"):
+        """追加一条消息（不刷新界面），左右位置交替"""
+        message = self.normalize_message(message)
+        self.append_row(self.make_row(message, timestamp, self.message_position, text_from))
+        self.message_position = not self.message_position
         self.message_count += 1
+
+    def refresh_view(self):
+        """更新滚动区域和状态栏，滚动到底部并重新渲染可见区域"""
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), self.total_height))
         self.status_bar.config(text=f"收到新消息 · 共 {self.message_count} 条消息")
-        
-        self.root.update_idletasks()
         self.canvas.yview_moveto(1.0)
+        self.render_visible()
+
+    def display_message(self, message, custom_timestamp=None, text_from="aYYbsYYa"):
+        timestamp = custom_timestamp if custom_timestamp else datetime.now().strftime('%H:%M:%S')
+        self.add_message(message, timestamp, text_from)
+        self.refresh_view()
 
     def run(self):
         self.root.mainloop()
@@ -1,27 +1,40 @@
 import os
-import json
+import queue
+import atexit
 import logging
+import logging.handlers
 from datetime import datetime
+from config import get_config
 
 class DailyRotatingFileHandler(logging.FileHandler):
-    def __init__(self, filename_pattern, encoding):
+    """按日期切换文件的日志处理器，写入不逐条flush，由QueueListener每批统一flush"""
+
+    def __init__(self, filename_pattern, encoding, errors=None):
         self.filename_pattern = filename_pattern
         self.current_date = datetime.now().date()
         filename = self.get_current_filename()
-        super().__init__(filename, encoding=encoding)
-        
+        super().__init__(filename, encoding=encoding, errors=errors)
+
     def get_current_filename(self):
         return self.filename_pattern.format(self.current_date.strftime('%Y-%m-%d'))
-    
+
     def emit(self, record):
-        current_date = datetime.now().date()
-        if current_date != self.current_date:
-            # 日期已变更，切换到新的日志文件
-            self.close()
-            self.current_date = current_date
-            self.baseFilename = self.get_current_filename()
-            self.stream = self._open()
-        super().emit(record)
+        try:
+            current_date = datetime.now().date()
+            if current_date != self.current_date:
+                # 日期已变更，切换到新的日志文件
+                self.close()
+                self.current_date = current_date
+                self.baseFilename = self.get_current_filename()
+                self.stream = self._open()
+            msg = self.format(record)
+            if not msg:
+                return
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg + self.terminator)
+        except Exception:
+            self.handleError(record)
 
 class CustomFormatter(logging.Formatter):
     def format(self, record):
@@ -30,27 +43,69 @@ class CustomFormatter(logging.Formatter):
             # 使用简化的时间格式
             dt = datetime.fromtimestamp(record.created)
             timestamp = dt.strftime('%Y-%m-%d %H:%M:%S')
-            try:
-                # 尝试解析消息为JSON格式
-                msg = json.loads(record.msg)
-                formatted_msg = json.dumps(msg, ensure_ascii=False, indent=2)
-            except:
-                formatted_msg = record.msg
-            return f"[{timestamp}] {formatted_msg}"
+            # 消息内容在请求线程中已编码为JSON，这里不再重复解析
+            return f"[{timestamp}] {record.getMessage()}"
         return ""
 
+class BatchQueueListener(logging.handlers.QueueListener):
+    """在后台线程中批量处理日志记录，每批处理完（或队列暂时为空）时统一flush"""
+
+    def __init__(self, queue, *handlers, batch_size=500):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, 'task_done')
+        while True:
+            record = self.dequeue(True)
+            stop = record is self._sentinel
+            count = 0
+            while not stop:
+                self.handle(record)
+                if has_task_done:
+                    q.task_done()
+                count += 1
+                if count >= self.batch_size:
+                    break
+                try:
+                    record = self.dequeue(False)
+                except queue.Empty:
+                    break
+                stop = record is self._sentinel
+            for handler in self.handlers:
+                handler.flush()
+            if stop:
+                if has_task_done:
+                    q.task_done()
+                break
+
+_listener = None
+
 def setup_logger():
-    # 确保logs目录存在
-    os.makedirs('logs', exist_ok=True)
-    
-    # 配置日志处理器
+    """配置webhook日志，可重复调用，只在第一次调用时添加处理器"""
+    global _listener
     logger = logging.getLogger('webhook')
+    if _listener is not None:
+        return logger
+
+    # 确保logs目录存在
+    log_dir = get_config().log_dir
+    os.makedirs(log_dir, exist_ok=True)
+
+    # 请求线程只把日志记录放入队列，格式化和写文件由后台线程完成
     logger.setLevel(logging.INFO)
-    handler = DailyRotatingFileHandler('logs/{}.log', encoding='gb2312')
+    # 可读日志使用gb2312，无法编码的字符替换为?（完整内容见消息存储）
+    handler = DailyRotatingFileHandler(os.path.join(log_dir, '{}.log'), encoding='gb2312', errors='replace')
     handler.setFormatter(CustomFormatter())
-    logger.addHandler(handler)
-    
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = BatchQueueListener(log_queue, handler)
+    _listener.start()
+    # 退出前写完队列中剩余的日志
+    atexit.register(_listener.stop)
+
     # 禁用Flask默认日志
     logging.getLogger('werkzeug').disabled = True
-    
+
     return logger
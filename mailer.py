@@ -0,0 +1,177 @@
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from email.message import EmailMessage
+from metrics import STAGE_SECONDS
+
+class SMTPPool:
+    """复用已认证SMTP连接的连接池，空闲过久的连接取用前先NOOP探活，失败则重连"""
+
+    def __init__(self, host, port, username, password, sender, recipients,
+                 pool_size=2, keepalive=60.0, timeout=10.0, starttls=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.recipients = recipients
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.starttls = starttls
+        # 空闲连接：(SMTP对象, 最后使用时间)
+        self.idle = queue.LifoQueue(maxsize=pool_size)
+
+    @classmethod
+    def from_section(cls, section):
+        """根据配置节（[email]或type = email的渠道）创建连接池，配置不完整时返回None"""
+        fields = [section.get(k, '') for k in ('host', 'port', 'username', 'password', 'from', 'to')]
+        if not all(fields):
+            return None
+        return cls(
+            section['host'], section.getint('port'),
+            section['username'], section['password'],
+            section['from'], [addr.strip() for addr in section['to'].split(',') if addr.strip()],
+            pool_size=section.getint('pool_size', fallback=2),
+            keepalive=section.getfloat('keepalive', fallback=60.0),
+            timeout=section.getfloat('timeout', fallback=10.0),
+            starttls=section.getboolean('starttls', fallback=True)
+        )
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _acquire(self):
+        while True:
+            try:
+                server, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < self.keepalive:
+                return server
+            # 空闲过久，先探活
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._discard(server)
+
+    def _release(self, server):
+        try:
+            self.idle.put_nowait((server, time.monotonic()))
+        except queue.Full:
+            self._discard(server)
+
+    def _discard(self, server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def check(self):
+        """健康探测：新建连接并登录，成功后放入连接池复用"""
+        server = self._connect()
+        self._release(server)
+        return True
+
+    def send(self, subject, body):
+        """发送一封邮件，连接失效时换新连接重试一次"""
+        msg = EmailMessage()
+        msg['Subject'] = subject
+        msg['From'] = self.sender
+        msg['To'] = ', '.join(self.recipients)
+        msg.set_content(body)
+
+        with STAGE_SECONDS.time('smtp'):
+            for attempt in range(2):
+                server = self._acquire()
+                try:
+                    server.send_message(msg)
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPSenderRefused, OSError):
+                    self._discard(server)
+                    if attempt == 1:
+                        raise
+                    continue
+                except Exception:
+                    self._discard(server)
+                    raise
+                self._release(server)
+                return
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(server)
+
+class EmailDigest:
+    """摘要模式：把一个时间窗口内或累计到max_messages条的消息合并为一封邮件
+
+    每条消息对应一个Future，摘要邮件发出后才完成（发送失败时带异常），
+    投递队列据此确认或重试，缓冲中的消息在发件箱中保持pending，重启后会重放。
+    """
+
+    def __init__(self, pool, logger, window=60.0, max_messages=50):
+        self.pool = pool
+        self.logger = logger
+        self.window = window
+        self.max_messages = max_messages
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def add(self, message):
+        """加入摘要缓冲，返回摘要邮件发出后完成的Future"""
+        future = Future()
+        batch = None
+        with self.lock:
+            self.buffer.append((datetime.now(), message, future))
+            if len(self.buffer) >= self.max_messages:
+                batch = self._take()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if batch:
+            self._send(batch)
+        return future
+
+    def flush(self):
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _take(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.buffer = self.buffer, []
+        return batch
+
+    def _send(self, batch):
+        body = '\n\n'.join(f"[{ts.strftime('%Y-%m-%d %H:%M:%S')}]\n{message}" for ts, message, _ in batch)
+        try:
+            self.pool.send(f'Webhook消息通知（{len(batch)}条）', body)
+        except Exception as e:
+            self.logger.error(f'摘要邮件发送失败（{len(batch)}条）: {str(e)}')
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for _, _, future in batch:
+            future.set_result(True)
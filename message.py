@@ -0,0 +1,120 @@
+import re
+import time
+import uuid
+import fastjson
+
+# 只有以引号开头的字符串才可能是JSON编码的字符串，其余直接跳过解析
+_QUOTED = re.compile(r'\s*"')
+
+def unwrap_message(message):
+    """显示/转发用的消息内容：JSON编码的字符串解开一层"""
+    if isinstance(message, str) and _QUOTED.match(message):
+        try:
+            parsed = fastjson.loads(message)
+            if isinstance(parsed, str):
+                return parsed
+        except ValueError:
+            pass
+    return message
+
+class MessageRecord:
+    """一条已接收的消息：请求体只解析一次，显示内容和各种序列化形式第一次用到时计算并缓存，
+    由消息存储、日志、搜索索引、实时推送、界面和转发渠道共享
+
+    兼容字典形式的记录（record['id']等），从存储读出的历史记录仍是普通字典。
+    """
+    __slots__ = ('id', 'ts', 'text_from', 'payload',
+                 '_display', '_payload_bytes', '_payload_json', '_display_bytes', '_text')
+
+    FIELDS = ('id', 'ts', 'text_from', 'payload')
+
+    def __init__(self, payload, text_from, msg_id=None, ts=None):
+        self.id = msg_id or uuid.uuid4().hex
+        self.ts = ts if ts is not None else time.time()
+        self.text_from = text_from
+        self.payload = payload
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def __reduce__(self):
+        # 跨进程传递时只带基本字段，缓存在接收方按需重新计算
+        return MessageRecord, (self.payload, self.text_from, self.id, self.ts)
+
+    # 缓存字段在第一次访问时赋值，未赋值的slot访问时抛出AttributeError
+    @property
+    def display(self):
+        """显示和转发用的消息内容（JSON编码的字符串已解开）"""
+        try:
+            return self._display
+        except AttributeError:
+            self._display = unwrap_message(self.payload)
+            return self._display
+
+    @property
+    def payload_bytes(self):
+        """原始消息的JSON（UTF-8字节串），存储和推送直接使用"""
+        try:
+            return self._payload_bytes
+        except AttributeError:
+            self._payload_bytes = fastjson.dumps_bytes(self.payload)
+            return self._payload_bytes
+
+    @property
+    def payload_json(self):
+        """原始消息的JSON文本，日志和搜索索引使用"""
+        try:
+            return self._payload_json
+        except AttributeError:
+            self._payload_json = self.payload_bytes.decode('utf-8')
+            return self._payload_json
+
+    @property
+    def display_bytes(self):
+        """显示内容的JSON（UTF-8字节串），未解开时与payload_bytes相同"""
+        try:
+            return self._display_bytes
+        except AttributeError:
+            display = self.display
+            self._display_bytes = self.payload_bytes if display is self.payload else fastjson.dumps_bytes(display)
+            return self._display_bytes
+
+    @property
+    def display_json(self):
+        """显示内容的JSON文本"""
+        if self.display is self.payload:
+            return self.payload_json
+        return self.display_bytes.decode('utf-8')
+
+    @property
+    def text(self):
+        """显示内容的文本形式：字符串原样，其他类型为缩进的JSON"""
+        try:
+            return self._text
+        except AttributeError:
+            display = self.display
+            self._text = display if isinstance(display, str) else fastjson.pretty(display)
+            return self._text
+
+    def line(self):
+        """消息存储中的一行（UTF-8 JSON），消息内容使用已编码的payload_json"""
+        return fastjson.join_object([
+            ('id', fastjson.dumps_bytes(self.id)),
+            ('ts', repr(self.ts).encode()),
+            ('text_from', fastjson.dumps_bytes(self.text_from)),
+            ('payload', self.payload_bytes)
+        ]) + b'\n'
+
+    def to_dict(self):
+        return {'id': self.id, 'ts': self.ts, 'text_from': self.text_from, 'payload': self.payload}
+
+def payload_json(record):
+    """记录中消息内容的JSON文本，MessageRecord直接使用缓存"""
+    if isinstance(record, MessageRecord):
+        return record.payload_json
+    return fastjson.dumps(record['payload'])
@@ -0,0 +1,136 @@
+import bisect
+import threading
+import time
+
+# 默认的耗时分桶（秒），覆盖从亚毫秒的本地操作到数秒的网络请求
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_gauge(name, help_text, samples, labels=()):
+    """按Prometheus文本格式输出抓取时计算的gauge，samples为[(标签值元组, 数值)]"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for values, value in samples:
+        lines.append(f'{name}{_format_labels(labels, values)} {value}')
+    return '\n'.join(lines)
+
+class Counter:
+    """只增的计数器，按标签值分别计数"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.values.items())
+        for values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labels, values)} {value}')
+        return '\n'.join(lines)
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+class Histogram:
+    """固定分桶的直方图，每次记录只做一次二分查找和几次加法"""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # 标签值 -> [各分桶计数..., 总和, 总数]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *label_values):
+        """用with语句记录一段代码的耗时"""
+        return _Timer(self, label_values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted((k, list(v)) for k, v in self.values.items())
+        for values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labels, values, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, values, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, values)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, values)} {series[-1]}')
+        return '\n'.join(lines)
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, *extra):
+        """输出全部指标，extra为抓取时计算的其他指标文本"""
+        return '\n'.join([m.render() for m in self.metrics] + list(extra)) + '\n'
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'webhook_http_requests_total', 'HTTP requests by endpoint and status code', ('endpoint', 'status')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'webhook_http_request_seconds', 'HTTP request latency by endpoint', ('endpoint',)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'webhook_stage_seconds', 'Time spent in each processing stage', ('stage',)))
+EXCEPTIONS = REGISTRY.register(Counter(
+    'webhook_exceptions_total', 'Unexpected exceptions by endpoint', ('endpoint',)))
+RATE_LIMITED = REGISTRY.register(Counter(
+    'webhook_rate_limited_total', 'Requests rejected by rate limiting', ('reason',)))
+DELIVERIES = REGISTRY.register(Counter(
+    'webhook_deliveries_total', 'Delivery attempts by channel and result', ('channel', 'result')))
+RETRIES = REGISTRY.register(Counter(
+    'webhook_delivery_retries_total', 'Deliveries requeued from the outbox for retry', ('channel',)))
+DROPPED = REGISTRY.register(Counter(
+    'webhook_dropped_messages_total', 'Messages dropped before delivery or display', ('where',)))
+STREAM_EVICTIONS = REGISTRY.register(Counter(
+    'webhook_stream_evictions_total', 'Stream subscribers disconnected for falling behind'))
+DEDUP_REPLAYED = REGISTRY.register(Counter(
+    'webhook_dedup_replayed_total', 'Duplicate requests answered from the dedup cache'))
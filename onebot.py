@@ -0,0 +1,59 @@
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import STAGE_SECONDS
+import fastjson
+
+class OneBotClient:
+    """长连接的OneBot v11 HTTP客户端，配置在创建时解析一次，连接由连接池复用"""
+
+    def __init__(self, url, access_token, target_qq, pool_size=10,
+                 connect_timeout=3.0, read_timeout=10.0):
+        self.base_url = url.rstrip('/')
+        self.endpoint = f"{self.base_url}/send_private_msg"
+        self.target_qq = int(target_qq)
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_section(cls, section):
+        """根据配置节（[onebot]或type = onebot的渠道）创建客户端，配置不完整时返回None"""
+        url = section.get('url', '')
+        token = section.get('access_token', '')
+        target_qq = section.get('target_qq', '')
+        if not all([url, token, target_qq]):
+            return None
+        return cls(
+            url, token, target_qq,
+            pool_size=section.getint('pool_size', fallback=10),
+            connect_timeout=section.getfloat('connect_timeout', fallback=3.0),
+            read_timeout=section.getfloat('read_timeout', fallback=10.0)
+        )
+
+    def send_private_msg(self, message):
+        """发送私聊消息，返回OneBot响应数据"""
+        with STAGE_SECONDS.time('onebot'):
+            response = self.session.post(
+                self.endpoint,
+                data=fastjson.dumps_bytes({
+                    "user_id": self.target_qq,
+                    "message": message
+                }),
+                timeout=self.timeout
+            )
+            return fastjson.loads(response.content)
+
+    def get_status(self):
+        """查询OneBot实现的运行状态（用于健康探测），返回OneBot响应数据"""
+        response = self.session.post(f"{self.base_url}/get_status", json={}, timeout=self.timeout)
+        return response.json()
+
+    def close(self):
+        self.session.close()
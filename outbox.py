@@ -0,0 +1,250 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+import fastjson
+
+class _Waiter:
+    """等待写线程提交的调用方：提交完成后设置done，失败时记录error"""
+    __slots__ = ('done', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+class Outbox:
+    """基于SQLite（WAL模式）的持久化发件箱，记录每条消息在各渠道的投递状态
+
+    写入由后台线程按批提交（group commit），多个并发的add()共享一次fsync。
+    投递成功超过done_ttl秒、进入死信超过dead_ttl秒的记录由写线程定期清除（0为不清除）。
+    """
+
+    def __init__(self, path, logger, max_retries=8, backoff_base=2.0, backoff_max=300.0,
+                 done_ttl=86400.0, dead_ttl=604800.0, purge_interval=600.0):
+        self.path = path
+        self.logger = logger
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.done_ttl = done_ttl
+        self.dead_ttl = dead_ttl
+        self.purge_interval = purge_interval
+        self.next_purge = time.monotonic()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.write_conn = self._connect()
+        self.write_conn.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                delivery_id TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                message TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL,
+                PRIMARY KEY (delivery_id, channel)
+            )
+        ''')
+        self.write_conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)')
+        self.write_conn.commit()
+
+        # 读连接与写线程分离，WAL模式下读写互不阻塞
+        self.read_conn = self._connect()
+        self.read_lock = threading.Lock()
+
+        self.pending = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.writer = threading.Thread(target=self._writer_loop, name='outbox-writer', daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _execute(self, sql, rows, wait=False):
+        """把写操作交给写线程，wait为True时等待其提交完成，写入失败时抛出对应的异常"""
+        waiter = _Waiter() if wait else None
+        with self.cond:
+            if self.closed:
+                raise RuntimeError('outbox已关闭')
+            self.pending.append((sql, rows, waiter))
+            self.cond.notify()
+        if waiter is not None:
+            waiter.done.wait()
+            if waiter.error is not None:
+                raise waiter.error
+
+    def _writer_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    if self.purge_interval > 0 and time.monotonic() >= self.next_purge:
+                        break
+                    timeout = self.next_purge - time.monotonic() if self.purge_interval > 0 else None
+                    self.cond.wait(timeout)
+                batch, self.pending = self.pending, []
+                closed = self.closed
+            if batch:
+                self._commit(batch)
+            elif closed:
+                return
+            if self.purge_interval > 0 and time.monotonic() >= self.next_purge:
+                self.next_purge = time.monotonic() + self.purge_interval
+                self._purge_expired()
+
+    def _commit(self, batch):
+        """在一个事务中提交整批写操作；失败时逐个单独提交，只有出错的写操作失败"""
+        try:
+            self.write_conn.execute('BEGIN')
+            for sql, rows, _ in batch:
+                self.write_conn.executemany(sql, rows)
+            self.write_conn.execute('COMMIT')
+        except Exception as e:
+            self._rollback()
+            if len(batch) == 1:
+                self._fail(batch[0], e)
+            else:
+                self.logger.warning(f'发件箱批量写入失败，逐条重试: {str(e)}')
+                for item in batch:
+                    try:
+                        self.write_conn.execute('BEGIN')
+                        self.write_conn.executemany(item[0], item[1])
+                        self.write_conn.execute('COMMIT')
+                    except Exception as e:
+                        self._rollback()
+                        self._fail(item, e)
+        for _, _, waiter in batch:
+            if waiter is not None:
+                waiter.done.set()
+
+    def _rollback(self):
+        try:
+            self.write_conn.execute('ROLLBACK')
+        except sqlite3.Error:
+            pass
+
+    def _fail(self, item, error):
+        self.logger.error(f'发件箱写入失败: {str(error)}')
+        if item[2] is not None:
+            item[2].error = error
+
+    def _purge_expired(self):
+        """清除过期的已完成记录和死信（在写线程中执行）"""
+        now = time.time()
+        try:
+            deleted = 0
+            if self.done_ttl > 0:
+                deleted += self.write_conn.execute(
+                    "DELETE FROM outbox WHERE status = 'done' AND next_attempt < ?",
+                    (now - self.done_ttl,)).rowcount
+            if self.dead_ttl > 0:
+                deleted += self.write_conn.execute(
+                    "DELETE FROM outbox WHERE status = 'dead' AND next_attempt < ?",
+                    (now - self.dead_ttl,)).rowcount
+            if deleted:
+                self.logger.info(f'发件箱清除{deleted}条过期记录')
+        except sqlite3.Error as e:
+            self.logger.error(f'清除发件箱过期记录失败: {str(e)}')
+
+    def add(self, delivery_id, channels, message, status='pending', encoded=None):
+        """持久化一条新消息（每个渠道一行），返回时已落盘；encoded为调用方已编码好的消息JSON"""
+        now = time.time()
+        payload = encoded if encoded is not None else fastjson.dumps(message)
+        rows = [(delivery_id, channel, payload, status, now, now) for channel in channels]
+        self._execute(
+            'INSERT OR IGNORE INTO outbox (delivery_id, channel, message, status, next_attempt, created) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows, wait=True)
+
+    def mark_done(self, delivery_id, channel):
+        # next_attempt记录完成时间，过期清除以此为准
+        self._execute(
+            "UPDATE outbox SET status = 'done', attempts = attempts + 1, next_attempt = ?, last_error = NULL "
+            "WHERE delivery_id = ? AND channel = ?", [(time.time(), delivery_id, channel)])
+
+    def mark_failed(self, delivery_id, channel, attempts, error=None):
+        """记录一次失败，返回新状态：retry（稍后重试）或dead（超过重试上限）"""
+        attempts += 1
+        if attempts >= self.max_retries:
+            status = 'dead'
+            next_attempt = time.time()
+            self.logger.error(f'{channel}投递重试{attempts}次仍失败，进入死信: {delivery_id}')
+        else:
+            status = 'retry'
+            next_attempt = time.time() + self.backoff(attempts)
+        self._execute(
+            'UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? '
+            'WHERE delivery_id = ? AND channel = ?',
+            [(status, attempts, next_attempt, error, delivery_id, channel)])
+        return status
+
+    def defer(self, delivery_id, channel, delay=1.0):
+        """暂缓投递（例如队列已满），不计入重试次数"""
+        self._execute(
+            "UPDATE outbox SET status = 'retry', next_attempt = ? WHERE delivery_id = ? AND channel = ?",
+            [(time.time() + delay, delivery_id, channel)])
+
+    def backoff(self, attempts):
+        """指数退避加随机抖动"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def claim_due(self, limit=500):
+        """取出到期需要重试的记录并标记为queued，返回[(delivery_id, channel, message, attempts)]
+
+        查询与标记在同一条语句中完成，多个进程共享发件箱时不会重复领取。
+        """
+        with self.read_lock:
+            rows = self.read_conn.execute(
+                "UPDATE outbox SET status = 'queued' WHERE rowid IN ("
+                "SELECT rowid FROM outbox WHERE status = 'retry' AND next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT ?) "
+                "RETURNING delivery_id, channel, message, attempts",
+                (time.time(), limit)).fetchall()
+        return [(r[0], r[1], fastjson.loads(r[2]), r[3]) for r in rows]
+
+    def recover(self):
+        """启动时把上次未完成的投递重新放回重试队列"""
+        self._execute(
+            "UPDATE outbox SET status = 'retry', next_attempt = ? WHERE status IN ('pending', 'queued')",
+            [(time.time(),)], wait=True)
+        with self.read_lock:
+            count = self.read_conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = 'retry'").fetchone()[0]
+        if count:
+            self.logger.warning(f'发件箱恢复{count}条未完成的投递')
+        return count
+
+    def purge(self, before_ts):
+        """删除早于before_ts且已投递成功的记录"""
+        self._execute("DELETE FROM outbox WHERE status = 'done' AND created < ?", [(before_ts,)], wait=True)
+
+    def get(self, delivery_id):
+        """查询某条消息各渠道的持久化状态，{渠道: 状态}"""
+        with self.read_lock:
+            rows = self.read_conn.execute(
+                'SELECT channel, status FROM outbox WHERE delivery_id = ?', (delivery_id,)).fetchall()
+        return {channel: status for channel, status in rows}
+
+    def stats(self):
+        """各状态的记录数"""
+        with self.read_lock:
+            rows = self.read_conn.execute(
+                'SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.writer.join(5)
+        self.write_conn.close()
+        self.read_conn.close()
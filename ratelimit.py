@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TokenBucketLimiter:
+    """按键（API密钥或来源IP）划分的令牌桶
+
+    每个键只保存[令牌数, 上次更新时间]，按最近使用顺序排列，
+    长时间未使用的键在访问时顺带淘汰，内存占用与活跃键数成正比。
+    """
+
+    def __init__(self, rate, burst, idle_timeout=600.0, max_keys=100000):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.idle_timeout = idle_timeout
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def acquire(self, key, cost=1, force=False):
+        """消耗cost个令牌，成功返回0，否则返回需要等待的秒数
+
+        force为True时总是扣除（令牌数可以为负），用于事后才知道实际消耗量的批量请求。
+        """
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self.buckets[key] = bucket
+            else:
+                self.buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            self._evict(now)
+
+            if bucket[0] >= cost or force:
+                bucket[0] -= cost
+                return 0
+            return (cost - bucket[0]) / self.rate if self.rate > 0 else self.idle_timeout
+
+    def _evict(self, now):
+        while self.buckets:
+            key, (tokens, last) = next(iter(self.buckets.items()))
+            if len(self.buckets) > self.max_keys or now - last > self.idle_timeout:
+                self.buckets.popitem(last=False)
+            else:
+                break
+
+    def __len__(self):
+        return len(self.buckets)
+
+class InFlightLimiter:
+    """限制同时处理中的请求数"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            return True
+
+    def exit(self):
+        with self.lock:
+            self.count -= 1
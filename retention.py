@@ -0,0 +1,191 @@
+import gzip
+import os
+import shutil
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# 文件最后修改后至少经过这么久才压缩，避免和跨零点仍在写入的进程冲突
+SETTLE_SECONDS = 600
+
+class RetentionManager:
+    """日志目录的保留策略：后台压缩旧日期的文件，按保留天数和总大小删除最早的日期
+
+    可读日志压缩为普通gzip（YYYY-MM-DD.log.gz），消息存储压缩为分块gzip（见MessageStore.compress_day），
+    压缩后的历史消息仍可以按块读取。删除消息后同步清理搜索索引和发件箱中的旧记录。
+    总大小包含搜索索引、发件箱和去重数据库（含WAL文件）；数据库删除记录后空间由SQLite复用，文件不会缩小，
+    所以按总大小清理时只删除日期文件，直到日期文件加数据库不超过上限。
+    """
+
+    def __init__(self, log_dir, store, logger, max_age_days=90, max_total_bytes=0, compress_after_days=1,
+                 block_size=256 * 1024, interval=3600.0, search=None, outbox=None):
+        self.log_dir = log_dir
+        self.store = store
+        self.logger = logger
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self.compress_after_days = max(1, compress_after_days)
+        self.block_size = block_size
+        self.interval = interval
+        self.search = search
+        self.outbox = outbox
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def from_config(cls, config, log_dir, store, logger, search=None, outbox=None):
+        """根据[retention]配置创建，未启用时返回None"""
+        if not config.getboolean('retention', 'enabled', fallback=False):
+            return None
+        return cls(
+            log_dir, store, logger,
+            max_age_days=config.getint('retention', 'max_age_days', fallback=90),
+            max_total_bytes=int(config.getfloat('retention', 'max_total_mb', fallback=0) * 1024 * 1024),
+            compress_after_days=config.getint('retention', 'compress_after_days', fallback=1),
+            block_size=config.getint('retention', 'block_kb', fallback=256) * 1024,
+            interval=config.getfloat('retention', 'interval', fallback=3600.0),
+            search=search, outbox=outbox
+        )
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f'日志保留任务失败: {str(e)}')
+            self.stopping.wait(self.interval)
+
+    def _log_paths(self, day):
+        path = os.path.join(self.log_dir, day.strftime('%Y-%m-%d') + '.log')
+        return path, path + '.gz'
+
+    def _log_days(self):
+        days = set()
+        for name in os.listdir(self.log_dir):
+            if name.endswith('.log') or name.endswith('.log.gz'):
+                try:
+                    days.add(datetime.strptime(name[:10], '%Y-%m-%d').date())
+                except ValueError:
+                    continue
+        return days
+
+    def _database_paths(self):
+        paths = {os.path.join(self.log_dir, 'dedup.db')}
+        for db in (self.search, self.outbox):
+            if db is not None:
+                paths.add(db.path)
+        return paths
+
+    def database_size(self):
+        """日志目录中SQLite数据库（含-wal/-shm文件）的总大小"""
+        size = 0
+        for path in self._database_paths():
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    size += os.path.getsize(path + suffix)
+                except OSError:
+                    pass
+        return size
+
+    def _day_size(self, day):
+        size = self.store.day_size(day)
+        for path in self._log_paths(day):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def _settled(self, path):
+        try:
+            return time.time() - os.path.getmtime(path) >= SETTLE_SECONDS
+        except OSError:
+            return False
+
+    def compress_log(self, day):
+        """把某天的可读日志压缩为.log.gz，返回是否压缩"""
+        path, archive_path = self._log_paths(day)
+        if not self._settled(path):
+            return False
+        with open(path, 'rb') as src, gzip.open(archive_path + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(archive_path + '.tmp', archive_path)
+        os.remove(path)
+        return True
+
+    def delete_day(self, day):
+        freed = self.store.delete_day(day)
+        for path in self._log_paths(day):
+            try:
+                freed += os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def run_once(self):
+        """执行一次压缩和清理，返回统计信息"""
+        today = date.today()
+        days = sorted(self._log_days() | set(self.store.days()))
+        past = [d for d in days if d < today]
+        stats = {'compressed': 0, 'saved_bytes': 0, 'deleted_days': 0, 'freed_bytes': 0}
+
+        # 超过保留天数或总大小上限时，从最早的一天开始删除（不删除今天）
+        remaining = list(past)
+        if self.max_age_days > 0:
+            cutoff = today - timedelta(days=self.max_age_days)
+            while remaining and remaining[0] < cutoff:
+                stats['freed_bytes'] += self.delete_day(remaining.pop(0))
+                stats['deleted_days'] += 1
+        if self.max_total_bytes > 0:
+            sizes = {d: self._day_size(d) for d in remaining}
+            databases = self.database_size()
+            total = sum(sizes.values()) + self._day_size(today) + databases
+            if databases >= self.max_total_bytes:
+                # 删除日期文件也无法满足上限，只按保留天数清理
+                self.logger.warning(f'日志保留：数据库已占用{databases // 1024} KB，超过总大小上限，跳过按大小清理')
+                total = 0
+            while remaining and total > self.max_total_bytes:
+                day = remaining.pop(0)
+                total -= sizes[day]
+                stats['freed_bytes'] += self.delete_day(day)
+                stats['deleted_days'] += 1
+
+        if stats['deleted_days']:
+            # 保留下来的最早时间之前的索引和已完成的发件箱记录也一并清理
+            oldest = remaining[0] if remaining else today
+            before_ts = datetime.combine(oldest, datetime.min.time()).timestamp()
+            if self.search is not None:
+                self.search.delete_before(before_ts)
+            if self.outbox is not None:
+                self.outbox.purge(before_ts)
+            self.logger.warning(f"日志保留：删除{stats['deleted_days']}天的文件，释放{stats['freed_bytes'] // 1024} KB")
+
+        # 压缩足够旧的日期
+        compress_before = today - timedelta(days=self.compress_after_days - 1)
+        for day in remaining:
+            if self.stopping.is_set() or day >= compress_before:
+                break
+            log_path, _ = self._log_paths(day)
+            if os.path.exists(log_path):
+                before = os.path.getsize(log_path)
+                if self.compress_log(day):
+                    stats['compressed'] += 1
+                    stats['saved_bytes'] += before - os.path.getsize(self._log_paths(day)[1])
+            data_path = self.store._paths(day)[0]
+            if os.path.exists(data_path) and self._settled(data_path):
+                result = self.store.compress_day(day, self.block_size)
+                if result is not None:
+                    stats['compressed'] += 1
+                    stats['saved_bytes'] += result[0] - result[1]
+        return stats
@@ -0,0 +1,245 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from config import get_config
+from message import payload_json
+import fastjson
+
+# trigram分词器按三字符切分，中文和英文都支持任意子串匹配；更短的关键词退化为LIKE扫描
+MIN_MATCH_CHARS = 3
+CATCH_UP_CHUNK = 5000
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+class SearchIndex:
+    """基于SQLite FTS5的消息全文索引
+
+    新消息由后台线程批量写入（与发件箱相同的group commit方式），查询按写入顺序从新到旧返回，
+    用rowid作为翻页游标，任意深度的翻页都只读取一页数据。
+    """
+
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.write_conn = self._connect()
+        self.write_conn.executescript('''
+            CREATE TABLE IF NOT EXISTS messages (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                ts REAL NOT NULL,
+                text_from TEXT NOT NULL,
+                text TEXT NOT NULL,
+                -- 非字符串消息的原始JSON，字符串消息即text本身
+                payload TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages (ts);
+            CREATE INDEX IF NOT EXISTS idx_messages_from ON messages (text_from, rowid);
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                text, content='messages', content_rowid='rowid', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END;
+        ''')
+
+        self.read_conn = self._connect()
+        self.read_lock = threading.Lock()
+
+        self.pending = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.writer = threading.Thread(target=self._writer_loop, name='search-writer', daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _writer_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                batch, self.pending = self.pending, []
+                if not batch and self.closed:
+                    return
+            self._insert(self.write_conn, batch)
+
+    def _insert(self, conn, records):
+        rows = []
+        for r in records:
+            payload = r['payload']
+            if isinstance(payload, str):
+                text, encoded = payload, None
+            else:
+                # 非字符串消息的检索文本就是它的JSON，只编码一次
+                text = encoded = payload_json(r)
+            rows.append((r['id'], r['ts'], r['text_from'] or '', text, encoded))
+        sql = 'INSERT OR IGNORE INTO messages (id, ts, text_from, text, payload) VALUES (?, ?, ?, ?, ?)'
+        try:
+            conn.execute('BEGIN')
+            conn.executemany(sql, rows)
+            conn.execute('COMMIT')
+            return
+        except Exception:
+            try:
+                conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+        # 整批写入失败时逐条重试，只跳过出错的记录，避免索引与消息存储整批不一致
+        failed = []
+        for row in rows:
+            try:
+                conn.execute(sql, row)
+            except Exception as e:
+                failed.append((row[0], e))
+        if failed:
+            self.logger.error(f'搜索索引写入失败{len(failed)}条，首条{failed[0][0]}: {str(failed[0][1])}')
+
+    def add_records(self, records):
+        """把新写入存储的记录加入索引（异步，不阻塞调用方）"""
+        with self.cond:
+            if self.closed:
+                return
+            self.pending.extend(records)
+            self.cond.notify()
+
+    def catch_up(self, store):
+        """从消息存储补齐索引中缺少的记录（首次启用或上次退出前未写完的部分）
+
+        应在开始接收新消息之前调用，保证索引的写入顺序与时间顺序一致。
+        """
+        with self.read_lock:
+            last_ts = self.read_conn.execute('SELECT MAX(ts) FROM messages').fetchone()[0]
+        first_day = datetime.fromtimestamp(last_ts).date() if last_ts is not None else None
+        conn = self._connect()
+        before = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        for day in store.days():
+            if first_day is not None and day < first_day:
+                continue
+            count = store.count(day)
+            start = store._bisect(day, last_ts) if day == first_day else 0
+            while start < count:
+                records = store.read_day(day, start, min(count, start + CATCH_UP_CHUNK))
+                self._insert(conn, records)
+                start += CATCH_UP_CHUNK
+        added = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0] - before
+        conn.close()
+        if added:
+            self.logger.warning(f'搜索索引补齐{added}条消息')
+        return added
+
+    def search(self, query=None, text_from=None, since=None, until=None, cursor=None, limit=50):
+        """按关键词、来源和时间范围查询，返回(记录列表, 下一页游标)
+
+        关键词以空格分隔，全部匹配才返回；cursor为上一页返回的游标，None表示没有更多。
+        """
+        conditions = []
+        params = []
+        match_terms = []
+        for term in (query or '').split():
+            if len(term) >= MIN_MATCH_CHARS:
+                match_terms.append('"' + term.replace('"', '""') + '"')
+            else:
+                conditions.append("m.text LIKE ? ESCAPE '\\'")
+                params.append(f'%{_escape_like(term)}%')
+        if text_from:
+            conditions.append('m.text_from = ?')
+            params.append(text_from)
+
+        # 排序和游标都用驱动表的rowid，FTS5可以直接按rowid倒序流式产出结果，不必先取出全部匹配再排序
+        # 多进程部署时各进程分别写入索引，写入顺序与时间顺序不完全一致，时间范围只按ts过滤
+        rowid = 'messages_fts.rowid' if match_terms else 'm.rowid'
+        if since is not None:
+            conditions.append('m.ts >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('m.ts < ?')
+            params.append(until)
+        if cursor is not None:
+            conditions.append(f'{rowid} < ?')
+            params.append(int(cursor))
+
+        if match_terms:
+            sql = ('SELECT m.rowid, m.id, m.ts, m.text_from, m.text, m.payload '
+                   'FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid '
+                   'WHERE messages_fts MATCH ?')
+            params.insert(0, ' AND '.join(match_terms))
+        else:
+            sql = 'SELECT m.rowid, m.id, m.ts, m.text_from, m.text, m.payload FROM messages m WHERE 1'
+        for condition in conditions:
+            sql += ' AND ' + condition
+        sql += f' ORDER BY {rowid} DESC LIMIT ?'
+        params.append(limit + 1)
+
+        with self.read_lock:
+            rows = self.read_conn.execute(sql, params).fetchall()
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        results = [{
+            'id': msg_id,
+            'ts': ts,
+            'text_from': source,
+            'payload': fastjson.loads(payload) if payload is not None else text
+        } for _, msg_id, ts, source, text, payload in rows[:limit]]
+        return results, next_cursor
+
+    def delete_before(self, ts, batch=10000):
+        """删除早于ts的消息（保留策略删除存储文件后调用），分批删除避免长时间占用写锁"""
+        conn = self._connect()
+        deleted = 0
+        try:
+            while True:
+                count = conn.execute(
+                    'DELETE FROM messages WHERE rowid IN (SELECT rowid FROM messages WHERE ts < ? LIMIT ?)',
+                    (ts, batch)).rowcount
+                deleted += count
+                if count < batch:
+                    break
+        finally:
+            conn.close()
+        return deleted
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.writer.join(5)
+        self.write_conn.close()
+        self.read_conn.close()
+
+def parse_time(value):
+    """时间参数：Unix时间戳或ISO格式日期/时间，空值返回None"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_search_index(logger):
+    """进程内共享的搜索索引，未启用时返回None"""
+    global _index
+    config = get_config()
+    if not config.parser.getboolean('search', 'enabled', fallback=False):
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = config.parser.get('search', 'path',
+                                         fallback=os.path.join(config.log_dir, 'search.db'))
+                _index = SearchIndex(path, logger)
+    return _index
@@ -1,194 +1,602 @@
-import json
 import os
-import smtplib
-import requests
-import configparser
-from flask import Flask, request, jsonify
-import threading
-from gui import WebhookGUI
+import socket
+import time
+import math
+from flask import Flask, request, jsonify, g, Response
+from werkzeug.exceptions import HTTPException
 from logger import setup_logger
-from config import get_api_key, load_config
+from config import get_config, load_config, DEFAULT_TEXT_FROM
+from delivery import DeliveryQueue
+from outbox import Outbox
+from channels import ChannelRegistry, FAILED_STATES
+import fastjson
+from serving import WorkerPool, create_server
+from store import get_store
+from search import get_search_index, parse_time
+from retention import RetentionManager
+from stream import StreamHub
+from batch import iter_json_array, iter_ndjson, BatchFormatError
+from ratelimit import TokenBucketLimiter, InFlightLimiter
+from dedup import DedupCache, SharedDedupCache
+from metrics import (REGISTRY, REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, EXCEPTIONS,
+                     RATE_LIMITED, DEDUP_REPLAYED, format_gauge)
 
-class MessageForwarder:
-    def __init__(self):
-        try:
-            self.config = load_config()
-            self.logger = setup_logger()
-        except Exception as e:
-            self.logger = setup_logger()  # 即使配置加载失败也确保有logger
-            self.logger.error(f'初始化配置失败: {str(e)}')
-            self.config = configparser.ConfigParser()  # 创建空配置
-    
-    def forward_to_onebot(self, message):
-        """通过OneBot v11协议私发消息"""
-        try:
-            # 从配置文件获取配置
-            if not self.config.getboolean('onebot', 'enabled', fallback=False):
-                return True
-                
-            url = self.config['onebot']['url']
-            token = self.config['onebot']['access_token']
-            target_qq = self.config['onebot']['target_qq']
-            
-            if not all([url, token, target_qq]):
-                self.logger.warning('OneBot配置不完整，跳过消息转发')
-                return True
-                
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
-                f"{url}/send_private_msg",
-                headers=headers,
-                json={
-                    "user_id": int(target_qq),
-                    "message": message
-                },
-                timeout=10
-            )
-            
-            # 处理标准响应格式
-            resp_data = response.json()
-            if resp_data.get("status") != "ok":
-                self.logger.error(f'OneBot API错误: {resp_data.get("message", "未知错误")}')
-                return False
-                
-            return True
-                
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f'OneBot网络错误: {str(e)}')
-            return False
-        except ValueError as e:
-            self.logger.error(f'OneBot配置错误: {str(e)}')
-            return False
-        except Exception as e:
-            self.logger.error(f'OneBot未知错误: {str(e)}')
-            return False
-    
-    def forward_to_email(self, message):
-        """通过邮件转发消息"""
-        if not self.config.get('email', {}).get('enabled', False):
-            return True  # 未启用视为成功
-        
+# /metrics中熔断状态的数值表示
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+def open_outbox(config, logger, **kwargs):
+    """按[outbox]配置打开发件箱，未启用时返回None"""
+    if not config.getboolean('outbox', 'enabled', fallback=False):
+        return None
+    options = dict(
+        max_retries=config.getint('outbox', 'max_retries', fallback=8),
+        backoff_base=config.getfloat('outbox', 'backoff_base', fallback=2.0),
+        backoff_max=config.getfloat('outbox', 'backoff_max', fallback=300.0),
+        done_ttl=config.getfloat('outbox', 'done_ttl', fallback=86400.0),
+        dead_ttl=config.getfloat('outbox', 'dead_ttl', fallback=604800.0),
+        purge_interval=config.getfloat('outbox', 'purge_interval', fallback=600.0)
+    )
+    options.update(kwargs)
+    return Outbox(config.get('outbox', 'path', fallback='logs/outbox.db'), logger, **options)
+
+def recover_outbox():
+    """把发件箱中上次未完成的投递放回重试队列，多进程部署时由主进程在启动工作进程前执行一次"""
+    outbox = open_outbox(load_config(), setup_logger(), purge_interval=0)
+    if outbox is not None:
         try:
-            smtp_config = self.config['email']
-            if not all([smtp_config.get('host'), smtp_config.get('port'), 
-                       smtp_config.get('username'), smtp_config.get('password'),
-                       smtp_config.get('from'), smtp_config.get('to')]):
-                self.logger.warning('邮件配置不完整，跳过邮件转发')
-                return True  # 配置不完整视为成功
-                
-            with smtplib.SMTP(smtp_config['host'], smtp_config['port']) as server:
-                server.starttls()
-                server.login(smtp_config['username'], smtp_config['password'])
-                msg = f"Subject: Webhook消息通知\n\n{message}"
-                server.sendmail(
-                    smtp_config['from'],
-                    smtp_config['to'],
-                    msg
-                )
-            return True
-        except Exception as e:
-            self.logger.error(f'邮件转发失败: {str(e)}')
-            return False
+            outbox.recover()
+        finally:
+            outbox.close()
+
+def create_app(gui=None, recover=True, stream=None, workers=1, recover_outbox=None):
+    """创建应用，workers为共享同一端口的工作进程数（多进程部署时去重记录改为进程间共享，限流速率按进程数均分）
 
-def create_app(gui=None):
+    recover为True时由本进程执行启动恢复和后台维护（搜索索引补齐、日志保留）；
+    recover_outbox单独控制是否恢复发件箱，默认与recover相同。
+    """
     app = Flask(__name__)
     logger = setup_logger()
-    forwarder = MessageForwarder()
 
-    @app.route('/webhook', methods=['POST', 'GET'])
-    def webhook():
+    # 转发渠道：[onebot]、[email]和[channel:名称]节中启用的渠道
+    config = load_config()
+    json_backend = config.get('server', 'json_backend', fallback='auto')
+    if fastjson.set_backend(json_backend) != json_backend and json_backend != 'auto':
+        logger.warning(f'JSON后端{json_backend}不可用，使用{fastjson.backend()}')
+    channels = ChannelRegistry.from_config(config, logger).start()
+    app.channels = channels
+
+    # 异步投递：/webhook 先返回202，再由后台队列转发
+    delivery_mode = config.get('delivery', 'mode', fallback='async')
+    outbox = open_outbox(config, logger)
+    delivery = DeliveryQueue(
+        channels.handlers(),
+        logger,
+        queue_size=config.getint('delivery', 'queue_size', fallback=1000),
+        workers=config.getint('delivery', 'workers', fallback=2),
+        outbox=outbox,
+        recover=recover if recover_outbox is None else recover_outbox
+    )
+    app.delivery = delivery
+
+    # 每条消息都写入结构化存储，可读日志只作为可选视图
+    store = get_store()
+    human_log = config.getboolean('logging', 'human_readable', fallback=True)
+
+    # 全文搜索索引，随消息写入增量更新
+    search = get_search_index(logger)
+    if search is not None and recover:
+        search.catch_up(store)
+    app.search = search
+    search_max_limit = config.getint('search', 'max_limit', fallback=500)
+
+    # 日志保留与压缩（多进程部署时只由负责恢复的进程执行）
+    app.retention = None
+    if recover:
+        app.retention = RetentionManager.from_config(config, get_config().log_dir, store, logger, search, outbox)
+        if app.retention is not None:
+            app.retention.start()
+
+    # 批量接收配置
+    batch_max_items = config.getint('batch', 'max_items', fallback=10000)
+    batch_write_size = config.getint('batch', 'write_size', fallback=500)
+    batch_merge_chars = config.getint('batch', 'merge_max_chars', fallback=4000)
+    batch_max_item = config.getint('batch', 'max_item_kb', fallback=4096) * 1024
+    # 请求体大小上限，超过时返回413
+    app.config['MAX_CONTENT_LENGTH'] = config.getint('server', 'max_content_mb', fallback=64) * 1024 * 1024 or None
+
+    # 限流：按来源IP和API密钥的令牌桶，加上处理中请求数和投递队列深度的全局上限
+    # 令牌桶在每个进程内，多进程部署时按进程数均分速率和容量，使各进程合计约等于配置值
+    ratelimit_enabled = config.getboolean('ratelimit', 'enabled', fallback=False)
+    idle_timeout = config.getfloat('ratelimit', 'idle_timeout', fallback=600.0)
+    ip_limiter = TokenBucketLimiter(
+        config.getfloat('ratelimit', 'per_ip_rate', fallback=10.0) / workers,
+        config.getfloat('ratelimit', 'per_ip_burst', fallback=50.0) / workers,
+        idle_timeout=idle_timeout
+    )
+    key_limiter = TokenBucketLimiter(
+        config.getfloat('ratelimit', 'per_key_rate', fallback=20.0) / workers,
+        config.getfloat('ratelimit', 'per_key_burst', fallback=100.0) / workers,
+        idle_timeout=idle_timeout
+    )
+    in_flight = InFlightLimiter(config.getint('ratelimit', 'max_in_flight', fallback=64))
+    max_queue_depth = config.getint('ratelimit', 'max_queue_depth', fallback=800)
+
+    def too_many_requests(reason, retry_after):
+        logger.warning(f'请求被限流({reason}): {request.remote_addr}')
+        RATE_LIMITED.inc(reason)
+        response = jsonify({'error': 'Too many requests', 'reason': reason})
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response, 429
+
+    def check_key_limit(api_key, cost=1, force=False):
+        """按API密钥限流，超限时返回429响应，否则返回None"""
+        if not ratelimit_enabled:
+            return None
+        wait = key_limiter.acquire(api_key, cost, force=force)
+        if wait:
+            return too_many_requests('api_key', wait)
+        return None
+
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+
+    @app.after_request
+    def count_request(response):
+        endpoint = request.endpoint or 'unknown'
+        REQUESTS.inc(endpoint, response.status_code)
+        started = g.get('started')
+        if started is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+        return response
+
+    @app.errorhandler(Exception)
+    def internal_error(e):
+        """未预期的异常：记录并计数，返回真实的500"""
+        if isinstance(e, HTTPException):
+            return e
+        EXCEPTIONS.inc(request.endpoint or 'unknown')
+        logger.error(f'处理请求{request.path}时发生错误: {e!r}')
+        return jsonify({'error': 'Internal server error'}), 500
+
+    @app.before_request
+    def limit_intake():
+        if not ratelimit_enabled or request.endpoint not in ('webhook', 'webhook_batch'):
+            return None
+        wait = ip_limiter.acquire(request.remote_addr or '')
+        if wait:
+            return too_many_requests('ip', wait)
+        # 投递队列积压时拒绝新消息，让发送方稍后重试
+        if sum(delivery.depth().values()) >= max_queue_depth:
+            return too_many_requests('queue_full', 1)
+        if not in_flight.enter():
+            return too_many_requests('in_flight', 1)
+        g.in_flight = True
+        return None
+
+    @app.teardown_request
+    def release_intake(exc=None):
+        if g.pop('in_flight', False):
+            in_flight.exit()
+
+    # 幂等键/内容去重缓存：单进程时在内存中，多进程时保存在日志目录下的dedup.db中由各进程共享
+    dedup = None
+    if config.getboolean('dedup', 'enabled', fallback=False):
+        dedup_options = {
+            'window': config.getfloat('dedup', 'window', fallback=300.0),
+            'max_entries': config.getint('dedup', 'max_entries', fallback=100000)
+        }
+        if workers > 1:
+            dedup = SharedDedupCache(os.path.join(get_config().log_dir, 'dedup.db'), **dedup_options)
+        else:
+            dedup = DedupCache(**dedup_options)
+    app.dedup = dedup
+    dedup_hash_content = config.getboolean('dedup', 'hash_content', fallback=False)
+
+    started = time.time()
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        alive = delivery.alive()
+        return jsonify({
+            'status': 'ok' if alive else 'degraded',
+            'uptime': round(time.time() - started, 1),
+            'gui': 'enabled' if gui else 'disabled',
+            'queue_depth': delivery.depth(),
+            'channels': channels.states()
+        }), 200 if alive else 503
+
+    @app.route('/channels/status', methods=['GET'])
+    def channels_status():
+        """各转发渠道的熔断状态、窗口内错误率和最近一次错误"""
+        if get_config().check_api_key(request.args.get('api_key')) is None:
+            return jsonify({'error': 'Invalid API key'}), 401
+        return jsonify(channels.status()), 200
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus文本格式的指标"""
+        extra = [format_gauge('webhook_queue_depth', 'Messages waiting in each delivery queue',
+                              [((k,), v) for k, v in sorted(delivery.depth().items())], ('channel',))]
+        states = channels.status()
+        extra.append(format_gauge('webhook_channel_state', 'Channel circuit state (0 closed, 1 half open, 2 open)',
+                                  [((k,), CIRCUIT_STATES[v['state']]) for k, v in states.items()], ('channel',)))
+        extra.append(format_gauge('webhook_channel_error_rate', 'Channel error rate in the rolling window',
+                                  [((k,), v['error_rate']) for k, v in states.items()], ('channel',)))
+        if outbox is not None:
+            extra.append(format_gauge('webhook_outbox_messages', 'Outbox records by status',
+                                      [((k,), v) for k, v in sorted(outbox.stats().items())], ('status',)))
+        if isinstance(stream, StreamHub):
+            extra.append(format_gauge('webhook_stream_subscribers', 'Connected stream subscribers',
+                                      [((), len(stream))]))
+        if dedup is not None:
+            extra.append(format_gauge('webhook_dedup_entries', 'Entries in the dedup cache', [((), len(dedup))]))
+        return Response(REGISTRY.render(*extra), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/messages/search', methods=['GET'])
+    def search_messages():
+        """按关键词、来源和时间范围检索历史消息，按写入顺序从新到旧分页"""
+        if get_config().check_api_key(request.args.get('api_key')) is None:
+            return jsonify({'error': 'Invalid API key'}), 401
+        if search is None:
+            return jsonify({'error': 'Search is disabled'}), 404
         try:
-            data = None
-            if request.method == 'GET':
-                message = request.args.get('message')
-                if not message:
-                    return jsonify({'error': 'Missing message parameter'}), 400
-            else:  # POST
-                try:
-                    data = request.get_json()
-                    if not data or 'message' not in data:
-                        return jsonify({'error': 'Missing message in request body'}), 400
-                    message = data.get('message')
-                except Exception as e:
-                    logger.error(f'解析请求体失败: {str(e)}')
-                    return jsonify({'error': 'Invalid JSON format'}), 400
-            
-            # API密钥验证
+            since = parse_time(request.args.get('since'))
+            until = parse_time(request.args.get('until'))
+            cursor = request.args.get('cursor') or None
+            if cursor is not None:
+                int(cursor)
+            limit = min(max(request.args.get('limit', 50, type=int), 1), search_max_limit)
+        except ValueError:
+            return jsonify({'error': 'Invalid parameter'}), 400
+        results, next_cursor = search.search(
+            request.args.get('q'), request.args.get('text_from'), since, until, cursor, limit)
+        return jsonify({'results': results, 'next_cursor': next_cursor}), 200
+
+    @app.route('/webhook/status/<delivery_id>', methods=['GET'])
+    def delivery_status(delivery_id):
+        result = delivery.get_status(delivery_id)
+        if result is None:
+            return jsonify({'error': 'Unknown delivery id'}), 404
+        return jsonify(result), 200
+
+    def forward_now(message, names):
+        """同步并行转发到指定渠道，返回(各渠道状态, HTTP状态码)"""
+        results = channels.fan_out(message, names)
+        status = dict({'gui': 'enabled' if gui else 'disabled'}, **results)
+        if any(v in FAILED_STATES for v in results.values()):
+            return status, 207
+        return status, 200
+
+    @app.route('/webhook/batch', methods=['POST'])
+    def webhook_batch():
+        """批量接收：请求体为JSON数组或NDJSON，整批只鉴权一次，按块写入存储并合并转发"""
+        # API密钥验证
+        with STAGE_SECONDS.time('auth'):
             api_key = request.args.get('api_key')
-            if not api_key or api_key != get_api_key():
+            key_text_from = get_config().check_api_key(api_key)
+            if key_text_from is None:
                 logger.warning(f'无效的API密钥: {api_key}')
                 return jsonify({'error': 'Invalid API key'}), 401
-                
-            # 记录完整日志
-            try:
-                logger.info(f'收到消息: {json.dumps(message, ensure_ascii=False)}')
-            except Exception as e:
-                logger.error(f'记录日志失败: {str(e)}')
-            
-            # 显示消息（不包含日期时间前缀）
-            display_message = message
-            if isinstance(message, str):
-                try:
-                    parsed = json.loads(message)
-                    if isinstance(parsed, str):
-                        display_message = parsed
-                except:
-                    pass
-            
-            # 获取text_from参数，如果未提供则使用默认值
-            text_from = request.args.get('text_from') or (data.get('text_from') if data else None)
-            text_from = text_from or "aYYbsYYa"
-            
-            # 如果存在GUI则显示消息
-            if gui:
+            # 先按一条消息扣除，处理完后再按实际条数补扣
+            limited = check_key_limit(api_key)
+            if limited:
+                return limited
+
+        default_from = request.args.get('text_from') or key_text_from or DEFAULT_TEXT_FROM
+        mode = request.args.get('mode') or delivery_mode
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+            items = iter_ndjson(request.stream, max_item_size=batch_max_item)
+        else:
+            items = iter_json_array(request.stream, max_item_size=batch_max_item)
+
+        results = []
+        pending = []  # 待写入存储的记录
+        merged = []  # 当前合并转发块中的(结果, 文本)
+        merged_len = 0
+        merged_names = []  # 合并块中各消息共同的路由结果，路由不同的消息不合并
+        deliveries = []
+
+        def flush_records():
+            """一次写入一批记录，并交给日志和GUI"""
+            if not pending:
+                return
+            with STAGE_SECONDS.time('log_write'):
+                store.append_records(pending)
+                if search is not None:
+                    search.add_records(pending)
+                if human_log:
+                    try:
+                        logger.info('\n'.join(f'收到消息: {r.payload_json}' for r in pending))
+                    except Exception as e:
+                        logger.error(f'记录日志失败: {str(e)}')
+            if gui or stream is not None:
+                with STAGE_SECONDS.time('gui_dispatch'):
+                    for r in pending:
+                        if stream is not None:
+                            stream.publish(r, r.display)
+                        if gui:
+                            try:
+                                gui.post_message(r.display, r.text_from)
+                            except Exception as e:
+                                logger.error(f'GUI显示消息失败: {str(e)}')
+            pending.clear()
+
+        def flush_merged():
+            """把当前合并块作为一条消息转发"""
+            nonlocal merged_len
+            if not merged:
+                return
+            # 合并块中的消息必须先落盘
+            flush_records()
+            text = '\n\n'.join(t for _, t in merged)
+            names = list(merged_names)
+            if mode != 'sync':
+                result = delivery.submit(text, channels=names)
+                deliveries.append(result['id'])
+                for item, _ in merged:
+                    item['delivery_id'] = result['id']
+            else:
+                status, _ = forward_now(text, names)
+                for item, _ in merged:
+                    item['details'] = status
+            merged.clear()
+            merged_len = 0
+
+        try:
+            for index, item in enumerate(items):
+                if index >= batch_max_items:
+                    results.append({'index': index, 'status': 'error', 'error': 'Too many items'})
+                    break
+                if isinstance(item, BatchFormatError):
+                    results.append({'index': index, 'status': 'error', 'error': 'Invalid JSON format'})
+                    continue
+                if isinstance(item, dict):
+                    message = item.get('message')
+                    text_from = item.get('text_from') or default_from
+                else:
+                    message = item
+                    text_from = default_from
+                if message is None or message == '':
+                    results.append({'index': index, 'status': 'error', 'error': 'Missing message'})
+                    continue
+
+                record = store.make_record(message, text_from)
+                pending.append(record)
+                result = {'index': index, 'status': 'accepted', 'id': record['id']}
+                results.append(result)
+
+                display_message = record.display
+                if not isinstance(display_message, str):
+                    display_message = record.display_json
+                text = f'[{text_from}] {display_message}'
+                names = channels.route(record, text_from)
+                if merged and (names != merged_names or merged_len + len(text) > batch_merge_chars):
+                    flush_merged()
+                merged.append((result, text))
+                merged_names[:] = names
+                merged_len += len(text) + 2
+                if len(pending) >= batch_write_size:
+                    flush_records()
+            error = None
+        except BatchFormatError as e:
+            # 已解析的消息照常保存和转发，同时报告格式错误
+            error = str(e)
+        flush_merged()
+        flush_records()
+
+        accepted = sum(1 for r in results if r['status'] == 'accepted')
+        if accepted > 1:
+            check_key_limit(api_key, accepted - 1, force=True)
+        if error is not None or not accepted:
+            # 返回400时状态为error，已接收的消息仍列在accepted和results中
+            status = 'error'
+        else:
+            status = 'accepted' if mode != 'sync' else 'processed'
+        body = {
+            'status': status,
+            'message': f'已接收{accepted}条消息',
+            'accepted': accepted,
+            'rejected': len(results) - accepted,
+            'results': results
+        }
+        if mode != 'sync':
+            body['delivery_ids'] = deliveries
+        if error is not None:
+            body['error'] = 'Invalid JSON format'
+            body['detail'] = error
+            return jsonify(body), 400
+        if not accepted:
+            body['error'] = 'No valid messages'
+            return jsonify(body), 400
+        if mode != 'sync':
+            return jsonify(body), 202
+        failed = any(v in FAILED_STATES for r in results if 'details' in r for v in r['details'].values())
+        return jsonify(body), 207 if failed or accepted < len(results) else 200
+
+    def accept_message(message, text_from):
+        """保存、显示并转发一条消息，返回(响应体, 状态码)"""
+        with STAGE_SECONDS.time('log_write'):
+            # 写入消息存储（结构化JSONL）
+            record = store.append(message, text_from)
+            if search is not None:
+                search.add_records([record])
+
+            # 可读日志（可选）
+            if human_log:
                 try:
-                    gui.root.after(0, lambda: [gui.display_message(display_message, text_from=text_from), 
-                                            setattr(gui, 'message_position', not gui.message_position)])
+                    logger.info(f'收到消息: {record.payload_json}')
                 except Exception as e:
-                    logger.error(f'GUI显示消息失败: {str(e)}')
-            
-            # 转发消息
-            results = {
-                'gui': bool(gui),  # GUI是否启用
-                'onebot': forwarder.forward_to_onebot(display_message),
-                'email': forwarder.forward_to_email(display_message)
-            }
+                    logger.error(f'记录日志失败: {str(e)}')
+        
+        # 显示消息（不包含日期时间前缀）
+        display_message = record.display
+        
+        # 如果存在GUI则显示消息，同时推送给实时订阅者
+        if gui or stream is not None:
+            with STAGE_SECONDS.time('gui_dispatch'):
+                if stream is not None:
+                    stream.publish(record, display_message)
+                if gui:
+                    try:
+                        gui.post_message(display_message, text_from)
+                    except Exception as e:
+                        logger.error(f'GUI显示消息失败: {str(e)}')
+        
+        # 按路由规则选出要转发的渠道
+        names = channels.route(record, text_from)
+
+        # 异步模式：入队后立即返回，投递结果通过状态接口查询
+        mode = request.args.get('mode') or delivery_mode
+        if mode != 'sync':
+            result = delivery.submit(display_message, delivery_id=record.id, channels=names,
+                                     encoded=record.display_json)
+            details = dict(result['details'], gui='enabled' if gui else 'disabled')
+            # 熔断中的渠道会推迟到恢复后再投递
+            for name, state in channels.states().items():
+                if state == 'open' and details.get(name) == 'pending':
+                    details[name] = 'circuit_open'
+            return {
+                'status': 'accepted',
+                'message': '消息已接收，正在转发',
+                'delivery_id': result['id'],
+                'details': details
+            }, 202
+
+        # 同步模式：在请求内并行转发
+        status, code = forward_now(display_message, names)
+        if code == 207:
+            return {
+                'status': 'partial_success',
+                'message': '部分转发成功',
+                'details': status
+            }, 207
             
-            # 构建详细状态信息
-            status = {
-                'gui': 'enabled' if results['gui'] else 'disabled',
-                'onebot': 'success' if results['onebot'] else 'failed',
-                'email': 'success' if results['email'] else 'failed'
-            }
+        return {
+            'status': 'success',
+            'message': '全部转发成功',
+            'details': status
+        }, 200
+
+    def replay_response(body, code):
+        """重复请求：返回原响应，异步模式下附带最新的投递状态"""
+        body = dict(body)
+        if 'delivery_id' in body:
+            current = delivery.get_status(body['delivery_id'])
+            if current is not None:
+                body['details'] = dict(current['details'], gui=body['details'].get('gui'))
+        response = jsonify(body)
+        response.headers['Idempotent-Replayed'] = 'true'
+        DEDUP_REPLAYED.inc()
+        return response, code
+
+    @app.route('/webhook', methods=['POST', 'GET'])
+    def webhook():
+        try:
+            data = None
+            with STAGE_SECONDS.time('parse'):
+                if request.method == 'GET':
+                    message = request.args.get('message')
+                    if not message:
+                        return jsonify({'error': 'Missing message parameter'}), 400
+                else:  # POST
+                    try:
+                        data = request.get_json()
+                        if not data or 'message' not in data:
+                            return jsonify({'error': 'Missing message in request body'}), 400
+                        message = data.get('message')
+                    except Exception as e:
+                        logger.error(f'解析请求体失败: {str(e)}')
+                        return jsonify({'error': 'Invalid JSON format'}), 400
             
-            # 如果有任何转发失败
-            if not all([results['onebot'], results['email']]):
-                return jsonify({
-                    'status': 'partial_success',
-                    'message': '部分转发成功',
-                    'details': status
-                }), 207
+            # API密钥验证
+            with STAGE_SECONDS.time('auth'):
+                api_key = request.args.get('api_key')
+                key_text_from = get_config().check_api_key(api_key)
+                if key_text_from is None:
+                    logger.warning(f'无效的API密钥: {api_key}')
+                    return jsonify({'error': 'Invalid API key'}), 401
+                limited = check_key_limit(api_key)
+                if limited:
+                    return limited
                 
-            return jsonify({
-                'status': 'success',
-                'message': '全部转发成功',
-                'details': status
-            }), 200
+            # 获取text_from参数，如果未提供则使用该API密钥的默认值
+            text_from = request.args.get('text_from') or (data.get('text_from') if data else None)
+            text_from = text_from or key_text_from or DEFAULT_TEXT_FROM
+
+            # 幂等与去重：窗口期内的重复请求直接返回原响应，不再保存和转发
+            dedup_key = None
+            if dedup is not None:
+                idempotency_key = (request.headers.get('Idempotency-Key') or request.args.get('id')
+                                   or (data.get('id') if isinstance(data, dict) else None))
+                if idempotency_key is not None or dedup_hash_content:
+                    dedup_key = DedupCache.make_key(api_key, idempotency_key, message, text_from)
+                    state, cached = dedup.claim(dedup_key)
+                    if state == 'done':
+                        return replay_response(*cached)
+                    if state == 'busy':
+                        return jsonify({'error': 'Duplicate request in progress'}), 409
+
+            try:
+                body, code = accept_message(message, text_from)
+            except Exception:
+                if dedup_key is not None:
+                    dedup.discard(dedup_key)
+                raise
+            if dedup_key is not None:
+                dedup.complete(dedup_key, (body, code))
+            return jsonify(body), code
             
         except Exception as e:
-            #logger.error(f'处理webhook请求时发生错误: {str(e)}')
-            # return jsonify({'error': 'Internal server error!其它情况我也没排查到，正常运行再说吧，反正你也没看见'}), 500
-            return jsonify({
-                'status': 'success',
-                'message': "This is a mysterious state. After my test, all of them are running normally. I haven't found the cause yet. Besides, you haven't seen it anyway, have you?"
-            }), 200
+            return internal_error(e)
 
     return app
 
-def run_server(gui=None):
-    app = create_app(gui)
-    app.run(host='0.0.0.0', port=5000)
+def close_app(app, timeout=10):
+    """等待投递队列排空，再停止后台任务"""
+    app.delivery.stop(timeout, flush=app.channels.flush)
+    app.channels.close()
+    if app.retention is not None:
+        app.retention.stop()
+    if app.search is not None:
+        app.search.close()
+    if isinstance(app.dedup, SharedDedupCache):
+        app.dedup.close()
+
+def start_stream():
+    """按[stream]配置启动实时推送服务，未启用时返回None"""
+    config = get_config()
+    hub = StreamHub.from_config(config.parser, get_store(), setup_logger(), lambda key: get_config().check_api_key(key))
+    if hub is not None:
+        hub.start(config.parser.get('stream', 'host', fallback=config.host),
+                  config.parser.getint('stream', 'port', fallback=5001))
+    return hub
+
+class AppServer:
+    """单进程部署：一个WSGI服务器加本进程内的投递队列"""
+
+    def __init__(self, gui=None):
+        self.stream = start_stream()
+        self.app = create_app(gui, stream=self.stream)
+        self.server = create_server(self.app)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self, timeout=10):
+        """停止接受请求，再等待投递队列排空"""
+        self.server.stop(timeout)
+        close_app(self.app, timeout)
+        if self.stream is not None:
+            self.stream.stop()
+
+def make_service(gui=None, workers=1):
+    """按工作进程数创建服务，返回带run()/stop()的对象"""
+    if workers > 1:
+        if hasattr(socket, 'SO_REUSEPORT'):
+            return WorkerPool(workers, gui)
+        setup_logger().warning('当前平台不支持SO_REUSEPORT，以单进程多线程方式运行')
+    return AppServer(gui)
+
+def run_server(gui=None, workers=1):
+    make_service(gui, workers).run()
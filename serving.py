@@ -0,0 +1,194 @@
+import multiprocessing
+import queue
+import signal
+import socket
+import threading
+import time
+from logger import setup_logger
+from config import get_config
+
+class WSGIServer:
+    """生产环境WSGI服务器：优先使用waitress，未安装时退回werkzeug的多线程服务器"""
+
+    def __init__(self, app, host, port, sock=None, threads=8, backlog=1024, keepalive=30):
+        self.app = app
+        try:
+            import waitress
+        except ImportError:
+            waitress = None
+
+        if waitress is not None:
+            kwargs = {
+                'threads': threads,
+                'backlog': backlog,
+                'channel_timeout': keepalive,
+                'ident': 'webhook_receiver'
+            }
+            if sock is not None:
+                kwargs['sockets'] = [sock]
+            else:
+                kwargs['host'] = host
+                kwargs['port'] = port
+            self.server = waitress.create_server(app, **kwargs)
+            self.backend = 'waitress'
+        else:
+            from werkzeug.serving import make_server
+            self.server = make_server(host, port, app, threaded=True,
+                                      fd=sock.fileno() if sock is not None else None)
+            self.backend = 'werkzeug'
+
+    def serve_forever(self):
+        if self.backend == 'waitress':
+            self.server.run()
+        else:
+            self.server.serve_forever()
+
+    def stop(self, timeout=10):
+        """优雅关闭：停止接受新连接，等待处理中的请求完成"""
+        if self.backend == 'waitress':
+            from waitress import wasyncore
+            server = self.server
+            # 在事件循环线程中关闭监听socket，不再接受新连接
+            server.trigger.pull_trigger(lambda: wasyncore.dispatcher.close(server))
+            server.task_dispatcher.shutdown(cancel_pending=False, timeout=timeout)
+            # 关闭剩余连接，事件循环随之退出
+            server.trigger.pull_trigger(lambda: wasyncore.close_all(server._map))
+        else:
+            self.server.shutdown()
+            self.server.server_close()
+
+def create_server(app, sock=None):
+    """按[server]配置创建WSGI服务器"""
+    config = get_config()
+    parser = config.parser
+    return WSGIServer(
+        app, config.host, config.port, sock=sock,
+        threads=parser.getint('server', 'threads', fallback=8),
+        backlog=parser.getint('server', 'backlog', fallback=1024),
+        keepalive=parser.getint('server', 'keepalive', fallback=30)
+    )
+
+def reuseport_socket(host, port, backlog):
+    """创建开启SO_REUSEPORT的监听socket，多个进程可以绑定同一端口由内核分发连接"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+class GUIProxy:
+    """工作进程中的GUI替身，通过进程间队列把消息交给主进程的GUI显示"""
+
+    def __init__(self, message_queue):
+        self.message_queue = message_queue
+
+    def post_message(self, message, text_from):
+        try:
+            self.message_queue.put_nowait(('gui', message, text_from))
+        except queue.Full:
+            pass
+
+class StreamProxy:
+    """工作进程中的实时推送替身，消息交给主进程的StreamHub广播"""
+
+    def __init__(self, message_queue):
+        self.message_queue = message_queue
+
+    def publish(self, record, message=None):
+        try:
+            self.message_queue.put_nowait(('stream', record, message))
+        except queue.Full:
+            pass
+
+def _worker_main(index, workers, bridge_queue, gui_enabled, stream_enabled):
+    """工作进程入口：绑定共享端口，收到SIGTERM后排空投递队列再退出"""
+    from server import create_app, close_app
+
+    config = get_config()
+    logger = setup_logger()
+    gui = GUIProxy(bridge_queue) if gui_enabled else None
+    stream = StreamProxy(bridge_queue) if stream_enabled else None
+    # 发件箱已由主进程在启动工作进程前恢复：工作进程（包括重启的）恢复时会把其他进程
+    # 正在投递的记录也放回重试队列，造成重复投递。搜索索引补齐和日志保留仍只由第一个工作进程执行
+    app = create_app(gui, recover=(index == 0), stream=stream, workers=workers, recover_outbox=False)
+    sock = reuseport_socket(config.host, config.port,
+                            config.parser.getint('server', 'backlog', fallback=1024))
+    server = create_server(app, sock=sock)
+
+    def on_term(signum, frame):
+        threading.Thread(target=server.stop, daemon=True).start()
+    signal.signal(signal.SIGTERM, on_term)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server.serve_forever()
+    close_app(app, config.parser.getint('server', 'drain_timeout', fallback=10))
+    logger.info(f'工作进程{index}已退出')
+
+class WorkerPool:
+    """多进程部署：每个工作进程各自监听同一端口（SO_REUSEPORT），异常退出时自动重启"""
+
+    def __init__(self, workers, gui=None):
+        self.workers = workers
+        self.gui = gui
+        self.logger = setup_logger()
+        self.ctx = multiprocessing.get_context('spawn')
+        # 实时推送的订阅连接都在主进程，工作进程收到的消息经队列转交
+        from server import start_stream
+        self.stream = start_stream()
+        self.bridge_queue = None
+        if gui is not None or self.stream is not None:
+            self.bridge_queue = self.ctx.Queue(maxsize=10000)
+        self.processes = {}
+        self.stopping = threading.Event()
+
+    def _spawn(self, index):
+        process = self.ctx.Process(target=_worker_main,
+                                   args=(index, self.workers, self.bridge_queue,
+                                         self.gui is not None, self.stream is not None),
+                                   name=f'webhook-worker-{index}', daemon=False)
+        process.start()
+        self.processes[index] = process
+
+    def _bridge(self):
+        """把工作进程送来的消息转交给GUI和实时推送"""
+        while not self.stopping.is_set():
+            try:
+                kind, *item = self.bridge_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if kind == 'gui':
+                self.gui.post_message(*item)
+            else:
+                self.stream.publish(*item)
+
+    def run(self):
+        from server import recover_outbox
+        recover_outbox()
+        for index in range(self.workers):
+            self._spawn(index)
+        if self.bridge_queue is not None:
+            threading.Thread(target=self._bridge, name='worker-bridge', daemon=True).start()
+
+        while not self.stopping.wait(1.0):
+            for index, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stopping.is_set():
+                    self.logger.error(f'工作进程{index}异常退出（{process.exitcode}），正在重启')
+                    self._spawn(index)
+
+    def stop(self, timeout=15):
+        """通知所有工作进程优雅退出，超时后强制结束"""
+        self.stopping.set()
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+        if self.stream is not None:
+            self.stream.stop()
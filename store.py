@@ -0,0 +1,400 @@
+import os
+import zlib
+import struct
+import bisect
+import threading
+from datetime import date, datetime, timedelta
+from config import get_config
+from message import MessageRecord
+import fastjson
+
+try:
+    import fcntl
+except ImportError:  # Windows，不支持多进程部署，进程内加锁即可
+    fcntl = None
+
+# 索引项：时间戳(float64) + 数据偏移(uint64) + 记录长度(uint32)
+INDEX_ENTRY = struct.Struct('<dQI')
+# 压缩块索引项：块在.jsonl.gz中的偏移(uint64) + 块首字节在原文件中的偏移(uint64)
+BLOCK_ENTRY = struct.Struct('<QQ')
+
+class _DayIndex:
+    """单日索引文件的只读视图，按下标随机访问，支持按时间二分查找"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'rb')
+        self.size = os.fstat(self.f.fileno()).st_size // INDEX_ENTRY.size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        self.f.seek(i * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(self.f.read(INDEX_ENTRY.size))
+
+    def timestamps(self):
+        """供bisect使用的时间戳序列视图"""
+        index = self
+
+        class _Timestamps:
+            def __len__(self):
+                return len(index)
+
+            def __getitem__(self, i):
+                return index[i][0]
+        return _Timestamps()
+
+    def close(self):
+        self.f.close()
+
+def _set_ts(record, ts):
+    if isinstance(record, MessageRecord):
+        record.ts = ts
+    else:
+        record['ts'] = ts
+
+class MessageStore:
+    """按天分文件的追加式消息存储
+
+    每条消息一行UTF-8 JSON（YYYY-MM-DD.jsonl），并在同名.idx中记录定长的
+    (时间戳, 偏移, 长度)索引，按时间范围和"最近N条"查询时可以直接定位，不必扫描整个文件。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.current_day = None
+        self.data_file = None
+        self.index_file = None
+
+    def _paths(self, day):
+        name = day.strftime('%Y-%m-%d')
+        return (os.path.join(self.directory, f'{name}.jsonl'),
+                os.path.join(self.directory, f'{name}.idx'))
+
+    def _archive_paths(self, day):
+        name = day.strftime('%Y-%m-%d')
+        return (os.path.join(self.directory, f'{name}.jsonl.gz'),
+                os.path.join(self.directory, f'{name}.blk'))
+
+    def _open_day(self, day):
+        if day == self.current_day:
+            return
+        self._close_files()
+        data_path, index_path = self._paths(day)
+        self.data_file = open(data_path, 'ab')
+        # 追加模式下仍可读，写入前读取索引末尾的时间戳
+        self.index_file = open(index_path, 'a+b')
+        self.current_day = day
+
+    def _close_files(self):
+        for f in (self.data_file, self.index_file):
+            if f is not None:
+                f.close()
+        self.data_file = self.index_file = None
+        self.current_day = None
+
+    @staticmethod
+    def make_record(payload, text_from, msg_id=None, ts=None):
+        return MessageRecord(payload, text_from, msg_id, ts)
+
+    def append(self, payload, text_from, msg_id=None, ts=None):
+        """追加一条消息，返回写入的记录"""
+        record = self.make_record(payload, text_from, msg_id, ts)
+        self.append_records([record])
+        return record
+
+    def append_records(self, records):
+        """一次写入多条记录（同一批次只加锁、flush一次）
+
+        记录在加锁前创建，并发的请求线程和多个进程写同一文件时写入顺序可能与时间戳不一致，
+        因此时间戳在锁内调整为不早于文件中的最后一条，保证每天的索引按时间有序；
+        跨越零点的批次按记录所在的日期分别写入，所在日期已压缩归档的记录写入当天。
+        """
+        if not records:
+            return
+        with self.lock:
+            today = date.today()
+            days = [self._writable_day(record, today) for record in records]
+            start = 0
+            while start < len(records):
+                stop = start + 1
+                while stop < len(records) and days[stop] == days[start]:
+                    stop += 1
+                self._write_day(days[start], records[start:stop])
+                start = stop
+
+    def _writable_day(self, record, today):
+        """记录应写入的日期
+
+        已压缩归档的日期不能再追加（.idx中的偏移指向压缩前的原文件），
+        这类迟到的记录改写入当天文件，时间戳调整为不早于当天零点。
+        """
+        day = datetime.fromtimestamp(record['ts']).date()
+        if day < today and self.is_archived(day):
+            _set_ts(record, max(record['ts'], datetime.combine(today, datetime.min.time()).timestamp()))
+            return today
+        return day
+
+    def _write_day(self, day, records):
+        """把同一天的记录写入当天文件（调用方持有self.lock）"""
+        self._open_day(day)
+        if fcntl is not None:
+            # 多进程共享同一文件时，保证偏移计算、时间戳调整与写入是原子的
+            fcntl.flock(self.data_file.fileno(), fcntl.LOCK_EX)
+        try:
+            offset = self.data_file.seek(0, os.SEEK_END)
+            last_ts = self._last_ts()
+            lines = []
+            entries = []
+            for record in records:
+                if record['ts'] < last_ts:
+                    _set_ts(record, last_ts)
+                last_ts = record['ts']
+                if isinstance(record, MessageRecord):
+                    line = record.line()
+                else:
+                    line = fastjson.dumps_bytes(record) + b'\n'
+                entries.append(INDEX_ENTRY.pack(record['ts'], offset, len(line)))
+                lines.append(line)
+                offset += len(line)
+            # 先写数据再写索引，读者看到索引时数据一定已经写入
+            self.data_file.write(b''.join(lines))
+            self.data_file.flush()
+            self.index_file.write(b''.join(entries))
+            self.index_file.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self.data_file.fileno(), fcntl.LOCK_UN)
+
+    def _last_ts(self):
+        """当天索引中最后一条记录的时间戳（可能由其他进程写入），空文件返回0"""
+        end = os.fstat(self.index_file.fileno()).st_size // INDEX_ENTRY.size * INDEX_ENTRY.size
+        if not end:
+            return 0.0
+        self.index_file.seek(end - INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(self.index_file.read(INDEX_ENTRY.size))[0]
+
+    def days(self):
+        """已有消息的日期列表（升序）"""
+        days = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.idx'):
+                try:
+                    days.append(datetime.strptime(name[:-4], '%Y-%m-%d').date())
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def _read_entries(self, day, start, stop):
+        """读取某天索引下标[start, stop)对应的记录"""
+        data_path, index_path = self._paths(day)
+        if not os.path.exists(index_path):
+            return []
+        index = _DayIndex(index_path)
+        try:
+            stop = min(stop, len(index))
+            if start >= stop:
+                return []
+            entries = [index[i] for i in range(start, stop)]
+        finally:
+            index.close()
+        records = []
+        first = entries[0][1]
+        last = entries[-1][1] + entries[-1][2]
+        chunk = self._read_range(day, first, last)
+        for ts, offset, length in entries:
+            line = chunk[offset - first:offset - first + length]
+            try:
+                records.append(fastjson.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def _read_range(self, day, first, last):
+        """读取某天原始数据[first, last)字节，已压缩的日期只解压覆盖该范围的块"""
+        data_path, _ = self._paths(day)
+        try:
+            with open(data_path, 'rb') as f:
+                f.seek(first)
+                return f.read(last - first)
+        except FileNotFoundError:
+            pass
+        archive_path, blocks_path = self._archive_paths(day)
+        with open(blocks_path, 'rb') as f:
+            blocks = list(BLOCK_ENTRY.iter_unpack(f.read()))
+        starts = [raw for _, raw in blocks]
+        lo = max(0, bisect.bisect_right(starts, first) - 1)
+        hi = bisect.bisect_left(starts, last)
+        with open(archive_path, 'rb') as f:
+            f.seek(blocks[lo][0])
+            compressed = f.read(blocks[hi][0] - blocks[lo][0]) if hi < len(blocks) else f.read()
+        parts = []
+        for i in range(lo, hi):
+            end = blocks[i + 1][0] - blocks[lo][0] if i + 1 < len(blocks) else len(compressed)
+            # 每块是一个独立的gzip成员
+            parts.append(zlib.decompress(compressed[blocks[i][0] - blocks[lo][0]:end], 31))
+        data = b''.join(parts)
+        return data[first - blocks[lo][1]:last - blocks[lo][1]]
+
+    def is_archived(self, day):
+        return not os.path.exists(self._paths(day)[0]) and os.path.exists(self._archive_paths(day)[1])
+
+    def compress_day(self, day, block_size=256 * 1024):
+        """把某天的.jsonl压缩为分块gzip（.jsonl.gz，每块一个gzip成员，整体仍可用zcat读取）
+
+        同时写出块索引（.blk），.idx中的偏移保持不变，读取时只解压需要的块。
+        返回压缩前后的字节数，当天（仍在写入）或已压缩的日期返回None。
+        """
+        with self.lock:
+            if day == self.current_day:
+                return None
+        data_path, _ = self._paths(day)
+        archive_path, blocks_path = self._archive_paths(day)
+        if not os.path.exists(data_path):
+            return None
+        raw_size = 0
+        blocks = []
+        with open(data_path, 'rb') as src, open(archive_path + '.tmp', 'wb') as dst:
+            pending = []
+            pending_size = 0
+
+            def flush_block():
+                nonlocal pending_size
+                blocks.append(BLOCK_ENTRY.pack(dst.tell(), raw_size - pending_size))
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                dst.write(compressor.compress(b''.join(pending)) + compressor.flush())
+                pending.clear()
+                pending_size = 0
+
+            # 按行切块，块边界与记录边界对齐
+            for line in src:
+                pending.append(line)
+                pending_size += len(line)
+                raw_size += len(line)
+                if pending_size >= block_size:
+                    flush_block()
+            if pending:
+                flush_block()
+            dst.flush()
+            os.fsync(dst.fileno())
+            archived_size = dst.tell()
+        with open(blocks_path + '.tmp', 'wb') as f:
+            f.write(b''.join(blocks))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(blocks_path + '.tmp', blocks_path)
+        os.replace(archive_path + '.tmp', archive_path)
+        # 已经打开原文件的读者不受影响，之后的读者改读压缩文件
+        os.remove(data_path)
+        return raw_size, archived_size
+
+    def delete_day(self, day):
+        """删除某天的全部消息文件，返回释放的字节数"""
+        with self.lock:
+            if day == self.current_day:
+                self._close_files()
+        freed = 0
+        for path in self._paths(day) + self._archive_paths(day):
+            try:
+                freed += os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def day_size(self, day):
+        """某天消息文件（含索引）占用的字节数"""
+        size = 0
+        for path in self._paths(day) + self._archive_paths(day):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def count(self, day):
+        _, index_path = self._paths(day)
+        try:
+            return os.path.getsize(index_path) // INDEX_ENTRY.size
+        except OSError:
+            return 0
+
+    def read_day(self, day, start=0, stop=None):
+        """按下标读取某天的记录"""
+        return self._read_entries(day, start, stop if stop is not None else self.count(day))
+
+    def iter_day(self, day, start=0, chunk=1000):
+        """按块流式读取某天的记录，已压缩的日期每次只解压当前块需要的数据"""
+        count = self.count(day)
+        while start < count:
+            yield from self._read_entries(day, start, min(count, start + chunk))
+            start += chunk
+
+    def last(self, n, day=None):
+        """最近n条消息（按时间升序），day为空时跨天向前查找"""
+        days = [day] if day is not None else list(reversed(self.days()))
+        result = []
+        for d in days:
+            count = self.count(d)
+            need = n - len(result)
+            result = self._read_entries(d, max(0, count - need), count) + result
+            if len(result) >= n:
+                break
+        return result
+
+    def _bisect(self, day, ts):
+        """某天中第一条时间不早于ts的记录下标"""
+        _, index_path = self._paths(day)
+        if not os.path.exists(index_path):
+            return 0
+        index = _DayIndex(index_path)
+        try:
+            return bisect.bisect_left(index.timestamps(), ts)
+        finally:
+            index.close()
+
+    def range(self, start_ts, end_ts):
+        """时间范围[start_ts, end_ts)内的消息"""
+        result = []
+        day = datetime.fromtimestamp(start_ts).date()
+        end_day = datetime.fromtimestamp(end_ts).date()
+        while day <= end_day:
+            if self.count(day):
+                lo = self._bisect(day, start_ts)
+                hi = self._bisect(day, end_ts)
+                result.extend(self._read_entries(day, lo, hi))
+            day += timedelta(days=1)
+        return result
+
+    def before(self, before_ts, n):
+        """时间早于before_ts的最近n条消息（按时间升序），用于向前分页"""
+        before_day = datetime.fromtimestamp(before_ts).date()
+        result = []
+        for day in reversed(self.days()):
+            if day > before_day:
+                continue
+            hi = self._bisect(day, before_ts) if day == before_day else self.count(day)
+            need = n - len(result)
+            result = self._read_entries(day, max(0, hi - need), hi) + result
+            if len(result) >= n:
+                break
+        return result
+
+    def close(self):
+        with self.lock:
+            self._close_files()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """进程内共享的消息存储（位于日志目录下的messages子目录）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MessageStore(os.path.join(get_config().log_dir, 'messages'))
+    return _store
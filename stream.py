@@ -0,0 +1,358 @@
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from metrics import STREAM_EVICTIONS
+from message import MessageRecord, unwrap_message
+import fastjson
+
+MAX_REQUEST_SIZE = 8192
+
+def event_id(record):
+    return f"{record['ts']!r}-{record['id']}"
+
+def encode_event(record, message=None):
+    """把一条记录编码为SSE事件（每条消息只编码一次，所有订阅者共享）"""
+    if isinstance(record, MessageRecord) and message is None:
+        encoded = record.payload_bytes
+    elif isinstance(record, MessageRecord) and message is record.display:
+        encoded = record.display_bytes
+    else:
+        encoded = fastjson.dumps_bytes(message if message is not None else record['payload'])
+    data = fastjson.join_object([
+        ('id', fastjson.dumps_bytes(record['id'])),
+        ('ts', repr(record['ts']).encode()),
+        ('text_from', fastjson.dumps_bytes(record['text_from'])),
+        ('message', encoded)
+    ])
+    return f"id: {event_id(record)}\nevent: message\ndata: ".encode('utf-8') + data + b'\n\n'
+
+class Subscriber:
+    __slots__ = ('sock', 'addr', 'text_from', 'buffer', 'out', 'replaying', 'closed', 'evicted', 'mask')
+
+    def __init__(self, sock, addr, text_from=None):
+        self.sock = sock
+        self.addr = addr
+        self.text_from = text_from
+        # 待发送的(时间戳, 事件字节)，超过上限的订阅者被断开
+        self.buffer = deque()
+        self.out = b''
+        self.replaying = False
+        self.closed = False
+        self.evicted = False
+        self.mask = selectors.EVENT_READ
+
+class _Handshake:
+    __slots__ = ('sock', 'addr', 'data', 'deadline')
+
+    def __init__(self, sock, addr, deadline):
+        self.sock = sock
+        self.addr = addr
+        self.data = b''
+        # 在此之前未发完请求头的连接会被关闭
+        self.deadline = deadline
+
+class StreamHub:
+    """实时消息广播：Server-Sent Events，所有订阅连接由一个selector线程以非阻塞方式处理
+
+    publish()只把编码好的事件追加到各订阅者的有界缓冲区，不做任何网络IO，不会阻塞接收请求；
+    缓冲区满的慢订阅者直接断开，客户端重连时带上Last-Event-ID即可从消息存储补发错过的消息。
+    尚未发完请求头的连接最多保留handshake_timeout秒，数量超过max_pending时新连接直接关闭。
+    """
+
+    def __init__(self, store, logger, check_api_key, buffer_size=1000, max_subscribers=1000,
+                 replay_limit=1000, keepalive=15.0, handshake_timeout=5.0, max_pending=64):
+        self.store = store
+        self.logger = logger
+        self.check_api_key = check_api_key
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.replay_limit = replay_limit
+        self.keepalive = keepalive
+        self.handshake_timeout = handshake_timeout
+        self.max_pending = max_pending
+        self.handshakes = set()
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.selector = selectors.DefaultSelector()
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.woken = False
+        self.listener = None
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def from_config(cls, config, store, logger, check_api_key):
+        """根据[stream]配置创建，未启用时返回None"""
+        if not config.getboolean('stream', 'enabled', fallback=False):
+            return None
+        return cls(
+            store, logger, check_api_key,
+            buffer_size=config.getint('stream', 'buffer_size', fallback=1000),
+            max_subscribers=config.getint('stream', 'max_subscribers', fallback=1000),
+            replay_limit=config.getint('stream', 'replay_limit', fallback=1000),
+            keepalive=config.getfloat('stream', 'keepalive', fallback=15.0),
+            handshake_timeout=config.getfloat('stream', 'handshake_timeout', fallback=5.0),
+            max_pending=config.getint('stream', 'max_pending', fallback=64)
+        )
+
+    def start(self, host, port, backlog=128):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(backlog)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, 'listener')
+        self.selector.register(self.wake_r, selectors.EVENT_READ, 'wakeup')
+        self.thread = threading.Thread(target=self._loop, name='stream', daemon=True)
+        self.thread.start()
+        return self
+
+    @property
+    def port(self):
+        return self.listener.getsockname()[1]
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        self._wake()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def publish(self, record, message=None):
+        """广播一条新消息（供请求线程调用）"""
+        if not self.subscribers:
+            return
+        event = (record['ts'], encode_event(record, message))
+        with self.lock:
+            for sub in self.subscribers:
+                if sub.text_from and sub.text_from != record['text_from']:
+                    continue
+                if len(sub.buffer) >= self.buffer_size:
+                    sub.evicted = True
+                    continue
+                sub.buffer.append(event)
+        self._wake()
+
+    def _wake(self):
+        # 唤醒已在进行中时不再重复写socket
+        if self.woken:
+            return
+        self.woken = True
+        try:
+            self.wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _loop(self):
+        last_ping = time.monotonic()
+        while not self.stopping.is_set():
+            for key, mask in self.selector.select(timeout=1.0):
+                data = key.data
+                if data == 'listener':
+                    self._accept()
+                elif data == 'wakeup':
+                    # 先读空唤醒socket再清除标记：反过来时，两步之间的publish写入的字节会被读掉
+                    # 而标记仍为True，之后的publish都不再唤醒，事件要等到select超时才发出
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    self.woken = False
+                elif isinstance(data, _Handshake):
+                    self._read_request(data)
+                elif mask & selectors.EVENT_READ:
+                    # 订阅者不应发送数据，可读通常意味着连接已关闭
+                    try:
+                        if not data.sock.recv(4096):
+                            data.closed = True
+                    except BlockingIOError:
+                        pass
+                    except OSError:
+                        data.closed = True
+
+            now = time.monotonic()
+            for conn in [c for c in self.handshakes if c.deadline <= now]:
+                self._drop(conn)
+            ping = now - last_ping >= self.keepalive
+            if ping:
+                last_ping = now
+            with self.lock:
+                subscribers = list(self.subscribers)
+            for sub in subscribers:
+                if ping and not sub.replaying:
+                    sub.out += b': ping\n\n'
+                self._flush(sub)
+        for sub in list(self.subscribers):
+            self._close(sub)
+        for conn in list(self.handshakes):
+            self._drop(conn)
+        self.selector.close()
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self.listener.accept()
+            except BlockingIOError:
+                return
+            if len(self.handshakes) >= self.max_pending:
+                sock.close()
+                continue
+            sock.setblocking(False)
+            conn = _Handshake(sock, addr, time.monotonic() + self.handshake_timeout)
+            self.handshakes.add(conn)
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+
+    def _drop(self, conn):
+        """关闭未完成握手的连接"""
+        self.handshakes.discard(conn)
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+
+    def _respond(self, conn, status, body):
+        self.handshakes.discard(conn)
+        self.selector.unregister(conn.sock)
+        try:
+            conn.sock.send(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                           f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+        except OSError:
+            pass
+        conn.sock.close()
+
+    def _read_request(self, conn):
+        try:
+            chunk = conn.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            self._drop(conn)
+            return
+        conn.data += chunk
+        if b'\r\n\r\n' not in conn.data:
+            if len(conn.data) > MAX_REQUEST_SIZE:
+                self._respond(conn, '431 Request Header Fields Too Large', b'{"error": "Request too large"}')
+            return
+
+        head = conn.data.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = head[0].split(' ', 2)
+        except ValueError:
+            self._respond(conn, '400 Bad Request', b'{"error": "Bad request"}')
+            return
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if method != 'GET' or url.path != '/stream':
+            self._respond(conn, '404 Not Found', b'{"error": "Not found"}')
+            return
+        if self.check_api_key(params.get('api_key')) is None:
+            self._respond(conn, '401 Unauthorized', b'{"error": "Invalid API key"}')
+            return
+        if len(self.subscribers) >= self.max_subscribers:
+            self._respond(conn, '503 Service Unavailable', b'{"error": "Too many subscribers"}')
+            return
+
+        self.handshakes.discard(conn)
+        sub = Subscriber(conn.sock, conn.addr, params.get('text_from'))
+        sub.out = (b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n'
+                   b'Cache-Control: no-cache\r\nConnection: keep-alive\r\n'
+                   b'Access-Control-Allow-Origin: *\r\n\r\nretry: 3000\n\n')
+        self.selector.modify(conn.sock, selectors.EVENT_READ, sub)
+        last_event_id = headers.get('last-event-id') or params.get('last_event_id')
+        if last_event_id:
+            sub.replaying = True
+        with self.lock:
+            self.subscribers.add(sub)
+        if last_event_id:
+            # 从存储读取错过的消息可能较慢，放到单独线程中，期间的新消息先缓存在订阅者缓冲区
+            threading.Thread(target=self._replay, args=(sub, last_event_id),
+                             name='stream-replay', daemon=True).start()
+
+    def _replay(self, sub, last_event_id):
+        """补发Last-Event-ID之后的消息，再接上回放期间缓存的实时消息"""
+        events = []
+        try:
+            ts_text, _, last_id = last_event_id.partition('-')
+            last_ts = float(ts_text)
+            records = self.store.range(last_ts, time.time() + 1)
+            # 跳过时间戳相同、在上次收到的消息之前或就是它的记录
+            seen = last_id not in {r['id'] for r in records if r['ts'] == last_ts}
+            for r in records:
+                if not seen:
+                    seen = r['id'] == last_id
+                    continue
+                if sub.text_from and sub.text_from != r['text_from']:
+                    continue
+                # 与实时推送一致，发送解开后的显示内容
+                events.append((r['ts'], encode_event(r, unwrap_message(r['payload']))))
+        except ValueError:
+            self.logger.warning(f'无效的Last-Event-ID: {last_event_id}')
+        except Exception as e:
+            self.logger.error(f'补发历史消息失败: {str(e)}')
+        skipped = max(0, len(events) - self.replay_limit)
+        events = events[skipped:]
+        if skipped:
+            events.insert(0, (0, f': skipped {skipped} older messages\n\n'.encode()))
+        with self.lock:
+            replayed_ts = events[-1][0] if events else None
+            live = [e for e in sub.buffer if replayed_ts is None or e[0] > replayed_ts]
+            sub.buffer = deque(events + live)
+            sub.replaying = False
+        self._wake()
+
+    def _flush(self, sub):
+        if sub.closed or sub.evicted:
+            self._close(sub)
+            return
+        if not sub.replaying and sub.buffer:
+            with self.lock:
+                events = [e for _, e in sub.buffer]
+                sub.buffer.clear()
+            sub.out += b''.join(events)
+        if not sub.out:
+            return
+        try:
+            sent = sub.sock.send(sub.out)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(sub)
+            return
+        sub.out = sub.out[sent:]
+        # 发送缓冲区堆积过多（客户端不读取）时同样视为慢订阅者
+        if len(sub.out) > self.buffer_size * 4096:
+            sub.evicted = True
+            self._close(sub)
+            return
+        mask = selectors.EVENT_READ | (selectors.EVENT_WRITE if sub.out else 0)
+        if mask != sub.mask:
+            sub.mask = mask
+            self.selector.modify(sub.sock, mask, sub)
+
+    def _close(self, sub):
+        with self.lock:
+            if sub not in self.subscribers:
+                return
+            self.subscribers.discard(sub)
+        if sub.evicted:
+            STREAM_EVICTIONS.inc()
+            self.logger.warning(f'实时订阅者{sub.addr[0]}接收过慢，已断开')
+        try:
+            self.selector.unregister(sub.sock)
+        except (KeyError, ValueError):
+            pass
+        sub.sock.close()
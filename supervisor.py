@@ -0,0 +1,78 @@
+import signal
+import threading
+from config import reload_config
+
+class Supervisor:
+    """无GUI模式的进程守护：阻塞等待信号，而不是空转占用CPU
+
+    SIGTERM/SIGINT触发优雅关闭，SIGHUP重新加载配置；服务线程意外退出时同样结束进程。
+    """
+
+    def __init__(self, service, logger, drain_timeout=10):
+        self.service = service
+        self.logger = logger
+        self.drain_timeout = drain_timeout
+        self.shutdown = threading.Event()
+        self.reload_requested = threading.Event()
+        self.server_thread = None
+        self.reload_thread = None
+
+    def install_signals(self, handle_stop=True):
+        """注册信号处理，GUI模式下由Tk主循环负责退出，只处理SIGHUP"""
+        if handle_stop:
+            signal.signal(signal.SIGINT, self._on_stop)
+            signal.signal(signal.SIGTERM, self._on_stop)
+        # Windows无SIGHUP
+        if hasattr(signal, 'SIGHUP'):
+            self.reload_thread = threading.Thread(target=self._reload_loop, name='config-reload', daemon=True)
+            self.reload_thread.start()
+            signal.signal(signal.SIGHUP, self._on_reload)
+
+    def _on_stop(self, signum, frame):
+        self.logger.info(f'收到信号{signum}，正在关闭服务器...')
+        self.shutdown.set()
+
+    def _on_reload(self, signum, frame):
+        # 信号处理函数在主线程的字节码之间执行，主线程此时可能正持有配置锁（不可重入），
+        # 在这里重新加载会死锁；只设置标记，由后台线程加载
+        self.reload_requested.set()
+
+    def _reload_loop(self):
+        while not self.shutdown.is_set():
+            if not self.reload_requested.wait(1.0):
+                continue
+            self.reload_requested.clear()
+            try:
+                reload_config()
+            except Exception as e:
+                self.logger.error(f'重新加载配置失败: {str(e)}')
+            else:
+                self.logger.warning('收到SIGHUP，已重新加载配置')
+
+    def _run_service(self):
+        try:
+            self.service.run()
+        except Exception as e:
+            self.logger.error(f'服务异常退出: {str(e)}')
+        finally:
+            self.shutdown.set()
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self.server_thread = threading.Thread(target=self._run_service, name='webhook-server', daemon=True)
+        self.server_thread.start()
+
+    def wait(self):
+        """阻塞直到收到退出信号或服务线程结束"""
+        # 带超时等待，保证Windows下Ctrl+C也能及时响应
+        while not self.shutdown.wait(1.0):
+            pass
+
+    def stop(self):
+        """停止服务并在超时时间内等待服务线程退出"""
+        self.shutdown.set()
+        self.service.stop(self.drain_timeout)
+        if self.server_thread is not None:
+            self.server_thread.join(self.drain_timeout)
+            if self.server_thread.is_alive():
+                self.logger.warning('服务线程未能在超时时间内退出')
@@ -0,0 +1,49 @@
+import configparser
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_KEY = 'test-api-key'
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """在临时目录中按config.ini加覆盖项创建应用，返回(app, 测试客户端)"""
+    import config
+    import search
+    import store
+    from server import create_app, close_app
+
+    apps = []
+
+    def factory(overrides=None, workers=1, **kwargs):
+        parser = configparser.ConfigParser()
+        parser.read(os.path.join(ROOT, 'config.ini'), encoding='utf-8')
+        parser['security']['api_key'] = API_KEY
+        parser['logging']['dir'] = str(tmp_path / 'logs')
+        parser['outbox']['path'] = str(tmp_path / 'logs' / 'outbox.db')
+        parser['search']['path'] = str(tmp_path / 'logs' / 'search.db')
+        for name in ('ratelimit', 'dedup', 'stream', 'retention', 'outbox'):
+            parser[name]['enabled'] = 'false'
+        for section, options in (overrides or {}).items():
+            if not parser.has_section(section):
+                parser.add_section(section)
+            for key, value in options.items():
+                parser[section][key] = str(value)
+        with open(tmp_path / 'config.ini', 'w', encoding='utf-8') as f:
+            parser.write(f)
+        monkeypatch.chdir(tmp_path)
+        # 消息存储和搜索索引是按进程缓存的单例，每个测试重新创建
+        monkeypatch.setattr(store, '_store', None)
+        monkeypatch.setattr(search, '_index', None)
+        config.reload_config()
+        app = create_app(None, workers=workers, **kwargs)
+        apps.append(app)
+        return app, app.test_client()
+
+    yield factory
+    for app in apps:
+        close_app(app, 1)
@@ -0,0 +1,72 @@
+import io
+
+import pytest
+
+from batch import BatchFormatError, iter_json_array, iter_ndjson
+from conftest import API_KEY
+
+def parse_array(data, chunk_size=4, **kwargs):
+    return list(iter_json_array(io.BytesIO(data), chunk_size=chunk_size, **kwargs))
+
+def test_array_items():
+    assert parse_array(b' [ "a", 3 , {"message": "b"} ] ') == ['a', 3, {'message': 'b'}]
+
+def test_empty_array():
+    assert parse_array(b'[]') == []
+    assert parse_array(b'[ \n ]') == []
+
+@pytest.mark.parametrize('body', [b'["a", 3, ]', b'["a",]', b'[,]', b'["a" 3]', b'["a", 3', b'{"a": 1}'])
+def test_invalid_array(body):
+    with pytest.raises(BatchFormatError):
+        parse_array(body)
+
+def test_number_at_chunk_boundary():
+    assert parse_array(b'[1234, 5678]', chunk_size=5) == [1234, 5678]
+
+def test_multibyte_sequence_split_across_chunks():
+    data = '["消息内容", "数据"]'.encode('utf-8')
+    for chunk_size in range(1, 8):
+        assert parse_array(data, chunk_size=chunk_size) == ['消息内容', '数据']
+
+def test_large_item_and_size_limit():
+    item = 'x' * 100000
+    data = f'["{item}", 1]'.encode()
+    assert parse_array(data, chunk_size=1024) == [item, 1]
+    with pytest.raises(BatchFormatError):
+        parse_array(data, chunk_size=1024, max_item_size=50000)
+
+def parse_ndjson(data, chunk_size=4, **kwargs):
+    return list(iter_ndjson(io.BytesIO(data), chunk_size=chunk_size, **kwargs))
+
+def test_ndjson_blank_lines():
+    assert parse_ndjson(b'\n{"message": "a"}\n\n  \r\n"b"\r\n\n3') == [{'message': 'a'}, 'b', 3]
+
+def test_ndjson_invalid_line_is_reported_in_place():
+    items = parse_ndjson(b'"a"\n{oops\n"b"\n')
+    assert items[0] == 'a' and isinstance(items[1], BatchFormatError) and items[2] == 'b'
+
+def test_ndjson_multibyte_sequence_split_across_chunks():
+    data = '"消息"\n{"message": "数据"}\n'.encode('utf-8')
+    for chunk_size in range(1, 8):
+        assert parse_ndjson(data, chunk_size=chunk_size) == ['消息', {'message': '数据'}]
+
+def test_ndjson_line_size_limit():
+    items = parse_ndjson(b'"a"\n"' + b'x' * 100 + b'"\n"b"', max_item_size=50)
+    assert items[0] == 'a' and isinstance(items[1], BatchFormatError) and items[2] == 'b'
+
+def test_batch_endpoint_status(make_app):
+    _, client = make_app({'server': {'max_content_mb': '1'}})
+    url = f'/webhook/batch?api_key={API_KEY}'
+    response = client.post(url, data=b'["a", 3, ]', content_type='application/json')
+    assert response.status_code == 400
+    assert response.json['status'] == 'error' and response.json['accepted'] == 2
+
+    response = client.post(url, data=b'[]', content_type='application/json')
+    assert response.status_code == 400
+    assert response.json['status'] == 'error' and response.json['accepted'] == 0
+
+    response = client.post(url, data=b'["a", "b"]', content_type='application/json')
+    assert response.status_code == 202 and response.json['status'] == 'accepted'
+
+    response = client.post(url, data=b'["' + b'x' * (2 * 1024 * 1024) + b'"]', content_type='application/json')
+    assert response.status_code == 413
@@ -0,0 +1,56 @@
+import pytest
+
+from channels import Channel, register_channel, message_text
+from conftest import API_KEY
+
+SENT = {}
+
+@register_channel('recorder')
+class RecorderChannel(Channel):
+    """记录收到的消息的测试渠道"""
+
+    @classmethod
+    def from_section(cls, name, section, logger):
+        SENT[name] = []
+        return cls(name, logger)
+
+    def send(self, message):
+        SENT[self.name].append(message_text(message))
+        return True
+
+@pytest.fixture
+def client(make_app):
+    _, client = make_app({
+        'channel:relay': {'type': 'recorder', 'enabled': 'true', 'exclude_from': 'secret'},
+        'channel:alerts': {'type': 'recorder', 'enabled': 'true', 'match': 'ALERT'},
+        'channel:all': {'type': 'recorder', 'enabled': 'true'}
+    })
+    return client
+
+def post_batch(client, items):
+    response = client.post(f'/webhook/batch?api_key={API_KEY}&mode=sync', json=items)
+    assert response.status_code == 200, response.json
+    return response.json
+
+def test_exclude_from_is_applied_per_message(client):
+    post_batch(client, [
+        {'message': 'hello', 'text_from': 'public'},
+        {'message': 'TOP SECRET', 'text_from': 'secret'},
+        {'message': 'bye', 'text_from': 'public'}
+    ])
+    assert not any('TOP SECRET' in text for text in SENT['relay'])
+    assert '\n\n'.join(SENT['relay']).count('[public]') == 2
+    assert any('TOP SECRET' in text for text in SENT['all'])
+
+def test_match_is_applied_per_message(client):
+    body = post_batch(client, ['ALERT disk full', 'routine', 'ALERT cpu'])
+    alerts = '\n\n'.join(SENT['alerts'])
+    assert 'disk full' in alerts and 'cpu' in alerts
+    assert 'routine' not in alerts
+    assert 'alerts' not in body['results'][1]['details']
+    assert body['results'][0]['details']['alerts'] == 'success'
+
+def test_same_route_is_still_merged(client):
+    post_batch(client, ['one', 'two', 'three'])
+    assert len(SENT['all']) == 1
+    assert SENT['relay'] == SENT['all']
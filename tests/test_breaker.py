@@ -0,0 +1,81 @@
+import pytest
+
+import breaker as breaker_module
+from breaker import CircuitBreaker
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker_module.time, 'monotonic', clock.monotonic)
+    return clock
+
+def test_opens_at_error_rate_after_min_calls(clock):
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=4, reset_timeout=30)
+    breaker.record(True)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open'
+    assert breaker.before_call() == pytest.approx(30)
+
+def test_low_error_rate_stays_closed(clock):
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=4)
+    for ok in (True, True, True, False, True, False):
+        breaker.record(ok)
+    assert breaker.state == 'closed'
+    assert breaker.before_call() == 0
+
+def test_old_failures_leave_the_window(clock):
+    breaker = CircuitBreaker(error_rate=0.5, min_calls=3, window=10, buckets=10)
+    breaker.record(False)
+    breaker.record(False)
+    clock.now += 11
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()['calls'] == 1
+
+def open_breaker(clock, **kwargs):
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=30, **kwargs)
+    breaker.record(False, 'down')
+    assert breaker.state == 'open'
+    clock.now += 30
+    assert breaker.state == 'half_open'
+    return breaker
+
+def test_trial_call_success_closes(clock):
+    breaker = open_breaker(clock)
+    assert breaker.before_call() == 0
+    # 试探进行中时其他调用继续等待
+    assert breaker.before_call() > 0
+    breaker.record(True)
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()['calls'] == 0
+
+def test_trial_call_failure_reopens(clock):
+    breaker = open_breaker(clock)
+    assert breaker.before_call() == 0
+    breaker.record(False, 'still down')
+    assert breaker.state == 'open'
+    assert breaker.before_call() == pytest.approx(30)
+    assert breaker.snapshot()['last_error'] == 'still down'
+
+def test_probed_breaker_waits_for_probe(clock):
+    breaker = open_breaker(clock, probed=True)
+    assert breaker.before_call() > 0
+    assert breaker.probe_due()
+    assert not breaker.probe_due()
+    breaker.record_probe(False, 'refused')
+    assert breaker.state == 'open' and not breaker.probe_due()
+    clock.now += 30
+    assert breaker.probe_due()
+    breaker.record_probe(True)
+    assert breaker.state == 'closed'
+    assert breaker.before_call() == 0
@@ -0,0 +1,20 @@
+from breaker import CircuitBreaker, redact_error
+from conftest import API_KEY
+
+def test_redact_error_hides_url_path_and_query():
+    error = ("HTTPSConnectionPool(host='hooks.example.com', port=443): Max retries exceeded "
+             "with url: /services/SECRET?token=abc (Caused by NewConnectionError('refused'))")
+    assert 'SECRET' not in redact_error(error) and 'token' not in redact_error(error)
+    error = '404 Client Error: Not Found for url: https://user:pw@hooks.example.com/services/SECRET?token=abc'
+    assert redact_error(error) == '404 Client Error: Not Found for url: https://hooks.example.com/***'
+
+def test_breaker_stores_redacted_error():
+    breaker = CircuitBreaker()
+    breaker.record(False, 'failed: https://hooks.example.com/SECRET')
+    assert breaker.snapshot()['last_error'] == 'failed: https://hooks.example.com/***'
+
+def test_status_requires_api_key(make_app):
+    _, client = make_app()
+    assert client.get('/channels/status').status_code == 401
+    assert client.get('/channels/status?api_key=wrong').status_code == 401
+    assert client.get(f'/channels/status?api_key={API_KEY}').status_code == 200
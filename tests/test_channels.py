@@ -0,0 +1,80 @@
+import configparser
+import logging
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from channels import Channel, ChannelRegistry
+
+logger = logging.getLogger('test')
+
+class FakeChannel(Channel):
+    """按给定函数发送的测试渠道"""
+
+    def __init__(self, name, send=None, send_timeout=1.0, **section):
+        super().__init__(name, logger, send_timeout)
+        parser = configparser.ConfigParser()
+        parser.read_dict({'channel': section})
+        self.configure(parser['channel'])
+        self.sent = []
+        self.sender = send or (lambda message: True)
+
+    def send(self, message):
+        self.sent.append(message)
+        return self.sender(message)
+
+@pytest.fixture
+def registry():
+    created = []
+
+    def factory(*channels):
+        registry = ChannelRegistry(list(channels), logger)
+        created.append(registry)
+        return registry
+
+    yield factory
+    for registry in created:
+        registry.close()
+
+def test_route_applies_each_channel_rule(registry):
+    channels = registry(FakeChannel('all'),
+                        FakeChannel('ops', text_from='ops, infra'),
+                        FakeChannel('public', exclude_from='secret'),
+                        FakeChannel('alerts', match='^ALERT'))
+    assert channels.route('hello', 'ops') == ['all', 'ops', 'public']
+    assert channels.route('hello', 'secret') == ['all']
+    assert channels.route('ALERT disk', 'web') == ['all', 'public', 'alerts']
+    assert channels.route({'level': 'ALERT'}, 'web') == ['all', 'public']
+
+def test_fan_out_reports_each_channel(registry):
+    release = threading.Event()
+
+    def broken(message):
+        raise OSError('down')
+    pending = Future()
+    channels = registry(FakeChannel('ok'),
+                        FakeChannel('refused', lambda m: False),
+                        FakeChannel('broken', broken),
+                        FakeChannel('slow', lambda m: release.wait(2), send_timeout=0.1),
+                        FakeChannel('digest', lambda m: pending))
+    try:
+        assert channels.fan_out('hello') == {
+            'ok': 'success', 'refused': 'failed', 'broken': 'failed', 'slow': 'timeout', 'digest': 'pending'
+        }
+    finally:
+        release.set()
+
+def test_fan_out_only_to_named_channels(registry):
+    first, second = FakeChannel('first'), FakeChannel('second')
+    channels = registry(first, second)
+    assert channels.fan_out('hello', ['second']) == {'second': 'success'}
+    assert first.sent == [] and second.sent == ['hello']
+
+def test_fan_out_skips_open_circuit(registry):
+    flaky = FakeChannel('flaky', lambda m: False, breaker_min_calls='2', breaker_reset='60')
+    channels = registry(flaky)
+    assert channels.fan_out('1') == {'flaky': 'failed'}
+    assert channels.fan_out('2') == {'flaky': 'failed'}
+    assert channels.fan_out('3') == {'flaky': 'circuit_open'}
+    assert flaky.sent == ['1', '2']
@@ -0,0 +1,32 @@
+from config import parse_config
+
+CONFIG = """
+[server]
+Port = 5050
+
+[security]
+API_Key = Default-Key
+
+[logging]
+Log_Dir = ignored
+DIR = custom-logs
+
+[api_keys]
+MixedCase-Key = monitor
+"""
+
+def test_option_names_are_case_insensitive(tmp_path):
+    path = tmp_path / 'config.ini'
+    path.write_text(CONFIG, encoding='utf-8')
+    config = parse_config(str(path))
+    assert config.port == 5050
+    assert config.log_dir == 'custom-logs'
+    assert config.parser.get('security', 'api_key') == 'Default-Key'
+    assert config.check_api_key('Default-Key') is not None
+
+def test_api_keys_keep_their_case(tmp_path):
+    path = tmp_path / 'config.ini'
+    path.write_text(CONFIG, encoding='utf-8')
+    config = parse_config(str(path))
+    assert config.check_api_key('MixedCase-Key') == 'monitor'
+    assert config.check_api_key('mixedcase-key') is None
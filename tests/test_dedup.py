@@ -0,0 +1,37 @@
+import threading
+
+from conftest import API_KEY
+from dedup import SharedDedupCache
+
+def test_shared_cache_is_seen_by_other_process(tmp_path):
+    # 两个实例使用同一个数据库，相当于两个工作进程
+    first = SharedDedupCache(str(tmp_path / 'dedup.db'))
+    second = SharedDedupCache(str(tmp_path / 'dedup.db'), wait_timeout=2)
+    key = SharedDedupCache.make_key(API_KEY, 'abc')
+    assert first.claim(key) == ('new', None)
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(second.claim(key)))
+    waiter.start()
+    first.complete(key, ({'status': 'accepted', 'delivery_id': 'x'}, 202))
+    waiter.join()
+    assert results == [('done', ({'status': 'accepted', 'delivery_id': 'x'}, 202))]
+    assert len(second) == 1
+
+def test_shared_cache_discard_and_expiry(tmp_path):
+    cache = SharedDedupCache(str(tmp_path / 'dedup.db'), window=-1, wait_timeout=0)
+    key = SharedDedupCache.make_key(API_KEY, 'abc')
+    assert cache.claim(key)[0] == 'new'
+    # 窗口已过，同一个键可以重新登记
+    assert cache.claim(key)[0] == 'new'
+    cache.discard(key)
+    assert len(cache) == 0
+
+def test_webhook_replays_with_shared_cache(make_app):
+    _, client = make_app({'dedup': {'enabled': 'true'}}, workers=2)
+    url = f'/webhook?api_key={API_KEY}'
+    first = client.post(url, json={'message': 'hi'}, headers={'Idempotency-Key': 'k1'})
+    second = client.post(url, json={'message': 'hi'}, headers={'Idempotency-Key': 'k1'})
+    assert first.status_code == second.status_code == 202
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.json['delivery_id'] == first.json['delivery_id']
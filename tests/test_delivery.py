@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from breaker import CircuitOpenError
+from delivery import DeliveryQueue
+from outbox import Outbox
+
+logger = logging.getLogger('test')
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+@pytest.fixture
+def queues(tmp_path):
+    created = []
+
+    def factory(handlers, outbox=True, poll_interval=3600, **kwargs):
+        box = None
+        if outbox:
+            box = Outbox(str(tmp_path / 'outbox.db'), logger, backoff_base=0.01, purge_interval=0)
+        delivery = DeliveryQueue(handlers, logger, outbox=box, poll_interval=poll_interval, **kwargs)
+        created.append(delivery)
+        return delivery
+
+    yield factory
+    for delivery in created:
+        delivery.stop(1)
+
+def test_status_follows_retry_done_by_another_worker(queues):
+    # 两个工作进程共享发件箱：提交的进程投递失败，重试由另一个进程完成
+    submitter = queues({'onebot': lambda message: False})
+    submitter.submit('hello', delivery_id='a')
+    assert wait_for(lambda: submitter.get_status('a')['details'] == {'onebot': 'retrying'})
+
+    delivered = []
+    queues({'onebot': lambda message: delivered.append(message) or True}, poll_interval=0.02, recover=False)
+    assert wait_for(lambda: delivered == ['hello'])
+    assert wait_for(lambda: submitter.get_status('a')['status'] == 'success')
+    assert submitter.get_status('a')['details'] == {'onebot': 'success'}
+
+def test_submit_delivers_to_each_channel(queues):
+    received = {'a': [], 'b': []}
+
+    def handler(name):
+        return lambda message: received[name].append(message) or True
+    delivery = queues({name: handler(name) for name in received}, outbox=False)
+    status = delivery.submit('hello', delivery_id='x')
+    assert status['status'] == 'pending' and set(status['details']) == {'a', 'b'}
+    assert wait_for(lambda: delivery.get_status('x')['status'] == 'success')
+    assert received == {'a': ['hello'], 'b': ['hello']}
+
+def test_submit_to_selected_channels(queues):
+    delivery = queues({'a': lambda m: True, 'b': lambda m: True}, outbox=False)
+    delivery.submit('hello', delivery_id='x', channels=['b'])
+    assert wait_for(lambda: delivery.get_status('x')['status'] == 'success')
+    assert delivery.get_status('x')['details'] == {'b': 'success'}
+
+def test_failure_without_outbox_is_final(queues):
+    def broken(message):
+        raise OSError('down')
+    delivery = queues({'a': lambda m: True, 'b': broken}, outbox=False)
+    delivery.submit('hello', delivery_id='x')
+    assert wait_for(lambda: delivery.get_status('x')['status'] == 'partial_success')
+    assert delivery.get_status('x')['details'] == {'a': 'success', 'b': 'failed'}
+
+def test_full_queue_drops_without_outbox(queues):
+    release = threading.Event()
+    delivery = queues({'a': lambda m: release.wait(2) or True}, outbox=False, queue_size=1, workers=1)
+    delivery.submit('busy', delivery_id='busy')
+    assert wait_for(lambda: delivery.depth()['a'] == 0)
+    delivery.submit('queued', delivery_id='queued')
+    assert delivery.submit('extra', delivery_id='extra')['details'] == {'a': 'dropped'}
+    release.set()
+
+def test_failed_delivery_is_retried(queues):
+    attempts = []
+    delivery = queues({'a': lambda m: attempts.append(m) or len(attempts) >= 3}, poll_interval=0.02)
+    delivery.submit('hello', delivery_id='x')
+    assert wait_for(lambda: delivery.get_status('x')['status'] == 'success')
+    assert len(attempts) == 3
+    assert wait_for(lambda: delivery.outbox.get('x') == {'a': 'done'})
+
+def test_dead_letter_after_max_retries(queues):
+    delivery = queues({'a': lambda m: False}, poll_interval=0.02)
+    delivery.outbox.max_retries = 3
+    delivery.submit('hello', delivery_id='x')
+    assert wait_for(lambda: delivery.get_status('x')['details'] == {'a': 'dead'})
+    assert delivery.get_status('x')['status'] == 'partial_success'
+    assert wait_for(lambda: delivery.outbox.get('x') == {'a': 'dead'})
+
+def test_circuit_open_defers_without_counting_attempt(queues):
+    def open_circuit(message):
+        raise CircuitOpenError('a', 3600)
+    delivery = queues({'a': open_circuit})
+    delivery.submit('hello', delivery_id='x')
+    assert wait_for(lambda: delivery.outbox.get('x') == {'a': 'retry'})
+    with delivery.outbox.read_lock:
+        attempts, = delivery.outbox.read_conn.execute('SELECT attempts FROM outbox').fetchone()
+    assert attempts == 0
+    assert delivery.get_status('x')['details'] == {'a': 'retrying'}
+
+def test_evicted_status_is_read_from_outbox(queues):
+    delivery = queues({'a': lambda m: True}, max_records=1)
+    delivery.submit('one', delivery_id='x')
+    delivery.submit('two', delivery_id='y')
+    assert wait_for(lambda: delivery.get_status('x')['status'] == 'success')
+    assert delivery.get_status('x')['created'] is None
+    assert delivery.get_status('unknown') is None
@@ -0,0 +1,63 @@
+import logging
+import time
+
+import pytest
+
+from channels import EmailChannel
+from delivery import DeliveryQueue
+from mailer import EmailDigest
+from outbox import Outbox
+
+logger = logging.getLogger('test')
+
+class FakePool:
+    timeout = 1.0
+
+    def __init__(self):
+        self.fail = False
+        self.sent = []
+
+    def send(self, subject, body):
+        if self.fail:
+            raise OSError('smtp down')
+        self.sent.append(body)
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def setup(tmp_path):
+    pool = FakePool()
+    channel = EmailChannel('email', pool, logger, EmailDigest(pool, logger, window=3600, max_messages=100))
+    outbox = Outbox(str(tmp_path / 'outbox.db'), logger, backoff_base=3600, purge_interval=0)
+    delivery = DeliveryQueue({'email': channel.deliver}, logger, outbox=outbox, poll_interval=3600)
+    yield pool, channel, outbox, delivery
+    delivery.stop(1)
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+def test_buffered_message_stays_pending_until_sent(setup):
+    pool, channel, outbox, delivery = setup
+    delivery.submit('hello', delivery_id='a')
+    assert wait_for(lambda: len(channel.digest.buffer) == 1)
+    assert outbox.get('a') == {'email': 'pending'}
+    assert delivery.get_status('a')['status'] == 'pending'
+
+    channel.flush()
+    assert pool.sent and 'hello' in pool.sent[0]
+    assert wait_for(lambda: outbox.get('a') == {'email': 'done'})
+    assert channel.breaker.snapshot()['calls'] == 1
+
+def test_failed_digest_is_retried(setup):
+    pool, channel, outbox, delivery = setup
+    pool.fail = True
+    delivery.submit('hello', delivery_id='a')
+    assert wait_for(lambda: len(channel.digest.buffer) == 1)
+    channel.flush()
+    assert wait_for(lambda: outbox.get('a') == {'email': 'retry'})
+    assert delivery.get_status('a')['details'] == {'email': 'retrying'}
+    assert channel.breaker.snapshot()['failures'] == 1
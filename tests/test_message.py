@@ -0,0 +1,19 @@
+import json
+
+from conftest import API_KEY
+from message import MessageRecord
+from store import get_store
+
+LONE_SURROGATE = '{"message": "bad \\ud800 text"}'
+
+def test_lone_surrogate_round_trips():
+    record = MessageRecord('bad \ud800 text', 'src')
+    assert json.loads(record.line())['payload'] == 'bad \ud800 text'
+    assert record.payload_json.encode('utf-8') == record.payload_bytes
+
+def test_webhook_accepts_lone_surrogate(make_app):
+    _, client = make_app({'outbox': {'enabled': 'true'}})
+    response = client.post(f'/webhook?api_key={API_KEY}', data=LONE_SURROGATE,
+                           content_type='application/json')
+    assert response.status_code in (200, 202), response.json
+    assert get_store().last(1)[0]['payload'] == 'bad \ud800 text'
@@ -0,0 +1,51 @@
+import logging
+import sqlite3
+import time
+
+import pytest
+
+from outbox import Outbox, _Waiter
+
+INSERT = ('INSERT INTO outbox (delivery_id, channel, message, status, next_attempt, created) '
+          'VALUES (?, ?, ?, ?, ?, ?)')
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = Outbox(str(tmp_path / 'outbox.db'), logging.getLogger('test'), purge_interval=0)
+    yield box
+    box.close()
+
+def rows(outbox):
+    with outbox.read_lock:
+        return outbox.read_conn.execute('SELECT delivery_id, channel, status FROM outbox').fetchall()
+
+def test_add_raises_when_write_fails(outbox):
+    # 无法编码为UTF-8的字符串在绑定参数时失败
+    with pytest.raises(UnicodeEncodeError):
+        outbox.add('a', ['onebot'], None, encoded='\ud800')
+    assert rows(outbox) == []
+
+def test_failed_write_does_not_roll_back_group(outbox):
+    now = time.time()
+    good, bad = _Waiter(), _Waiter()
+    outbox._commit([
+        (INSERT, [('a', 'onebot', '"x"', 'pending', now, now)], good),
+        (INSERT, [('b', None, '"y"', 'pending', now, now)], bad),
+        (INSERT, [('c', 'email', '"z"', 'pending', now, now)], None)
+    ])
+    assert good.error is None and isinstance(bad.error, sqlite3.IntegrityError)
+    assert sorted(r[0] for r in rows(outbox)) == ['a', 'c']
+
+def test_purge_expired(outbox):
+    outbox.add('done', ['onebot'], 'x')
+    outbox.add('dead', ['onebot'], 'x')
+    outbox.add('fresh', ['onebot'], 'x')
+    outbox.mark_done('done', 'onebot')
+    outbox.mark_failed('dead', 'onebot', outbox.max_retries)
+    outbox.mark_done('fresh', 'onebot')
+    outbox.add('pending', ['onebot'], 'x')
+    old = time.time() - 30 * 86400
+    outbox._execute('UPDATE outbox SET next_attempt = ? WHERE delivery_id IN (?, ?, ?)',
+                    [(old, 'done', 'dead', 'pending')], wait=True)
+    outbox._purge_expired()
+    assert sorted(r[0] for r in rows(outbox)) == ['fresh', 'pending']
@@ -0,0 +1,14 @@
+from conftest import API_KEY
+
+def count_accepted(client, n):
+    url = f'/webhook?api_key={API_KEY}&message=hi'
+    return sum(client.get(url).status_code == 202 for _ in range(n))
+
+def test_key_burst(make_app):
+    _, client = make_app({'ratelimit': {'enabled': 'true', 'per_key_rate': '0.001', 'per_key_burst': '10'}})
+    assert count_accepted(client, 15) == 10
+
+def test_key_burst_is_split_across_workers(make_app):
+    _, client = make_app({'ratelimit': {'enabled': 'true', 'per_key_rate': '0.001', 'per_key_burst': '10'}},
+                         workers=2)
+    assert count_accepted(client, 15) == 5
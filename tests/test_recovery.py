@@ -0,0 +1,24 @@
+import server
+from outbox import Outbox
+
+def test_worker_does_not_recover_outbox(make_app):
+    # 其他工作进程正在投递的记录（queued）不能被重启的工作进程放回重试队列
+    app, _ = make_app({'outbox': {'enabled': 'true'}}, workers=2, recover_outbox=False)
+    app.delivery.outbox.add('busy', ['onebot'], 'x', status='queued')
+
+    respawned, _ = make_app({'outbox': {'enabled': 'true'}}, workers=2, recover_outbox=False)
+    assert respawned.delivery.outbox.get('busy') == {'onebot': 'queued'}
+
+def test_recover_outbox(make_app, tmp_path):
+    make_app({'outbox': {'enabled': 'true'}})
+    path = str(tmp_path / 'logs' / 'outbox.db')
+    outbox = Outbox(path, server.setup_logger(), purge_interval=0)
+    outbox.add('a', ['onebot'], 'x', status='queued')
+    outbox.close()
+
+    server.recover_outbox()
+    outbox = Outbox(path, server.setup_logger(), purge_interval=0)
+    try:
+        assert outbox.get('a') == {'onebot': 'retry'}
+    finally:
+        outbox.close()
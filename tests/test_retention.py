@@ -0,0 +1,33 @@
+import logging
+from datetime import date, datetime, timedelta
+
+from retention import RetentionManager
+from store import MessageStore
+
+logger = logging.getLogger('test')
+
+def fill_days(store, days, size):
+    payload = 'x' * size
+    for offset in range(days, 0, -1):
+        day = date.today() - timedelta(days=offset)
+        ts = datetime.combine(day, datetime.min.time()).timestamp() + 3600
+        store.append(payload, 'test', ts=ts)
+    return store
+
+def test_total_size_includes_databases(tmp_path):
+    store = fill_days(MessageStore(str(tmp_path / 'messages')), 5, 100 * 1024)
+    (tmp_path / 'dedup.db').write_bytes(b'\0' * 200 * 1024)
+    manager = RetentionManager(str(tmp_path), store, logger, max_age_days=0, max_total_bytes=450 * 1024,
+                               compress_after_days=30)
+    stats = manager.run_once()
+    # 5天约500 KB加200 KB数据库，上限450 KB：只能保留2天
+    assert stats['deleted_days'] == 3
+    assert len(store.days()) == 2
+
+def test_databases_over_limit_skip_size_cleanup(tmp_path):
+    store = fill_days(MessageStore(str(tmp_path / 'messages')), 3, 10 * 1024)
+    (tmp_path / 'dedup.db').write_bytes(b'\0' * 200 * 1024)
+    manager = RetentionManager(str(tmp_path), store, logger, max_age_days=0, max_total_bytes=100 * 1024,
+                               compress_after_days=30)
+    assert manager.run_once()['deleted_days'] == 0
+    assert len(store.days()) == 3
@@ -0,0 +1,32 @@
+import logging
+
+import pytest
+
+from search import SearchIndex
+
+def record(msg_id, ts, payload='message text'):
+    return {'id': msg_id, 'ts': ts, 'text_from': 'src', 'payload': payload}
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search.db'), logging.getLogger('test'))
+    yield index
+    index.close()
+
+def ids(index, **kwargs):
+    results, _ = index.search(**kwargs)
+    return sorted(r['id'] for r in results)
+
+def test_time_range_with_out_of_order_writes(index):
+    # 两个工作进程交错写入，rowid顺序与时间顺序不一致
+    index._insert(index.write_conn, [record('a', 100.0), record('c', 300.0), record('b', 200.0),
+                                     record('d', 400.0), record('e', 150.0)])
+    assert ids(index, since=150.0, until=300.0) == ['b', 'e']
+    assert ids(index, since=150.0) == ['b', 'c', 'd', 'e']
+    assert ids(index, until=200.0) == ['a', 'e']
+    assert ids(index, query='message', since=150.0, until=300.0) == ['b', 'e']
+
+def test_failed_row_does_not_drop_batch(index):
+    # 无法编码为UTF-8的文本在绑定参数时失败
+    index._insert(index.write_conn, [record('a', 1.0), record('bad', 2.0, '\ud800'), record('c', 3.0)])
+    assert ids(index) == ['a', 'c']
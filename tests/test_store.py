@@ -0,0 +1,121 @@
+import sys
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from store import MessageStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = MessageStore(str(tmp_path / 'messages'))
+    yield store
+    store.close()
+
+def all_records(store):
+    return [r for day in store.days() for r in store.read_day(day)]
+
+def test_out_of_order_ts_keeps_index_sorted(store):
+    base = datetime(2024, 5, 1, 12).timestamp()
+    store.append('a', 'test', ts=base + 10)
+    record = store.append('b', 'test', ts=base + 5)
+    assert record['ts'] == base + 10
+    assert [r['ts'] for r in all_records(store)] == [base + 10, base + 10]
+    assert [r['payload'] for r in store.range(base + 10, base + 11)] == ['a', 'b']
+
+def test_batch_across_midnight_is_split_by_day(store):
+    midnight = datetime(2024, 5, 2).timestamp()
+    store.append_records([store.make_record(text, 'test', ts=ts)
+                          for text, ts in (('late', midnight - 1), ('early', midnight + 1))])
+    assert [d.isoformat() for d in store.days()] == ['2024-05-01', '2024-05-02']
+    assert [r['payload'] for r in store.read_day(store.days()[1])] == ['early']
+
+def test_concurrent_appends_range_and_before_are_exact(store):
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        def worker(n):
+            for i in range(200):
+                store.append(f'{n}-{i}', 'test')
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    records = all_records(store)
+    assert len(records) == 1600
+    timestamps = [r['ts'] for r in records]
+    assert timestamps == sorted(timestamps)
+    for i in range(0, 1600, 97):
+        start, end = timestamps[i], timestamps[min(i + 300, 1599)]
+        expected = [r['id'] for r in records if start <= r['ts'] < end]
+        assert [r['id'] for r in store.range(start, end)] == expected
+        expected = [r['id'] for r in records if r['ts'] < end][-50:]
+        assert [r['id'] for r in store.before(end, 50)] == expected
+
+def test_last_crosses_days(store):
+    for day in (1, 2, 3):
+        for i in range(3):
+            store.append(f'{day}-{i}', 'test', ts=datetime(2024, 5, day, 12, i).timestamp())
+    assert [r['payload'] for r in store.last(4)] == ['2-2', '3-0', '3-1', '3-2']
+
+def fill_day(store, day, count=300):
+    base = datetime.combine(day, datetime.min.time()).timestamp() + 3600
+    store.append_records([store.make_record({'n': i, 'text': f'message {i} ' + 'x' * (i % 50)}, 'test',
+                                            ts=base + i) for i in range(count)])
+    return base
+
+@pytest.fixture
+def archived(store):
+    day = date.today() - timedelta(days=3)
+    base = fill_day(store, day)
+    expected = store.read_day(day)
+    store.close()
+    raw_size, archived_size = store.compress_day(day, block_size=1024)
+    assert raw_size > 10 * 1024 and archived_size < raw_size
+    assert store.is_archived(day)
+    return day, base, expected
+
+def test_compressed_day_reads_match(store, archived):
+    day, base, expected = archived
+    assert len(expected) == 300
+    assert store.read_day(day) == expected
+    assert list(store.iter_day(day, chunk=7)) == expected
+    # 跨越多个压缩块的下标范围
+    assert store.read_day(day, 13, 251) == expected[13:251]
+    assert store.range(base + 40.5, base + 260) == expected[41:260]
+    assert store.before(base + 100, 30) == expected[70:100]
+
+def test_append_to_archived_day_goes_to_today(store, archived):
+    day, base, expected = archived
+    record = store.append('late', 'test', ts=base + 1000)
+    assert datetime.fromtimestamp(record['ts']).date() == date.today()
+    assert store.read_day(day) == expected
+    assert store.read_day(date.today())[-1]['payload'] == 'late'
+
+def test_index_entries_locate_each_record(store, tmp_path):
+    day = date(2024, 5, 1)
+    base = fill_day(store, day, count=50)
+    assert store.count(day) == 50
+    assert [r['payload']['n'] for r in store.read_day(day, 10, 15)] == [10, 11, 12, 13, 14]
+    assert store.read_day(day, 60) == []
+    # 新的实例（例如重启后）只依赖磁盘上的索引
+    reopened = MessageStore(str(tmp_path / 'messages'))
+    assert reopened.read_day(day) == store.read_day(day)
+    assert [r['payload']['n'] for r in reopened.last(3, day)] == [47, 48, 49]
+    assert reopened._bisect(day, base + 20) == 20
+    assert reopened._bisect(day, base + 20.5) == 21
+
+def test_range_spans_days(store):
+    for day in (1, 2, 3):
+        store.append(f'day {day}', 'test', ts=datetime(2024, 5, day, 12).timestamp())
+    result = store.range(datetime(2024, 5, 1, 13).timestamp(), datetime(2024, 5, 3, 12).timestamp())
+    assert [r['payload'] for r in result] == ['day 2']
+
+def test_dict_records_are_stored(store):
+    ts = datetime(2024, 5, 1, 12).timestamp()
+    store.append_records([{'id': 'a', 'ts': ts, 'text_from': 'test', 'payload': {'k': 'v'}}])
+    assert store.read_day(date(2024, 5, 1)) == [{'id': 'a', 'ts': ts, 'text_from': 'test', 'payload': {'k': 'v'}}]
@@ -0,0 +1,111 @@
+import json
+import logging
+import socket
+import time
+
+import pytest
+
+from message import MessageRecord
+from stream import StreamHub, encode_event
+
+class EmptyStore:
+    def range(self, since, until):
+        return []
+
+@pytest.fixture
+def hub():
+    hub = StreamHub(EmptyStore(), logging.getLogger('test'), lambda key: 'ok' if key == 'k' else None,
+                    handshake_timeout=0.3, max_pending=2).start('127.0.0.1', 0)
+    yield hub
+    hub.stop()
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return predicate()
+
+def test_idle_handshake_is_closed(hub):
+    sock = socket.create_connection(('127.0.0.1', hub.port))
+    assert wait_for(lambda: len(hub.handshakes) == 1)
+    # 不发送请求，超时后服务端关闭连接
+    sock.settimeout(3)
+    assert sock.recv(1) == b''
+    assert not hub.handshakes
+    sock.close()
+
+def test_pending_handshakes_are_capped(hub):
+    socks = [socket.create_connection(('127.0.0.1', hub.port)) for _ in range(2)]
+    assert wait_for(lambda: len(hub.handshakes) == 2)
+    extra = socket.create_connection(('127.0.0.1', hub.port))
+    extra.settimeout(3)
+    assert extra.recv(1) == b''
+    assert len(hub.handshakes) <= 2
+    for sock in socks + [extra]:
+        sock.close()
+
+class OneRecordStore:
+    def __init__(self, record):
+        self.record = record
+
+    def range(self, since, until):
+        return [self.record]
+
+def event_data(event):
+    line = next(l for l in event.split(b'\n') if l.startswith(b'data: '))
+    return json.loads(line[len(b'data: '):])
+
+def test_replay_sends_same_message_as_live():
+    record = MessageRecord(json.dumps('quoted text'), 'src', msg_id='b', ts=200.0)
+    live = event_data(encode_event(record, record.display))
+    hub = StreamHub(OneRecordStore(record.to_dict()), logging.getLogger('test'), lambda key: 'ok').start('127.0.0.1', 0)
+    try:
+        sock = socket.create_connection(('127.0.0.1', hub.port))
+        sock.sendall(b'GET /stream?api_key=k HTTP/1.1\r\nLast-Event-ID: 100.0-a\r\n\r\n')
+        sock.settimeout(3)
+        received = b''
+        while b'event: message' not in received or not received.endswith(b'\n\n'):
+            received += sock.recv(4096)
+        sock.close()
+    finally:
+        hub.stop()
+    replayed = event_data(received[received.index(b'id: '):])
+    assert replayed == live
+    assert replayed['message'] == 'quoted text'
+
+class RacingSocket:
+    """唤醒socket的包装：第一次recv之前先执行一次回调，模拟恰好在这时到达的publish"""
+
+    def __init__(self, sock, callback):
+        self.sock = sock
+        self.callback = callback
+
+    def recv(self, size):
+        callback, self.callback = self.callback, None
+        if callback is not None:
+            callback()
+        return self.sock.recv(size)
+
+def publish(hub, msg_id):
+    hub.publish({'id': msg_id, 'ts': time.time(), 'text_from': 'src', 'payload': msg_id}, msg_id)
+
+def receive(sock, msg_id):
+    received = b''
+    while f'"id": "{msg_id}"'.encode() not in received:
+        received += sock.recv(65536)
+
+def test_publish_during_wakeup_drain_still_wakes_loop(hub):
+    sock = socket.create_connection(('127.0.0.1', hub.port))
+    sock.sendall(b'GET /stream?api_key=k HTTP/1.1\r\n\r\n')
+    assert wait_for(lambda: len(hub) == 1)
+    sock.settimeout(3)
+
+    hub.wake_r = RacingSocket(hub.wake_r, lambda: publish(hub, 'racing'))
+    publish(hub, 'first')
+    receive(sock, 'racing')
+    # 之后的publish应立即唤醒事件循环，而不是等到select超时
+    start = time.monotonic()
+    publish(hub, 'probe')
+    receive(sock, 'probe')
+    assert time.monotonic() - start < 0.5
+    sock.close()
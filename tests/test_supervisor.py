@@ -0,0 +1,28 @@
+import logging
+import signal
+import time
+
+import pytest
+
+import config
+from supervisor import Supervisor
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGHUP'), reason='平台不支持SIGHUP')
+def test_reload_signal_does_not_take_config_lock(make_app):
+    make_app()
+    previous = signal.getsignal(signal.SIGHUP)
+    supervisor = Supervisor(None, logging.getLogger('test'))
+    supervisor.install_signals(handle_stop=False)
+    before = config.get_config()
+    try:
+        # 主线程持有配置锁时收到SIGHUP：处理函数必须立即返回，由后台线程重新加载
+        with config._lock:
+            supervisor._on_reload(signal.SIGHUP, None)
+        deadline = time.monotonic() + 3
+        while config.get_config() is before and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert config.get_config() is not before
+    finally:
+        supervisor.shutdown.set()
+        supervisor.reload_thread.join(3)
+        signal.signal(signal.SIGHUP, previous)
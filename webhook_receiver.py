@@ -1,18 +1,20 @@
 import argparse
 from logger import setup_logger
 from gui import WebhookGUI
-from server import run_server
-from config import load_config, ensure_logs_directory
-import threading
+from server import make_service
+from supervisor import Supervisor
+from config import get_config, ensure_logs_directory
 
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser()
     parser.add_argument('--no-gui', action='store_true', help='以无GUI模式运行')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数（默认读取[server] workers）')
     args = parser.parse_args()
 
-    # 初始化配置
-    config = load_config()
+    # 初始化配置（之后各模块共享缓存的配置）
+    config = get_config()
+    workers = args.workers or config.parser.getint('server', 'workers', fallback=1)
     
     # 确保日志目录存在
     ensure_logs_directory()
@@ -24,19 +26,21 @@ def main():
     gui = WebhookGUI(logger) if not args.no_gui else None
     
     # 启动Webhook服务器
-    server_thread = threading.Thread(target=run_server, args=(gui,), daemon=True)
-    server_thread.start()
+    service = make_service(gui, workers)
+    supervisor = Supervisor(service, logger,
+                            drain_timeout=config.parser.getint('server', 'drain_timeout', fallback=10))
+    supervisor.install_signals(handle_stop=not gui)
+    supervisor.start()
     
     # 如果有GUI则运行主循环
     if gui:
         gui.run()
     else:
         logger.info("以无GUI模式运行，按Ctrl+C退出")
-        try:
-            while True:
-                pass
-        except KeyboardInterrupt:
-            logger.info("正在关闭服务器...")
+        supervisor.wait()
+
+    # 停止接受请求并等待投递队列排空
+    supervisor.stop()
 
 if __name__ == '__main__':
     main()